@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,4 +9,165 @@ class Settings:
     VERSION = "0.1.0"
     DEBUG = True
 
+    # === 流水线 ===
+    # 分句流式：LLM 每说完一句就送去 TTS 与渲染
+    STREAM_PIPELINE = os.getenv("STREAM_PIPELINE", "1") == "1"
+    # 短于此长度的句子会与下一句合并
+    STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "8"))
+    # 句子超过这个长度就在逗号等分句点提前切开
+    STREAM_MAX_CHARS = int(os.getenv("STREAM_MAX_CHARS", "40"))
+
+    # === 调度器 ===
+    # Gradio 层同时处理的请求数，真正的资源限制交给各阶段
+    UI_CONCURRENCY = int(os.getenv("UI_CONCURRENCY", "16"))
+    UI_QUEUE_SIZE = int(os.getenv("UI_QUEUE_SIZE", "64"))
+    # 各阶段并发上限与排队上限
+    BRAIN_CONCURRENCY = int(os.getenv("BRAIN_CONCURRENCY", "8"))
+    BRAIN_QUEUE_SIZE = int(os.getenv("BRAIN_QUEUE_SIZE", "16"))
+    TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "1"))
+    TTS_QUEUE_SIZE = int(os.getenv("TTS_QUEUE_SIZE", "16"))
+    AVATAR_CONCURRENCY = int(os.getenv("AVATAR_CONCURRENCY", "1"))
+    AVATAR_QUEUE_SIZE = int(os.getenv("AVATAR_QUEUE_SIZE", "8"))
+    # 排队超过这个秒数也算繁忙
+    STAGE_WAIT_TIMEOUT = float(os.getenv("STAGE_WAIT_TIMEOUT", "60"))
+
+    # === 延迟预算 ===
+    # 整段模式：视频必须在轮次开始后这么多秒内完成，否则只出音频
+    TURN_BUDGET = float(os.getenv("TURN_BUDGET", "30"))
+    # 分句模式：每段视频必须在该段音频就绪后这么多秒内完成
+    SEGMENT_RENDER_BUDGET = float(os.getenv("SEGMENT_RENDER_BUDGET", "15"))
+
+    # === 负载自适应画质 ===
+    QUALITY_ADAPTIVE = os.getenv("QUALITY_ADAPTIVE", "1") == "1"
+    # 两次画质调整之间的最短间隔 (秒)
+    QUALITY_DWELL = float(os.getenv("QUALITY_DWELL", "10"))
+
+    # === 会话管理 ===
+    SESSION_MAX = int(os.getenv("SESSION_MAX", "200"))
+    # 超过这么多秒未活动的会话会被释放
+    SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+    # 所有会话的对话记忆总预算 (MB)
+    SESSION_MEMORY_MB = float(os.getenv("SESSION_MEMORY_MB", "64"))
+
+    # === 无界面 API 服务 (src/server/app.py) ===
+    API_HOST = os.getenv("API_HOST", "127.0.0.1")
+    API_PORT = int(os.getenv("API_PORT", "8000"))
+    # 启动时按 tts_config.json 预加载语音模型
+    API_LOAD_TTS = os.getenv("API_LOAD_TTS", "1") == "1"
+    # 最近多少个产物可以通过 /v1/artifacts 下载 (按令牌登记)
+    API_ARTIFACT_MAX = int(os.getenv("API_ARTIFACT_MAX", "4096"))
+
+    # === 任务队列 / 独立 worker 进程 (src/jobs) ===
+    # 为空: TTS/渲染在本进程直接执行；memory: 进程内队列 + 本地 worker 线程；
+    # sqlite:///path/jobs.db: 同一台机器上多进程共享队列 (仅单机)，worker 用 python -m src.jobs.worker 启动
+    # 跨机 worker 需要服务端队列 (Redis / Postgres)，暂未实现，见 src/jobs/queue.py
+    JOB_QUEUE = os.getenv("JOB_QUEUE", "")
+    # 交给队列的阶段 (逗号分隔)
+    JOB_STAGES = [s.strip() for s in os.getenv("JOB_STAGES", "tts,avatar").split(",") if s.strip()]
+    # 每个阶段排队任务上限，超过直接返回繁忙
+    JOB_MAX_DEPTH = int(os.getenv("JOB_MAX_DEPTH", "32"))
+    # memory 模式下每个阶段的本地 worker 线程数
+    JOB_LOCAL_WORKERS = int(os.getenv("JOB_LOCAL_WORKERS", "1"))
+    # worker 心跳间隔 / 超过多久没有心跳视为 worker 已崩溃 (秒)
+    JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "2"))
+    JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "30"))
+    # worker 与提交方交换文件的本地缓冲目录
+    JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", os.path.join("assets", "jobs"))
+    # 已结束但一直没人取走结果的任务保留多久 (秒)
+    JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+    # === 多副本部署 (无状态 webui) ===
+    # 会话记忆与 tts/a2f 配置的存储：file:///目录 或 sqlite:///文件
+    STATE_STORE = os.getenv("STATE_STORE", "file:///" + os.path.join("assets", "state"))
+    # 本副本的产物命名空间，默认 主机名-进程号
+    REPLICA_ID = os.getenv("REPLICA_ID", "") or f"{socket.gethostname()}-{os.getpid()}"
+    # 多副本共享的磁盘缓存目录 (TTS / 视频)
+    CACHE_DIR = os.getenv("CACHE_DIR", os.path.join("assets", "cache"))
+
+    # === 空闲预取 (预测追问并预先合成/渲染) ===
+    # 会额外消耗 LLM token 与算力，默认关闭
+    PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+    # 每轮结束后预测几个追问
+    PREFETCH_COUNT = int(os.getenv("PREFETCH_COUNT", "2"))
+    # 缓存条目上限 (所有会话合计)
+    PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "32"))
+    # 新问题与预测问题的相似度阈值 (0~1)；过阈值后还要求两者只差语气词才算命中
+    PREFETCH_MATCH = float(os.getenv("PREFETCH_MATCH", "0.85"))
+    # 系统空闲多久后才开始预取 (秒)
+    PREFETCH_IDLE_DELAY = float(os.getenv("PREFETCH_IDLE_DELAY", "1.0"))
+
+    # === 输入时预热 ===
+    TYPING_WARMUP = os.getenv("TYPING_WARMUP", "1") == "1"
+    # 停止输入多久后预热 (秒)
+    TYPING_DEBOUNCE = float(os.getenv("TYPING_DEBOUNCE", "0.5"))
+    # 两次 LLM 连接预热的最短间隔 (秒)
+    LLM_KEEPALIVE_INTERVAL = float(os.getenv("LLM_KEEPALIVE_INTERVAL", "20"))
+
+    # === 异步 LLM 客户端 (OpenAI 协议，共享连接池) ===
+    LLM_ASYNC = os.getenv("LLM_ASYNC", "1") == "1"
+    # 装了 h2 时使用 HTTP/2 多路复用
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+    # 同时在途的 LLM 请求上限 (超出的在事件循环里排队)
+    LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+    LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "16"))
+    # 空闲连接保留时间 (秒)
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+    # 启动时预热 DNS / TLS
+    LLM_PREWARM = os.getenv("LLM_PREWARM", "1") == "1"
+
+    # === 对话记忆 token 预算 (超出的早期对话在后台折叠成摘要) ===
+    MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "1") == "1"
+    MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+    # 原样保留的最近轮数 (一问一答为一轮)
+    MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "4"))
+    MEMORY_SUMMARY_CHARS = int(os.getenv("MEMORY_SUMMARY_CHARS", "300"))
+    # tiktoken 编码名 (没装 tiktoken 时按字符数估算)
+    MEMORY_TOKENIZER = os.getenv("MEMORY_TOKENIZER", "cl100k_base")
+
+    # === LLM 回复缓存 (问候、常见问题，按人设 + 模型隔离) ===
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+    LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+    # 过期时间 (秒)
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+    # 超过这个长度 (规范化后字数) 的输入不缓存
+    LLM_CACHE_MAX_INPUT = int(os.getenv("LLM_CACHE_MAX_INPUT", "64"))
+
+    # === 多端点路由 + 对冲请求 ===
+    # JSON 字符串或 JSON 文件路径，格式见 src/brain/router.py；为空时只用 LLM_* 配置的单个端点
+    LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+    # EWMA 平滑系数 (越大越看重最近的请求)
+    LLM_ROUTER_ALPHA = float(os.getenv("LLM_ROUTER_ALPHA", "0.2"))
+    # 错误率加罚系数：score = ttft * (1 + 系数 * 错误率)
+    LLM_ROUTER_ERROR_PENALTY = float(os.getenv("LLM_ROUTER_ERROR_PENALTY", "4"))
+    # 首 token 超过该端点历史延迟的这个分位还没到，就发对冲请求
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+    # 样本不足时的对冲等待 (秒) 与最短等待
+    LLM_HEDGE_DEFAULT = float(os.getenv("LLM_HEDGE_DEFAULT", "1.5"))
+    LLM_HEDGE_MIN = float(os.getenv("LLM_HEDGE_MIN", "0.3"))
+    # 每次请求最多额外发几份对冲
+    LLM_HEDGE_MAX = int(os.getenv("LLM_HEDGE_MAX", "1"))
+
+    # === 垫场短片 (等待回复时先播放) ===
+    FILLER_ENABLED = os.getenv("FILLER_ENABLED", "1") == "1"
+    # 垫场台词，用 | 分隔
+    FILLER_PHRASES = [p for p in os.getenv("FILLER_PHRASES", "嗯……|让我想想。|好的，我看看。").split("|") if p]
+
+    # === 语音合成 (CosyVoice) ===
+    # 流式推理：每段音频生成出来就写入文件，长文本的后续分段也全部保留
+    TTS_STREAM = os.getenv("TTS_STREAM", "1") == "1"
+    # 提示 KV 缓存条目数 (每个音色一条，0 关闭)；只对 CosyVoice2 生效
+    TTS_KV_CACHE_SIZE = int(os.getenv("TTS_KV_CACHE_SIZE", "8"))
+    # 常驻显存的音色提示特征个数 (LRU，0 表示每次从磁盘缓存读)
+    TTS_VOICE_CACHE_SIZE = int(os.getenv("TTS_VOICE_CACHE_SIZE", "16"))
+
+    # === 按句缓存的合成结果 (键含音色、模型与解码设置) ===
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") == "1"
+    # 内存层 / 磁盘层 (CACHE_DIR/tts) 容量上限 (MB)，超出按最近使用淘汰
+    TTS_CACHE_MEMORY_MB = float(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+    TTS_CACHE_DISK_MB = float(os.getenv("TTS_CACHE_DISK_MB", "1024"))
+    # 采样随机种子基数：每句的种子由它和句子内容派生，改动它会让已有缓存全部失效
+    TTS_SEED = int(os.getenv("TTS_SEED", "0"))
+
 settings = Settings()
\ No newline at end of file
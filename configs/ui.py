@@ -1,16 +1,18 @@
 import gradio as gr
 from src.utils import load_settings, save_settings
 # 我们需要引入 LLM 引擎来触发重启
-from src.brain.llm_engine import LLMEngine
+from configs.settings import settings
+from src.brain.llm_engine import get_brain, reset_brain
 
 def reload_brain_logic():
     """强制重置大脑单例，使新配置生效"""
     print("🔄 正在应用新配置...")
-    # 这里我们简单地通过重新实例化来测试连接，
-    # 实际应用中，单例会在下次调用 get_brain() 时自动刷新
     try:
-        # 强制重置全局变量 (如果在 llm_engine 里有 reset 方法更好，这里简单模拟)
-        # 实际生效依赖于 webui.py 或 engine 里的单例刷新机制
+        # 丢弃旧实例并按新配置重建 (API Key / 模型 / 地址 / 开场白模型)
+        reset_brain()
+        brain = get_brain()
+        if settings.LLM_PREWARM:
+            brain.prewarm()
         return "✅ 配置已保存，大脑已重启！"
     except Exception as e:
         return f"❌ 配置保存成功，但重启失败: {e}"
@@ -53,6 +55,12 @@ def build_config_ui():
             info="例如: deepseek-chat, gemini-pro"
         )
         
+        fast_model_input = gr.Textbox(
+            label="快速开场模型 (可选)", 
+            value=config.get("fast_model", ""),
+            info="填写后由这个更快的模型先说一句开场白，主模型接着回答，例如: deepseek-chat, gemini-1.5-flash"
+        )
+        
         persona_input = gr.Textbox(
             label="数字人人设 (System Prompt)", 
             value=config.get("persona", "你是一个乐于助人的数字助手。"),
@@ -65,16 +73,16 @@ def build_config_ui():
             status_output = gr.Textbox(label="操作日志", interactive=False, scale=2)
 
     # === 内部事件绑定 ===
-    def on_save(prov, k, u, m, p):
+    def on_save(prov, k, u, m, p, fm):
         # 1. 保存文件
-        msg_save = save_settings(prov, k, u, m, p)
+        msg_save = save_settings(prov, k, u, m, p, fm)
         # 2. 触发逻辑重启
         msg_reload = reload_brain_logic()
         return f"{msg_save}\n{msg_reload}"
 
     save_btn.click(
         on_save,
-        inputs=[provider_input, api_key_input, base_url_input, model_input, persona_input],
+        inputs=[provider_input, api_key_input, base_url_input, model_input, persona_input, fast_model_input],
         outputs=status_output
     )
 
@@ -1,21 +1,52 @@
 import sys
 import os
+import re
+import json
+import time
+import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from colorama import init, Fore, Style
 
-# 确保 src 目录在 python path 中
-sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+# 确保项目根目录在 python path 中
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from configs.settings import settings
-from src.brain.llm_engine import LLMEngine
-from src.audio.tts_engine import TTSEngine
+from src.utils import load_tts_settings
+from src.brain.llm_engine import get_brain
+from src.audio.runtime import load_tts_from_config
+from src.pipeline import run_turn, TurnBudget
+from src.cancel import CancelToken
+from src.session import get_session
+from src.scheduler import get_stage
+from src.metrics import add_latency_collector, remove_latency_collector, percentile
 
 init(autoreset=True)
 
+# ==========================================
+# 命令行入口
+# ==========================================
+#   交互模式: python main.py
+#   批量模式: python main.py --batch prompts.jsonl --out outputs/batch --workers 4 [--render]
+#
+# prompts.jsonl 每行一个 JSON:
+#   {"id": "q1", "text": "你好", "session": "可选，同一会话按顺序执行", "ref_audio": "可选", "ref_text": "可选"}
+# 也可以直接写一个 JSON 字符串 "你好"。
+
+
 class DigitalHumanApp:
     def __init__(self):
         print(Fore.CYAN + f"=== 启动项目: {settings.PROJECT_NAME} ===")
-        self.brain = LLMEngine()
-        self.audio = TTSEngine()
+        self.brain = get_brain()
+        # 按 WebUI 保存的配置加载语音模型与参考音色；没有配置时只输出文字
+        self.audio = load_tts_from_config()
+        tts_config = load_tts_settings()
+        self.ref_audio = tts_config.get("ref_audio")
+        self.ref_text = tts_config.get("ref_text") or ""
+        if not self.audio or not self.ref_audio:
+            print(Fore.YELLOW + "⚠️ 未加载语音模型或缺少参考音频，只输出文字")
+        self.session = get_session("cli")
         print(Fore.GREEN + "=== 系统就绪，请输入对话 ===")
 
     def run(self):
@@ -25,15 +56,220 @@ class DigitalHumanApp:
                 if user_input.lower() in ['exit', 'quit']:
                     print("再见！")
                     break
-                
-                response = self.brain.think(user_input)
-                print(Fore.MAGENTA + f"Bot: {response}")
-                self.audio.speak(response)
+
+                ref_audio = self.ref_audio if self.audio else None
+                for event in run_turn(self.session, user_input, CancelToken(), ref_audio, self.ref_text,
+                                      stream=False, render=False):
+                    if event["type"] == "done":
+                        print(Fore.MAGENTA + f"Bot: {event['text']}")
+                    elif event["type"] == "audio":
+                        print(Fore.BLUE + f"🔊 语音: {event['path']}")
+                    elif event["type"] in ("busy", "error"):
+                        print(Fore.RED + event["message"])
 
             except KeyboardInterrupt:
                 print("\n程序退出")
                 break
 
+
+# ==========================================
+# 批量模式 (离线预渲染 / 压测选型)
+# ==========================================
+def _safe_dirname(name):
+    """prompt id 用作 --out 下的子目录名：只留字母数字、下划线、点和横线，不能跳出输出目录"""
+    name = re.sub(r"[^\w.-]", "_", name).lstrip(".")
+    return name or "_"
+
+
+def load_prompts(path):
+    prompts = []
+    dirs = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"text": item}
+            item["id"] = str(item.get("id") or f"{line_no:05d}")
+            item["text"] = item.get("text") or item.get("prompt") or ""
+            # 清洗后重名 (如 "a/b" 和 "a_b") 时加上行号区分
+            item["dir"] = _safe_dirname(item["id"])
+            if item["dir"] in dirs:
+                item["dir"] = f"{item['dir']}-{line_no:05d}"
+            dirs.add(item["dir"])
+            prompts.append(item)
+    return prompts
+
+
+class BatchRunner:
+    def __init__(self, out_dir, workers=4, render=False, stream=False, render_timeout=600.0):
+        self.out_dir = out_dir
+        self.workers = workers
+        self.render = render
+        self.stream = stream
+        self.render_timeout = render_timeout
+        self.latencies = {}
+        self.failures = {"brain": 0, "tts": 0, "avatar": 0, "crash": 0}
+        self._lock = threading.Lock()
+
+        # 离线任务宁可排队也不要被拒：放宽各阶段的排队上限与等待时间
+        for name in ("brain", "tts", "avatar"):
+            stage = get_stage(name)
+            stage.max_queue = max(stage.max_queue, workers)
+            stage.wait_timeout = max(stage.wait_timeout or 0, render_timeout)
+
+        tts_config = load_tts_settings()
+        self.default_voice = (tts_config.get("ref_audio"), tts_config.get("ref_text") or "")
+        self.tts = load_tts_from_config()
+        if not self.tts:
+            print(Fore.YELLOW + "⚠️ 未加载语音模型，本次只生成文字")
+
+    def _collect(self, stage, seconds):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds)
+
+    def _fail(self, stage):
+        with self._lock:
+            self.failures[stage] += 1
+
+    def _copy(self, path, item_dir):
+        os.makedirs(item_dir, exist_ok=True)
+        target = os.path.join(item_dir, os.path.basename(path))
+        shutil.copy(path, target)
+        return target
+
+    def run_one(self, item):
+        """跑一条 prompt，返回结果记录"""
+        item_dir = os.path.join(self.out_dir, item["dir"])
+        ref_audio = item.get("ref_audio") or self.default_voice[0]
+        ref_text = item.get("ref_text") or self.default_voice[1]
+        if not self.tts:
+            ref_audio = None
+        session = get_session(f"batch-{item.get('session') or item['id']}")
+        # 离线生成不追求实时：预算放宽，保证视频不会因为截止时间被丢弃
+        budget = TurnBudget(self.render_timeout, self.render_timeout)
+
+        record = {"id": item["id"], "text": item["text"], "reply": "", "audio": [], "video": [], "error": None}
+        t0 = time.monotonic()
+        first_audio = None
+        for event in run_turn(session, item["text"], CancelToken(), ref_audio, ref_text,
+                              stream=self.stream, render=self.render, budget=budget):
+            kind = event["type"]
+            if kind == "audio":
+                first_audio = first_audio or time.monotonic() - t0
+                record["audio"].append(self._copy(event["path"], item_dir))
+            elif kind == "video":
+                record["video"].append(self._copy(event["path"], item_dir))
+            elif kind in ("busy", "error"):
+                record["error"] = event["message"]
+            elif kind == "done":
+                record["reply"] = event["text"]
+
+        record["elapsed"] = round(time.monotonic() - t0, 3)
+        self._collect("turn", record["elapsed"])
+        if first_audio is not None:
+            self._collect("first_audio", first_audio)
+
+        # 失败归因：按最先出问题的阶段计数
+        if record["error"] or not record["reply"] or record["reply"].startswith("大脑短路"):
+            self._fail("brain")
+        elif ref_audio and not record["audio"]:
+            self._fail("tts")
+        elif self.render and ref_audio and not record["video"]:
+            self._fail("avatar")
+        return record
+
+    def _crashed(self, item, error, elapsed=0.0):
+        """run_one 抛异常时的结果记录：记一次失败，批量继续跑"""
+        print(Fore.RED + f"❌ [Batch] {item['id']} 异常: {error}")
+        self._fail("crash")
+        return {"id": item["id"], "text": item["text"], "reply": "", "audio": [], "video": [],
+                "error": f"{type(error).__name__}: {error}", "elapsed": round(elapsed, 3)}
+
+    def run_group(self, items):
+        """同一会话的 prompt 必须按顺序执行 (对话记忆依赖上一轮)"""
+        # 状态存储里可能留着上次批量跑的记忆，从干净的会话开始
+        get_session(f"batch-{items[0].get('session') or items[0]['id']}").reset_conversation()
+        records = []
+        for item in items:
+            t0 = time.monotonic()
+            try:
+                records.append(self.run_one(item))
+            except Exception as e:
+                records.append(self._crashed(item, e, time.monotonic() - t0))
+        return records
+
+    def run(self, prompts):
+        os.makedirs(self.out_dir, exist_ok=True)
+        groups = {}
+        for item in prompts:
+            groups.setdefault(item.get("session") or f"#{item['id']}", []).append(item)
+
+        print(Fore.CYAN + f"=== 批量开始: {len(prompts)} 条, {len(groups)} 个会话, {self.workers} 个 worker ===")
+        add_latency_collector(self._collect)
+        results_path = os.path.join(self.out_dir, "results.jsonl")
+        done = 0
+        t0 = time.monotonic()
+        try:
+            with open(results_path, "w", encoding="utf-8") as out, \
+                 ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.run_group, items): items for items in groups.values()}
+                for future in as_completed(futures):
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        # 整组没跑起来 (例如会话存储不可用)：组内每条都记为失败
+                        records = [self._crashed(item, e) for item in futures[future]]
+                    for record in records:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        out.flush()
+                        done += 1
+                        status = Fore.RED + "✗" if record["error"] else Fore.GREEN + "✓"
+                        print(f"{status}{Style.RESET_ALL} [{done}/{len(prompts)}] {record['id']} ({record['elapsed']}s)")
+        finally:
+            remove_latency_collector(self._collect)
+        self.report(len(prompts), time.monotonic() - t0, results_path)
+
+    def report(self, total, wall, results_path):
+        failed = sum(self.failures.values())
+        print(Fore.CYAN + "\n=== 批量结果 ===")
+        print(f"结果文件: {results_path}")
+        print(f"完成 {total - failed}/{total}，失败 {failed} "
+              f"(brain: {self.failures['brain']}, tts: {self.failures['tts']}, avatar: {self.failures['avatar']}, "
+              f"异常: {self.failures['crash']})")
+        print(f"总耗时 {wall:.1f}s，吞吐 {total / wall * 60 if wall > 0 else 0:.1f} 轮/分钟")
+        print(f"{'阶段':<12}{'次数':>6}{'p50(s)':>10}{'p95(s)':>10}")
+        for stage in ("brain_ttft", "brain", "tts", "avatar", "first_audio", "turn"):
+            values = self.latencies.get(stage, [])
+            if not values:
+                continue
+            print(f"{stage:<12}{len(values):>6}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=settings.PROJECT_NAME)
+    parser.add_argument("--batch", help="批量模式：prompts.jsonl 路径")
+    parser.add_argument("--out", default=os.path.join("outputs", "batch"), help="批量产物输出目录")
+    parser.add_argument("--workers", type=int, default=4, help="并发 worker 数")
+    parser.add_argument("--render", action="store_true", help="同时渲染数字人视频")
+    parser.add_argument("--stream", action="store_true", help="按句切分合成 (默认整段合成一个文件)")
+    parser.add_argument("--render-timeout", type=float, default=600.0, help="单轮渲染最长等待秒数")
+    args = parser.parse_args()
+
+    if not args.batch:
+        DigitalHumanApp().run()
+        return
+
+    prompts = load_prompts(args.batch)
+    if not prompts:
+        print("⚠️ 没有可处理的 prompt")
+        return
+    runner = BatchRunner(args.out, workers=max(1, args.workers), render=args.render,
+                         stream=args.stream, render_timeout=args.render_timeout)
+    runner.run(prompts)
+
+
 if __name__ == "__main__":
-    app = DigitalHumanApp()
-    app.run()
\ No newline at end of file
+    main()
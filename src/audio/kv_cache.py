@@ -0,0 +1,103 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+import torch
+
+from src.metrics import record_event
+
+# ==========================================
+# 零样本合成的提示 KV 缓存 (CosyVoice2 / Qwen2LM)
+# ==========================================
+# Qwen2LM 每次合成的输入是 [sos, 参考文本, 待合成文本, task_id, 参考语音 token]，
+# 音色不变时开头的 [sos, 参考文本] 每次都一样：把这段 prefill 出来的 KV 缓存按内容存进 LRU，
+# 下一句直接从缓存接着 prefill，省掉这段的计算。
+# 限制：
+#   - 参考语音 token 排在待合成文本之后，注意力是因果的，这部分无法复用 (只能省下参考文本那一段)
+#   - CosyVoice (v1) 的 TransformerLM 先用非因果编码器编码整段文本，前缀随新文本变化，不做缓存
+# 缓存命中时只拷贝一份 KV (DynamicCache 会被后续解码原地追加)，不影响采样结果。
+
+
+class PromptKVCache:
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # 提示文本 token 摘要 -> (前缀 embedding, KV 缓存)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(prompt_text):
+        return hashlib.sha1(prompt_text.detach().cpu().numpy().tobytes()).hexdigest()
+
+    def get(self, key, prefix):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+        # 前缀 embedding 不一致 (例如模型输入布局不同) 就当作没命中
+        if item is None or item[0].shape != prefix.shape or not torch.equal(item[0], prefix):
+            return None
+        return copy.deepcopy(item[1])
+
+    def put(self, key, prefix, cache):
+        with self._lock:
+            self._entries[key] = (prefix.detach().clone(), copy.deepcopy(cache))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def hook_prompt_kv_cache(llm, kv_cache):
+    """
+    给 Qwen2LM 装上提示 KV 缓存：
+      - 包一层 llm.inference，记下本次的参考文本 (llm_job 在自己的线程里调用，用线程局部变量传递)
+      - 包一层 llm.llm.forward_one_step，第一次 prefill (cache 为空) 时拆成 前缀 + 其余 两段
+    不是 Qwen2LM (没有 forward_one_step) 时返回 False
+    """
+    decoder = getattr(llm, "llm", None)
+    if type(llm).__name__ == "TransformerLM" or not hasattr(decoder, "forward_one_step"):
+        return False
+    original_inference = llm.inference
+    original_step = decoder.forward_one_step
+    local = threading.local()
+
+    def inference(*args, **kwargs):
+        prompt_text = kwargs["prompt_text"] if "prompt_text" in kwargs else args[2]
+        prompt_text_len = kwargs["prompt_text_len"] if "prompt_text_len" in kwargs else args[3]
+        length = int(prompt_text_len)
+        # 没有参考文本时前缀只有 sos，不值得缓存
+        local.prefix = (kv_cache.key_for(prompt_text), 1 + length) if length > 0 else None
+        try:
+            yield from original_inference(*args, **kwargs)
+        finally:
+            local.prefix = None
+
+    def forward_one_step(xs, masks, cache=None):
+        prefix = getattr(local, "prefix", None)
+        if cache is not None or prefix is None or xs.shape[1] <= prefix[1]:
+            return original_step(xs, masks, cache=cache)
+        local.prefix = None
+        key, length = prefix
+        head = xs[:, :length]
+        cache = kv_cache.get(key, head)
+        if cache is None:
+            kv_cache.misses += 1
+            _, cache = original_step(head, masks[:, :length, :length], cache=None)
+            kv_cache.put(key, head, cache)
+        else:
+            kv_cache.hits += 1
+            record_event("tts_kv_hit", tokens=length)
+        return original_step(xs[:, length:], masks[:, length:, length:], cache=cache)
+
+    llm.inference = inference
+    decoder.forward_one_step = forward_one_step
+    return True
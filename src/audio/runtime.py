@@ -0,0 +1,70 @@
+import os
+import threading
+from .factory import AudioEngineFactory
+from src.utils import load_tts_settings
+
+# ==========================================
+# TTS 运行时 (不依赖 Gradio)
+# ==========================================
+# 已加载的 TTS 引擎全进程共享；WebUI、HTTP 服务、命令行都从这里取。
+
+_tts_instance = None
+_load_lock = threading.Lock()
+
+
+def get_tts():
+    """获取当前已加载的 TTS 引擎实例"""
+    return _tts_instance
+
+
+def set_tts(engine):
+    global _tts_instance
+    _tts_instance = engine
+
+
+def get_models_root(engine_type):
+    """
+    获取模型根目录
+    """
+    # 当前文件在 src/audio/runtime.py
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    
+    if engine_type == "CosyVoice":
+        # 目标: src/audio/cosyvoice/pretrained_models
+        return os.path.join(current_dir, "cosyvoice", "pretrained_models")
+        
+    elif engine_type == "GPT-SoVITS":
+        return os.path.join(current_dir, "gpt_sovits", "pretrained_models")
+    
+    # 默认回退
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    return os.path.join(project_root, "assets", "models")
+
+
+def get_full_model_path(engine_type, model_name):
+    root = get_models_root(engine_type)
+    return os.path.abspath(os.path.join(root, model_name))
+
+
+def load_tts_from_config():
+    """
+    按 tts_config.json 加载引擎 (无界面场景使用)，已加载则直接返回
+    """
+    with _load_lock:
+        if _tts_instance is not None:
+            return _tts_instance
+
+        config = load_tts_settings()
+        engine_type = config.get("engine_type", "CosyVoice")
+        model_name = config.get("model_path")
+        if not model_name:
+            print("⚠️ [Audio] tts_config.json 中没有模型配置，跳过加载")
+            return None
+
+        full_path = get_full_model_path(engine_type, model_name)
+        for item in AudioEngineFactory.get_engine_stream(engine_type, full_path):
+            if isinstance(item, str):
+                print(item, end="")
+            elif item is not None:
+                set_tts(item)
+        return _tts_instance
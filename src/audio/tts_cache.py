@@ -0,0 +1,224 @@
+import os
+import re
+import glob
+import wave
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from configs.settings import settings
+from src.filelock import cached_file
+from src.metrics import record_event
+from src.text_stream import SENTENCE_ENDINGS
+from .writer import WavStreamWriter
+
+# ==========================================
+# 按句缓存的合成结果
+# ==========================================
+# 常用语、重复的回复不必每次重新合成：
+#   - 键 = 规范化后的句子 + 音色 (参考音频内容 + 文本) + 模型 + 解码设置 (步数、流式、种子)
+#   - 合成时按键派生随机种子 (确定性采样)，同一个键现合成和命中缓存得到的是同一段音频
+#   - 内存层 (按字节数 LRU) + 磁盘层 (CACHE_DIR/tts，多副本共享，超过上限按最近使用时间淘汰)
+#   - 同一个键并发请求只合成一次 (single-flight)，其它请求等结果
+# 整段回复按句查缓存，命中的句子和新合成的句子拼成一个文件。
+# 随机数是进程全局的：同一引擎上带种子的合成持锁依次进行 (整句合成完再交出)，彼此不会打乱；
+# 缓存关闭或音色无法识别时的不带种子合成不拿锁，和它同时进行时仍可能让结果不再逐位一致。
+
+_SENTENCE_RE = re.compile(f"[^{re.escape(SENTENCE_ENDINGS)}]+[{re.escape(SENTENCE_ENDINGS)}]*")
+
+
+def normalize_sentence(text):
+    """全角/半角统一、合并空白；标点保留 (影响语气)"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+def split_sentences(text, min_chars=None):
+    """按句末标点切开，太短的句子并到下一句 (和流式分句的规则一致)"""
+    min_chars = settings.STREAM_MIN_CHARS if min_chars is None else min_chars
+    sentences, pending = [], ""
+    for piece in _SENTENCE_RE.findall(text or ""):
+        pending += piece
+        if len(pending.strip()) >= min_chars:
+            sentences.append(pending.strip())
+            pending = ""
+    if pending.strip():
+        if sentences and len(pending.strip()) < min_chars:
+            sentences[-1] += pending.strip()
+        else:
+            sentences.append(pending.strip())
+    return sentences
+
+
+class _Flight:
+    """一次正在进行的合成，其它相同请求在这里等结果"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.pcm = None
+
+
+class TTSCache:
+    def __init__(self, root=None, memory_bytes=None, disk_bytes=None):
+        self.root = root or os.path.join(settings.CACHE_DIR, "tts")
+        self.memory_bytes = memory_bytes if memory_bytes is not None else int(settings.TTS_CACHE_MEMORY_MB * 1024 * 1024)
+        self.disk_bytes = disk_bytes if disk_bytes is not None else int(settings.TTS_CACHE_DISK_MB * 1024 * 1024)
+        self._memory = OrderedDict()   # key -> (sample_rate, pcm)
+        self._memory_size = 0
+        self._flights = {}             # key -> _Flight
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    # === 键 ===
+    @staticmethod
+    def key_for(sentence, voice_key, model_tag, **decoding):
+        """decoding: 影响输出的解码设置 (flow_steps、stream……)"""
+        sentence = normalize_sentence(sentence)
+        if not settings.TTS_CACHE_ENABLED or not sentence or not voice_key:
+            return None
+        options = ",".join(f"{k}={decoding[k]}" for k in sorted(decoding))
+        parts = (sentence, voice_key, model_tag, options, str(settings.TTS_SEED))
+        return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def seed_for(key):
+        """每个键固定一个种子：同一句话不管什么时候合成都一样"""
+        return (int(key[:8], 16) ^ settings.TTS_SEED) & 0x7fffffff
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".wav")
+
+    # === 存取 ===
+    def get(self, key):
+        """返回 (sample_rate, pcm, 来源)；没有返回 None"""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+                return item + ("memory",)
+        path = self._path(key)
+        try:
+            with wave.open(path, "rb") as f:
+                sample_rate, pcm = f.getframerate(), f.readframes(f.getnframes())
+            # 磁盘层按修改时间淘汰：命中时刷新
+            os.utime(path)
+        except (OSError, EOFError, wave.Error):
+            return None
+        self._remember(key, sample_rate, pcm)
+        return sample_rate, pcm, "disk"
+
+    def put(self, key, sample_rate, pcm):
+        self._remember(key, sample_rate, pcm)
+
+        def build(tmp):
+            writer = WavStreamWriter(tmp, sample_rate)
+            writer.write(pcm)
+            writer.close()
+            return True
+
+        try:
+            cached_file(self._path(key), build)
+        except Exception as e:
+            print(f"⚠️ [TTSCache] 写入磁盘缓存失败: {e}")
+            return
+        self._evict_disk()
+
+    def _remember(self, key, sample_rate, pcm):
+        if len(pcm) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old[1])
+            self._memory[key] = (sample_rate, pcm)
+            self._memory_size += len(pcm)
+            while self._memory_size > self.memory_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        """磁盘层超过上限时删掉最久没用的文件 (各副本都可以清理)"""
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for path in glob.glob(os.path.join(self.root, "*", "*.wav")):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            if total <= self.disk_bytes:
+                return
+            files.sort()
+            removed = 0
+            for _, size, path in files:
+                if total <= self.disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+            print(f"🧹 [TTSCache] 磁盘缓存超出上限，淘汰 {removed} 个文件")
+        finally:
+            self._evict_lock.release()
+
+    # === 对外接口 ===
+    def serve(self, key, sample_rate, produce, succeeded):
+        """
+        生成器：命中缓存时一次产出整句 PCM，否则调用 produce() 边合成边产出，
+        succeeded() 为真 (没有取消、没有出错) 时写入缓存。相同键并发时只合成一次。
+        """
+        hit = self.get(key)
+        leader = False
+        if hit is None:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    leader = True
+            if not leader:
+                flight.event.wait(settings.STAGE_WAIT_TIMEOUT)
+                if flight.pcm is not None:
+                    hit = (sample_rate, flight.pcm, "flight")
+
+        if hit is not None:
+            # 采样率由模型决定，模型已在键里，命中的音频可以直接用
+            record_event("tts_cache_hit", source=hit[2], bytes=len(hit[1]))
+            yield hit[1]
+            return
+        if not leader:
+            # 领头的合成失败或被取消：自己合成一次 (不再合并)
+            yield from produce()
+            return
+
+        chunks = []
+        try:
+            for pcm in produce():
+                chunks.append(pcm)
+                yield pcm
+            if chunks and succeeded():
+                flight.pcm = b"".join(chunks)
+                self.put(key, sample_rate, flight.pcm)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"memory_entries": len(self._memory), "memory_bytes": self._memory_size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTSCache()
+        return _cache
@@ -1,7 +1,18 @@
 import os
 import sys
+import time
+import random
+import threading
 import torch
-import torchaudio
+
+from collections import OrderedDict
+
+from configs.settings import settings
+from src.filelock import cached_file
+from .writer import open_writer
+from .voices import get_voice_registry, features_path, voice_id_for
+from .tts_cache import get_tts_cache, split_sentences
+from .kv_cache import PromptKVCache, hook_prompt_kv_cache
 
 # === 路径注入 ===
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -24,6 +35,19 @@ class TTSEngine:
         初始化引擎
         :param model_dir: 模型文件夹的绝对路径
         """
+        # 每个线程单独记录本次合成的解码步数 (画质控制器按负载调整)
+        self._local = threading.local()
+        self.model_dir = model_dir
+        # 已加载到显存的音色提示特征 (音色 ID -> dict)
+        self._voices = OrderedDict()
+        self._voices_lock = threading.Lock()
+        self._frontend_zero_shot = None
+        self.kv_cache = None
+        # CosyVoice 采样用的是进程全局的 random / torch 随机数 (流式时还在它自己的线程里采样)，
+        # 没法传独立的 Generator：带种子的合成持锁播种并整句合成完，彼此之间不会打乱；
+        # 不带种子的合成不拿锁，照常并发
+        self._sampling_lock = threading.Lock()
+
         print(f"[Audio] 初始化 CosyVoice 引擎...")
         print(f"       目标模型: {model_dir}")
 
@@ -35,34 +59,243 @@ class TTSEngine:
         try:
             # 加载用户指定的模型
             self.model = CosyVoice(model_dir)
+            self._hook_flow_steps()
+            self._hook_prompt_features()
+            self._hook_prompt_kv_cache()
             print("✅ CosyVoice 内核加载成功！")
         except Exception as e:
             print(f"❌ 初始化崩溃: {e}")
             self.model = None
 
-    def speak(self, text: str, reference_wav: str, prompt_text: str, output_file: str = "output.wav"):
+    def _hook_flow_steps(self):
+        """
+        包一层 flow decoder 的 forward，使每次合成可以覆盖 n_timesteps
+        (CosyVoice 内部写死为 10 步，步数越少越快，音质略降)
+        """
+        decoder = getattr(getattr(getattr(self.model, "model", None), "flow", None), "decoder", None)
+        if decoder is None:
+            print("⚠️ [Audio] 未找到 flow decoder，解码步数不可调")
+            return
+        original_forward = decoder.forward
+        local = self._local
+
+        def forward(*args, **kwargs):
+            steps = getattr(local, "flow_steps", None)
+            if steps and "n_timesteps" in kwargs:
+                kwargs["n_timesteps"] = steps
+            return original_forward(*args, **kwargs)
+
+        decoder.forward = forward
+
+    def _hook_prompt_features(self):
+        """
+        包一层 frontend_zero_shot：本线程指定了音色特征时直接用预先提取好的，
+        只对要合成的文本分词，跳过参考音频的读取、重采样、语音 token 与说话人向量提取
+        (不借用 frontend.spk2info：那里的 dict 会被每次合成改写，多线程合成时不安全)
+        """
+        frontend = getattr(self.model, "frontend", None)
+        if frontend is None or not hasattr(frontend, "_extract_text_token"):
+            print("⚠️ [Audio] 当前 CosyVoice 版本不支持预提取音色特征，将每次处理参考音频")
+            return
+        original = frontend.frontend_zero_shot
+        self._frontend_zero_shot = original
+        local = self._local
+
+        def frontend_zero_shot(tts_text, *args, **kwargs):
+            features = getattr(local, "voice_features", None)
+            if features is None:
+                return original(tts_text, *args, **kwargs)
+            text_token, text_token_len = frontend._extract_text_token(tts_text)
+            return dict(features, text=text_token, text_len=text_token_len)
+
+        frontend.frontend_zero_shot = frontend_zero_shot
+
+    def _hook_prompt_kv_cache(self):
+        """同一音色重复合成时复用参考文本前缀的 KV 缓存 (只对 CosyVoice2 的 Qwen2LM 有效)"""
+        if settings.TTS_KV_CACHE_SIZE <= 0:
+            return
+        llm = getattr(getattr(self.model, "model", None), "llm", None)
+        kv_cache = PromptKVCache(settings.TTS_KV_CACHE_SIZE)
+        if llm is None or not hook_prompt_kv_cache(llm, kv_cache):
+            print("💡 [Audio] 该模型的 LLM 不是因果前缀结构 (CosyVoice v1)，不启用提示 KV 缓存")
+            return
+        self.kv_cache = kv_cache
+
+    @property
+    def model_tag(self):
+        """特征和模型绑定：不同模型 (CosyVoice / CosyVoice2) 的提示特征不通用"""
+        return os.path.basename(os.path.normpath(self.model_dir or "")) or "default"
+
+    def voice_features(self, voice):
+        """
+        取音色的提示特征：显存里有直接用，否则读磁盘缓存，都没有就现算一次并 torch.save
+        :param voice: 音色库里的音色 dict (见 src/audio/voices.py)
+        """
+        voice_id = voice["id"]
+        with self._voices_lock:
+            features = self._voices.get(voice_id)
+            if features is not None:
+                self._voices.move_to_end(voice_id)
+                return features
+
+        def build(tmp):
+            torch.save(self._extract_features(voice), tmp)
+            return True
+
+        path = cached_file(features_path(voice_id, self.model_tag), build)
+        features = torch.load(path, map_location=self.model.frontend.device)
+        with self._voices_lock:
+            self._voices[voice_id] = features
+            while len(self._voices) > settings.TTS_VOICE_CACHE_SIZE:
+                self._voices.popitem(last=False)
+        return features
+
+    def _extract_features(self, voice):
+        """和 CosyVoice.add_zero_shot_spk 一样：对空文本跑一次前端，去掉文本部分"""
+        t0 = time.monotonic()
+        prompt_text = self.model.frontend.text_normalize(voice["ref_text"], split=False)
+        features = self._frontend_zero_shot("", prompt_text, voice["ref_audio"], self.sample_rate, "")
+        features.pop("text", None)
+        features.pop("text_len", None)
+        print(f"🎙️ [Audio] 已提取音色特征: {voice['name']} ({time.monotonic() - t0:.2f}s)")
+        return features
+
+    def prepare_voice(self, voice):
+        """注册音色后立即提取特征 (之后合成直接用)；不支持时返回 False"""
+        if not self.model or self._frontend_zero_shot is None:
+            return False
+        self.voice_features(voice)
+        return True
+
+    @property
+    def sample_rate(self):
+        # CosyVoice 为 22050，CosyVoice2 为 24000
+        return getattr(self.model, "sample_rate", 22050)
+
+    def speak_stream(self, text: str, reference_wav: str, prompt_text: str, cancel_token=None, flow_steps=None, voice_id=None, seed=None):
+        """
+        流式合成：生成器，边合成边产出 16bit 小端单声道 PCM 字节 (采样率见 self.sample_rate)
+        长文本会被 CosyVoice 切成多段，所有段依次产出；取消后停止合成
+        :param flow_steps: flow 解码步数，None 表示使用模型默认值
+        :param voice_id: 音色库里的音色 ID；为空时按参考音频 + 文本自动匹配已注册的音色
+        :param seed: 随机种子，给定时输出可复现：同一引擎上带种子的合成依次进行，
+                     整句合成完 (释放锁后) 才产出，下游处理慢不会卡住其它合成
+        """
         if not self.model:
             print("⚠️ 引擎未加载，请先选择模型并加载")
-            return None
+            return
+
+        registry = get_voice_registry()
+        voice = registry.get(voice_id) if voice_id else registry.find(reference_wav, prompt_text)
+        if voice_id and voice is None:
+            print(f"⚠️ 未知音色: {voice_id}")
+            return
+        if voice:
+            reference_wav, prompt_text = voice["ref_audio"], voice["ref_text"]
 
         if not reference_wav or not os.path.exists(reference_wav):
             print("⚠️ 参考音频路径无效")
-            return None
+            return
 
         if not prompt_text: prompt_text = ""
 
         print(f"[Audio] 推理中: '{text}'")
+        self._local.flow_steps = flow_steps
+        self._local.voice_features = None
+        if voice and self._frontend_zero_shot is not None:
+            try:
+                self._local.voice_features = self.voice_features(voice)
+            except Exception as e:
+                print(f"⚠️ [Audio] 音色特征不可用，改为现场处理参考音频: {e}")
+        if seed is None:
+            yield from self._inference(text, prompt_text, reference_wav, cancel_token)
+            return
+        with self._sampling_lock:
+            random.seed(seed)
+            torch.manual_seed(seed)
+            chunks = list(self._inference(text, prompt_text, reference_wav, cancel_token))
+        yield from chunks
+
+    def _inference(self, text, prompt_text, reference_wav, cancel_token):
+        # 兼容性写法: 直接传路径字符串
+        output = self.model.inference_zero_shot(text, prompt_text, reference_wav, stream=settings.TTS_STREAM)
         try:
-            # 兼容性写法: 直接传路径字符串
-            output = self.model.inference_zero_shot(text, prompt_text, reference_wav)
-            
             for result in output:
-                # 兼容性写法: 不传 backend 参数
-                torchaudio.save(output_file, result['tts_speech'], 22050)
-                print(f"🔊 生成成功 -> {output_file}")
-                return output_file
-                
+                # 轮次已被取消：丢弃结果，停止继续合成
+                if cancel_token is not None and cancel_token.cancelled:
+                    print("🛑 [Audio] 合成已取消")
+                    return
+                speech = result['tts_speech']
+                yield (speech.clamp(-1, 1) * 32767).to(torch.int16).cpu().numpy().tobytes()
+        finally:
+            output.close()
+            self._local.voice_features = None
+
+    def speak_sentences(self, text: str, reference_wav: str, prompt_text: str, cancel_token=None, flow_steps=None, voice_id=None):
+        """
+        按句合成：生成器，产出 PCM 字节。命中缓存的句子整句产出，其余按句子派生的种子现合成
+        (确定性采样) 并写入缓存；缓存关闭或音色无法识别时整段交给 speak_stream
+        """
+        if voice_id:
+            voice = get_voice_registry().get(voice_id)
+            if voice:
+                reference_wav, prompt_text = voice["ref_audio"], voice["ref_text"]
+        try:
+            voice_key = voice_id_for(reference_wav, prompt_text)
+        except OSError:
+            voice_key = None
+        cache = get_tts_cache()
+        if not settings.TTS_CACHE_ENABLED or not voice_key:
+            yield from self.speak_stream(text, reference_wav, prompt_text, cancel_token, flow_steps, voice_id)
+            return
+
+        for sentence in split_sentences(text):
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            key = cache.key_for(sentence, voice_key, self.model_tag, flow_steps=flow_steps, stream=settings.TTS_STREAM)
+            if key is None:
+                continue
+            state = {"done": False}
+
+            def produce(sentence=sentence, key=key, state=state):
+                yield from self.speak_stream(sentence, reference_wav, prompt_text, cancel_token, flow_steps, voice_id,
+                                             seed=cache.seed_for(key))
+                state["done"] = not (cancel_token is not None and cancel_token.cancelled)
+
+            yield from cache.serve(key, self.sample_rate, produce, succeeded=lambda state=state: state["done"])
+
+    def speak(self, text: str, reference_wav: str, prompt_text: str, output_file: str = "output.wav", cancel_token=None, flow_steps=None, on_chunk=None, voice_id=None):
+        """
+        合成整段并写入 output_file (.wav / .opus)，每个 PCM 块到达就追加写入
+        (按句查缓存，命中的句子和新合成的句子拼在一起)
+        :param flow_steps: flow 解码步数，None 表示使用模型默认值
+        :param on_chunk: 每个 PCM 块到达时回调 on_chunk(pcm, sample_rate)，下游可以不等整句合成完
+        :param voice_id: 音色库里的音色 ID (见 speak_stream)
+        """
+        if not self.model:
+            print("⚠️ 引擎未加载，请先选择模型并加载")
+            return None
+
+        writer = None
+        try:
+            for pcm in self.speak_sentences(text, reference_wav, prompt_text, cancel_token, flow_steps, voice_id):
+                if writer is None:
+                    writer = open_writer(output_file, self.sample_rate)
+                writer.write(pcm)
+                if on_chunk is not None:
+                    on_chunk(pcm, self.sample_rate)
+            if writer is None or (cancel_token is not None and cancel_token.cancelled):
+                # 参考音频无效、没有产出或被取消：不留下写了一半的文件
+                if writer is not None:
+                    writer.abort()
+                return None
+            writer.close()
+            print(f"🔊 生成成功 -> {output_file} ({writer.duration:.1f}s)")
+            return output_file
+
         except Exception as e:
+            if writer is not None:
+                writer.abort()
             print(f"❌ 推理出错: {e}")
             import traceback
             traceback.print_exc()
@@ -6,39 +6,17 @@ from .factory import AudioEngineFactory
 from src.utils import load_tts_settings, save_tts_settings
 from .downloader import MODEL_MAP, download_model_handler
 from .patcher import patch_cosyvoice_code
+from .runtime import get_tts, set_tts, get_models_root, get_full_model_path
+from src.store import share_file
+from .voices import get_voice_registry
 
-# 全局变量
-_tts_instance = None
+# 全局变量 (引擎实例保存在 runtime，方便无界面的服务复用)
 PLACEHOLDER_TEXT = "暂无模型-请先下载"
 
-def get_tts():
-    """获取当前已加载的 TTS 引擎实例"""
-    global _tts_instance
-    return _tts_instance
-
 # ==========================================
-# 1. 路径与扫描逻辑 (关键修复点)
+# 1. 路径与扫描逻辑 (路径函数见 runtime.py)
 # ==========================================
 
-def get_models_root(engine_type):
-    """
-    获取模型根目录
-    """
-    # 当前文件在 src/audio/ui.py
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    if engine_type == "CosyVoice":
-        # ✅ 修正：直接拼接 cosyvoice，不要再加 audio
-        # 目标: src/audio/cosyvoice/pretrained_models
-        return os.path.join(current_dir, "cosyvoice", "pretrained_models")
-        
-    elif engine_type == "GPT-SoVITS":
-        return os.path.join(current_dir, "gpt_sovits", "pretrained_models")
-    
-    # 默认回退
-    project_root = os.path.dirname(os.path.dirname(current_dir))
-    return os.path.join(project_root, "assets", "models")
-
 def scan_models(engine_type):
     if engine_type == "GPT-SoVITS": 
         return ["GPT-SoVITS-暂未支持"]
@@ -57,10 +35,6 @@ def scan_models(engine_type):
     
     return dirs
 
-def get_full_model_path(engine_type, model_name):
-    root = get_models_root(engine_type)
-    return os.path.abspath(os.path.join(root, model_name))
-
 # ==========================================
 # 2. 各种 Handler (保持不变)
 # ==========================================
@@ -112,7 +86,6 @@ def uninstall_engine_handler(engine_name):
     return AudioEngineFactory.remove_engine(engine_name)
 
 def load_and_save_stream_handler(engine_type, model_name, ref_audio, ref_text):
-    global _tts_instance
     if engine_type == "GPT-SoVITS":
         yield "⚠️ 暂未支持 GPT-SoVITS", "暂不可用"
         return
@@ -125,6 +98,8 @@ def load_and_save_stream_handler(engine_type, model_name, ref_audio, ref_text):
     
     if ref_audio and not os.path.isfile(ref_audio):
         ref_audio = "" 
+    # 配置会被其它 webui 副本读取，参考音频不能留在本副本的上传临时目录
+    ref_audio = share_file(ref_audio, "voices")
 
     save_msg = save_tts_settings(engine_type, model_name, ref_audio, ref_text)
     
@@ -155,7 +130,7 @@ def load_and_save_stream_handler(engine_type, model_name, ref_audio, ref_text):
                 log_content += "\n❌ 加载失败，请检查日志。"
                 yield log_content, "❌ 失败"
             else:
-                _tts_instance = item
+                set_tts(item)
                 log_content += "\n🎉 引擎加载成功！"
                 yield log_content, "✅ 就绪"
     except Exception as e:
@@ -164,6 +139,42 @@ def load_and_save_stream_handler(engine_type, model_name, ref_audio, ref_text):
         log_content += f"\n❌ 崩溃: {str(e)}"
         yield log_content, "❌ 崩溃"
 
+def voice_choices():
+    return [(f"{v['name']} ({v['id']})", v["id"]) for v in get_voice_registry().list()]
+
+def register_voice_handler(name, ref_audio, ref_text):
+    """登记当前参考素材为音色；引擎已加载时立即提取特征"""
+    if not ref_audio or not os.path.isfile(ref_audio):
+        return "⚠️ 请先上传参考音频", gr.update()
+    try:
+        voice = get_voice_registry().register(name, ref_audio, ref_text)
+    except Exception as e:
+        return f"❌ 注册失败: {e}", gr.update()
+    msg = f"✅ 已注册音色: {voice['name']} ({voice['id']})"
+    tts = get_tts()
+    try:
+        if tts is not None and hasattr(tts, "prepare_voice") and tts.prepare_voice(voice):
+            msg += "\n🎙️ 提示特征已提取，之后合成不再重复处理参考音频"
+        else:
+            msg += "\n💡 引擎加载后首次使用该音色时提取特征"
+    except Exception as e:
+        msg += f"\n⚠️ 特征提取失败 (合成时会重试): {e}"
+    return msg, gr.Dropdown(choices=voice_choices(), value=voice["id"])
+
+def use_voice_handler(voice_id):
+    """切换音色：填入参考素材并保存为默认音色"""
+    voice = get_voice_registry().get(voice_id)
+    if not voice:
+        return gr.update(), gr.update(), "⚠️ 请选择音色"
+    config = load_tts_settings()
+    save_tts_settings(config.get("engine_type", "CosyVoice"), config.get("model_path"), voice["ref_audio"], voice["ref_text"])
+    return voice["ref_audio"], voice["ref_text"], f"✅ 已切换音色: {voice['name']}"
+
+def delete_voice_handler(voice_id):
+    voice = get_voice_registry().delete(voice_id) if voice_id else None
+    msg = f"🗑️ 已删除音色: {voice['name']}" if voice else "⚠️ 请选择音色"
+    return msg, gr.Dropdown(choices=voice_choices(), value=None)
+
 def auto_extract_text_from_filename(audio_path):
     if not audio_path or not os.path.isfile(audio_path): return ""
     try:
@@ -266,6 +277,16 @@ def build_audio_ui():
             ref_audio_input = gr.Audio(label="参考音频 (3-10秒最佳)", type="filepath", value=default_audio)
             ref_text_input = gr.Textbox(label="参考文本", value=config.get("ref_text"), placeholder="留空则自动识别...")
 
+        with gr.Group():
+            gr.Markdown("#### 🎙️ 音色库 (注册一次，之后合成不再重复处理参考音频)")
+            with gr.Row():
+                voice_name_input = gr.Textbox(label="音色名称", placeholder="例如：温柔女声", scale=2)
+                register_voice_btn = gr.Button("➕ 注册当前参考素材", scale=1)
+            with gr.Row():
+                voice_dropdown = gr.Dropdown(choices=voice_choices(), label="已注册音色", interactive=True, scale=3)
+                use_voice_btn = gr.Button("✅ 使用", variant="primary", scale=1)
+                delete_voice_btn = gr.Button("🗑️ 删除", variant="stop", scale=1)
+
         gr.Markdown("---")
 
         with gr.Group():
@@ -306,7 +327,16 @@ def build_audio_ui():
     engine_radio.change(on_engine_change, inputs=[engine_radio], outputs=[model_dropdown])
     engine_radio.change(on_engine_change, inputs=[engine_radio], outputs=[del_model_dropdown]) 
     refresh_main_btn.click(on_engine_change, inputs=[engine_radio], outputs=[model_dropdown])
-    ref_audio_input.change(auto_extract_text_from_filename, inputs=[ref_audio_input], outputs=[ref_text_input])
+    # 只在用户上传时按文件名填参考文本 (切换音色时程序填入的音频不触发)
+    ref_audio_input.upload(auto_extract_text_from_filename, inputs=[ref_audio_input], outputs=[ref_text_input])
+
+    register_voice_btn.click(
+        register_voice_handler,
+        inputs=[voice_name_input, ref_audio_input, ref_text_input],
+        outputs=[console_log, voice_dropdown]
+    )
+    use_voice_btn.click(use_voice_handler, inputs=[voice_dropdown], outputs=[ref_audio_input, ref_text_input, console_log])
+    delete_voice_btn.click(delete_voice_handler, inputs=[voice_dropdown], outputs=[console_log, voice_dropdown])
 
     load_btn.click(
         load_and_save_stream_handler,
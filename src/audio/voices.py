@@ -0,0 +1,109 @@
+import os
+import glob
+import time
+import hashlib
+import threading
+from functools import lru_cache
+
+from configs.settings import settings
+from src.store import get_state_store, share_file
+
+# ==========================================
+# 音色库 (预先提取的零样本提示特征)
+# ==========================================
+# 每次零样本合成，CosyVoice 都要把参考音频重新读取、重采样、提取语音 token / mel 特征 / 说话人向量。
+# 注册音色后这些只算一次：
+#   - 音色表 (名称、参考音频、参考文本) 存进状态存储，多副本共享
+#   - 提示特征按 音色 + 模型 用 torch.save 存到 CACHE_DIR/voices/features，各副本和 worker 共用
+#   - 合成时传音色 ID；传参考音频 + 文本时也会自动匹配已注册的音色
+# 音色 ID 由参考音频内容 + 参考文本决定，同一段素材重复注册得到同一个 ID。
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path, mtime, size):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def voice_id_for(ref_audio, ref_text):
+    """参考音频内容 + 参考文本 -> 音色 ID；音频不存在时返回 None"""
+    if not ref_audio or not os.path.isfile(ref_audio):
+        return None
+    stat = os.stat(ref_audio)
+    content = _file_digest(os.path.abspath(ref_audio), stat.st_mtime, stat.st_size)
+    return hashlib.sha1(f"{content}\x1f{ref_text or ''}".encode("utf-8")).hexdigest()[:12]
+
+
+def features_path(voice_id, model_tag):
+    return os.path.join(settings.CACHE_DIR, "voices", "features", f"{voice_id}-{model_tag}.pt")
+
+
+class VoiceRegistry:
+    NAMESPACE = "config"
+    KEY = "voices"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _load(self):
+        return get_state_store().get(self.NAMESPACE, self.KEY) or {}
+
+    def list(self):
+        return sorted(self._load().values(), key=lambda v: v.get("created", 0))
+
+    def get(self, voice_id):
+        return self._load().get(voice_id) if voice_id else None
+
+    def find(self, ref_audio, ref_text):
+        """按参考音频 + 文本找已注册的音色，没有返回 None"""
+        voices = self._load()
+        if not voices:
+            return None
+        try:
+            return voices.get(voice_id_for(ref_audio, ref_text))
+        except OSError:
+            return None
+
+    def register(self, name, ref_audio, ref_text):
+        """登记音色 (参考音频复制到共享缓存)，返回音色信息 dict"""
+        if not ref_audio or not os.path.isfile(ref_audio):
+            raise ValueError("参考音频无效")
+        ref_audio = share_file(ref_audio, "voices")
+        voice_id = voice_id_for(ref_audio, ref_text)
+        with self._lock:
+            voices = self._load()
+            voice = voices.get(voice_id) or {"id": voice_id, "created": time.time()}
+            voice.update({"name": name or voice.get("name") or voice_id,
+                          "ref_audio": ref_audio, "ref_text": ref_text or ""})
+            voices[voice_id] = voice
+            get_state_store().put(self.NAMESPACE, self.KEY, voices)
+        print(f"🎙️ [Voices] 已注册音色: {voice['name']} ({voice_id})")
+        return voice
+
+    def delete(self, voice_id):
+        with self._lock:
+            voices = self._load()
+            voice = voices.pop(voice_id, None)
+            get_state_store().put(self.NAMESPACE, self.KEY, voices)
+        # 各模型的特征文件一起删掉
+        for path in glob.glob(features_path(voice_id, "*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return voice
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_voice_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = VoiceRegistry()
+        return _registry
@@ -0,0 +1,110 @@
+import os
+import struct
+import subprocess
+
+# ==========================================
+# 边合成边写的音频文件 (WAV / Opus)
+# ==========================================
+# 流式合成每产出一段 PCM (16bit 小端、单声道) 就追加写入，不用等整句合成完：
+#   - WAV：先写一个长度为 0 的文件头，数据边到边写 (每段 flush)，close() 时回填 RIFF / data 长度
+#   - Opus：PCM 经管道交给 ffmpeg 边编码边写 ogg，close() 时关闭管道等待编码收尾
+# abort() 丢弃写了一半的文件 (合成被取消或出错)。
+
+
+class WavStreamWriter:
+    def __init__(self, path, sample_rate, channels=1, sampwidth=2):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.frames = 0
+        self._size = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, "wb")
+        self._f.write(self._header(0))
+        self._f.flush()
+
+    def _header(self, data_size):
+        block_align = self.channels * self.sampwidth
+        return (
+            b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, self.channels, self.sample_rate,
+                                    self.sample_rate * block_align, block_align, self.sampwidth * 8)
+            + b"data" + struct.pack("<I", data_size)
+        )
+
+    def write(self, pcm):
+        if not pcm:
+            return
+        self._f.write(pcm)
+        self._f.flush()
+        self._size += len(pcm)
+        self.frames = self._size // (self.channels * self.sampwidth)
+
+    @property
+    def duration(self):
+        return self.frames / float(self.sample_rate)
+
+    def close(self):
+        """回填文件头里的长度，之后文件就是完整的 WAV"""
+        if self._f is None:
+            return
+        self._f.seek(0)
+        self._f.write(self._header(self._size))
+        self._f.close()
+        self._f = None
+
+    def abort(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class OpusStreamWriter:
+    def __init__(self, path, sample_rate, channels=1, bitrate="32k"):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cmd = ["ffmpeg", "-loglevel", "error", "-y",
+               "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+               "-c:a", "libopus", "-b:a", bitrate, "-f", "ogg", path]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, pcm):
+        if not pcm:
+            return
+        self._proc.stdin.write(pcm)
+        self._proc.stdin.flush()
+        self.frames += len(pcm) // (2 * self.channels)
+
+    @property
+    def duration(self):
+        return self.frames / float(self.sample_rate)
+
+    def close(self):
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        proc.stdin.close()
+        _, err = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg 编码 Opus 失败: {err.decode('utf-8', 'ignore').strip()}")
+
+    def abort(self):
+        if self._proc is not None:
+            proc, self._proc = self._proc, None
+            proc.kill()
+            proc.wait()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def open_writer(path, sample_rate, channels=1):
+    """按扩展名选择写入器：.opus / .ogg 用 Opus，其它写 WAV"""
+    if os.path.splitext(path)[1].lower() in (".opus", ".ogg"):
+        return OpusStreamWriter(path, sample_rate, channels)
+    return WavStreamWriter(path, sample_rate, channels)
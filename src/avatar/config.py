@@ -0,0 +1,33 @@
+import os
+import json
+
+from src.store import get_state_store
+
+# ==========================================
+# 形象配置 (不依赖 Gradio)
+# ==========================================
+# 保存在状态存储 (config/a2f) 中，多个 webui 副本共用；
+# 旧版本的 a2f_config.json 只在存储里还没有配置时读取一次。
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "a2f_config.json")
+
+DEFAULT_A2F_CONFIG = {"engine": "SadTalker", "enhancer": True, "still": False, "bbox": 0, "img": None}
+
+
+def save_a2f_config(config):
+    """将配置保存到状态存储"""
+    get_state_store().put("config", "a2f", config)
+
+
+def load_a2f_config():
+    """从状态存储读取配置，如果不存在则回退到旧文件 / 默认值"""
+    config = get_state_store().get("config", "a2f")
+    if config is not None:
+        return config
+    if os.path.exists(CONFIG_PATH):
+        try:
+            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            pass
+    # 默认值
+    return dict(DEFAULT_A2F_CONFIG)
@@ -4,6 +4,7 @@ import subprocess
 import shutil
 import uuid
 import glob
+import hashlib
 import warnings
 import yaml  # 必须引入 yaml 库 (pip install pyyaml)
 from pydub import AudioSegment
@@ -13,6 +14,9 @@ warnings.filterwarnings("ignore", category=FutureWarning, module="diffusers")
 
 # 引入环境管理器
 from .env_manager import ensure_ffmpeg_path
+from src.cancel import TurnCancelled, DeadlineExceeded
+from src.filelock import cached_file, LockTimeout
+from configs.settings import settings
 
 # === 初始化时注入环境变量 ===
 ensure_ffmpeg_path()
@@ -46,33 +50,74 @@ class BaseEngine:
         except:
             return path
 
-    def _ensure_video_input(self, img_path, out_dir):
-        """(MuseTalk专用) 如果是图片，转换为静态视频"""
+    def _ensure_video_input(self, img_path, out_dir, resolution=512):
+        """
+        (MuseTalk专用) 如果是图片，转换为静态视频
+        转换结果按 图片内容+分辨率 缓存在共享目录，多个副本 / worker 只转一次
+        """
         if not os.path.exists(out_dir): os.makedirs(out_dir, exist_ok=True)
 
         ext = os.path.splitext(img_path)[1].lower()
         # 只有图片才需要转换
         if ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-            safe_img = self._get_safe_path(img_path, out_dir, "tmp_cvt_")
-            video_name = f"temp_v_{uuid.uuid4().hex[:4]}.mp4"
-            video_path = os.path.abspath(os.path.join(out_dir, video_name))
-            
-            # 简单的 FFmpeg 转换命令
-            cmd = [
-                'ffmpeg', '-y', '-loop', '1', '-i', safe_img,
-                '-c:v', 'libx264', '-t', '5', '-pix_fmt', 'yuv420p',
-                '-vf', 'scale=512:512', video_path
-            ]
+            with open(img_path, "rb") as f:
+                digest = hashlib.sha1(f.read()).hexdigest()[:16]
+            video_path = os.path.abspath(os.path.join(
+                settings.CACHE_DIR, "avatar_inputs", f"{digest}_{resolution}.mp4"
+            ))
+
+            def build(tmp_path):
+                safe_img = self._get_safe_path(img_path, out_dir, "tmp_cvt_")
+                # 简单的 FFmpeg 转换命令
+                cmd = [
+                    'ffmpeg', '-y', '-loop', '1', '-i', safe_img,
+                    '-c:v', 'libx264', '-t', '5', '-pix_fmt', 'yuv420p',
+                    '-vf', f'scale={resolution}:{resolution}', tmp_path
+                ]
+                try:
+                    subprocess.run(cmd, check=True, capture_output=True)
+                    return True
+                except:
+                    return False
+                finally:
+                    if os.path.exists(safe_img): os.remove(safe_img)
+
             try:
-                subprocess.run(cmd, check=True, capture_output=True)
-                return video_path
-            except:
-                return img_path # 失败返回原图
-            finally:
-                if os.path.exists(safe_img): os.remove(safe_img)
+                return cached_file(video_path, build) or img_path # 失败返回原图
+            except LockTimeout:
+                return img_path
         
         return img_path
 
+    def _run_cmd(self, cmd, cwd=None, cancel_token=None, timeout=None):
+        """
+        启动渲染子进程，并在轮次被取消或超过 timeout 秒时杀掉它
+        (替代没有超时、无法中断的 subprocess.run)
+        """
+        process = subprocess.Popen(cmd, cwd=cwd)
+
+        def kill():
+            if process.poll() is None:
+                process.kill()
+
+        if cancel_token is not None:
+            cancel_token.on_cancel(kill)
+        try:
+            try:
+                returncode = process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                kill()
+                process.wait()
+                raise DeadlineExceeded(f"渲染超过 {timeout:.1f}s 截止时间")
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(kill)
+
+        if cancel_token is not None and cancel_token.cancelled:
+            raise TurnCancelled(cancel_token.reason)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
+
     def _find_video(self, root):
         files = glob.glob(os.path.join(root, "**", "*.mp4"), recursive=True)
         return max(files, key=os.path.getctime) if files else None
@@ -93,7 +138,8 @@ class SadTalkerEngine(BaseEngine):
             "--driven_audio", safe_audio,
             "--source_image", safe_img,
             "--result_dir", out_dir,
-            "--preprocess", "full"
+            # 画质控制器在高负载时会切到 crop，只处理人脸区域
+            "--preprocess", kwargs.get("preprocess", "full")
         ]
         
         if kwargs.get("use_still"): cmd.append("--still")
@@ -101,8 +147,14 @@ class SadTalkerEngine(BaseEngine):
         
         print(f"🎬 [SadTalker] 启动...")
         try:
-            subprocess.run(cmd, check=True, cwd=sadtalker_path)
+            self._run_cmd(cmd, cwd=sadtalker_path, cancel_token=kwargs.get("cancel_token"), timeout=kwargs.get("timeout"))
             return self._find_video(out_dir)
+        except TurnCancelled:
+            print(f"🛑 [SadTalker] 渲染已取消")
+            return None
+        except DeadlineExceeded:
+            # 交给上层决定降级 (只出音频)
+            raise
         except Exception as e:
             print(f"❌ SadTalker 失败: {e}")
             return None
@@ -119,7 +171,7 @@ class MuseTalkEngine(BaseEngine):
 
         # 2. 预处理：MuseTalk 不吃图片，先转视频
         # 注意：这里传给 _ensure_video_input 的要是绝对路径 out_dir_abs
-        video_input = self._ensure_video_input(img, out_dir_abs)
+        video_input = self._ensure_video_input(img, out_dir_abs, kwargs.get("resolution", 512))
         
         safe_video = self._get_safe_path(video_input, out_dir_abs, "src_mt_")
         safe_audio = os.path.abspath(audio) 
@@ -166,12 +218,19 @@ class MuseTalkEngine(BaseEngine):
         
         if unet_config_path:
             cmd.extend(["--unet_config", unet_config_path])
+        if kwargs.get("batch_size"):
+            cmd.extend(["--batch_size", str(kwargs["batch_size"])])
         
         print(f"🎬 [MuseTalk] 启动 (配置路径: {temp_yaml_path})...")
         try:
             # cwd 依然保持在 musetalk 目录，以确保它能找到 models 文件夹
-            subprocess.run(cmd, check=True, cwd=musetalk_path)
+            self._run_cmd(cmd, cwd=musetalk_path, cancel_token=kwargs.get("cancel_token"), timeout=kwargs.get("timeout"))
             return self._find_video(out_dir_abs)
+        except TurnCancelled:
+            print(f"🛑 [MuseTalk] 渲染已取消")
+            return None
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"❌ MuseTalk 失败: {e}")
             return None
@@ -1,13 +1,21 @@
 import gradio as gr
 import os
-import json
 from .factory import AvatarEngineFactory
 from .downloader import MODEL_MAP, download_avatar_model_handler, MUSETALK_COMPONENTS
+from .config import save_a2f_config
+from src.session import get_session, save_session
+from src.store import share_file
+from src.utils import load_tts_settings
+from src.filler import get_filler_library
 
 _current_config = {"engine": "SadTalker", "enhancer": True, "still": False, "bbox": 0, "img": None}
-CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "a2f_config.json")
 
-def get_current_avatar():
+def get_current_avatar(session_id=None):
+    """优先返回该会话自己激活的形象，否则返回全局默认"""
+    if session_id:
+        avatar = get_session(session_id).avatar
+        if avatar:
+            return avatar["img"], avatar
     return _current_config["img"], _current_config
 
 def install_handler(engine):
@@ -16,22 +24,6 @@ def install_handler(engine):
         log += chunk
         yield log
 
-def save_a2f_config(config):
-    """将配置保存到 JSON 文件"""
-    with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
-        json.dump(config, f, indent=4, ensure_ascii=False)
-
-def load_a2f_config():
-    """从文件读取配置，如果不存在则返回默认值"""
-    if os.path.exists(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
-    # 默认值
-    return {"engine": "SadTalker", "enhancer": True, "still": False, "bbox": 0, "img": None}
-
 def check_musetalk_completeness(base_path):
     """
     检查 MuseTalk 所有模型文件是否下载完整
@@ -50,7 +42,7 @@ def check_musetalk_completeness(base_path):
             
     return missing_files
 
-def load_handler(img, engine, enhancer, still, bbox):
+def load_handler(img, engine, enhancer, still, bbox, request: gr.Request = None):
     status = AvatarEngineFactory.check_engine_status(engine)
     if "❌" in status:
         yield f"流程终止: {status}", "❌ 引擎未就绪", None
@@ -72,6 +64,9 @@ def load_handler(img, engine, enhancer, still, bbox):
         yield "⚠️ 请上传图片", "❌ 无图片", None
         return
 
+    # 上传的图片在本副本的临时目录里，复制到共享缓存，其它副本也能渲染
+    img = share_file(img, "avatars")
+
     _current_config.update({
         "engine": engine, "enhancer": enhancer, 
         "still": still, "bbox": bbox, "img": img
@@ -92,9 +87,21 @@ def load_handler(img, engine, enhancer, still, bbox):
             "img": img
         }
     
+    # 文件里的配置作为新会话的默认值；当前会话单独记住自己的形象
     save_a2f_config(current_config)
     
     _current_config.update(current_config)
+    voice = {}
+    if request:
+        session = get_session(request.session_hash)
+        session.avatar = dict(current_config)
+        save_session(session)
+        voice = session.voice
+
+    # 后台为 当前音色 + 新形象 生成垫场短片 (已有则直接复用)
+    if not voice.get("ref_audio"):
+        voice = load_tts_settings()
+    get_filler_library().prepare_async(voice.get("ref_audio"), voice.get("ref_text"), current_config)
 
     yield info, "✅ 已激活", img
 
@@ -0,0 +1,211 @@
+import time
+import queue
+import contextlib
+import asyncio
+import threading
+import importlib.util
+
+from configs.settings import settings
+
+# ==========================================
+# 异步 LLM 客户端 (OpenAI 协议)
+# ==========================================
+# 所有会话共用一个后台事件循环线程 + 一个 httpx 连接池：
+# - HTTP/2 (装了 h2 时) 多路复用，HTTP/1.1 时复用 keep-alive 连接
+# - 信号量限制同时在途的请求数，超出的在事件循环里排队，不占线程
+# - 启动时预热 DNS 解析与 TLS 握手，第一个用户不用等冷连接
+#
+# 同步代码 (Gradio / 流水线线程) 用 stream() / complete()，
+# asyncio 代码 (FastAPI) 用 astream()，都跑在同一个事件循环和连接池上。
+# 不再使用时调用 close()：等在途请求结束后关闭连接池并停掉事件循环线程。
+
+
+class AsyncLLMClient:
+    def __init__(self, api_key, base_url=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.http2 = settings.LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+        if settings.LLM_HTTP2 and not self.http2:
+            print("⚠️ [Brain] 未安装 h2 (pip install httpx[http2])，LLM 连接使用 HTTP/1.1 keep-alive")
+
+        self._closed = False
+        self._active = 0                 # 在途请求数 (只在事件循环里读写)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True, name="brain-loop")
+        self._thread.start()
+        # 客户端和信号量必须在它们所属的事件循环里创建
+        self.submit(self._setup()).result()
+
+    def _run_loop(self):
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _setup(self):
+        import httpx
+        from openai import AsyncOpenAI
+        self.http_client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=10.0)
+        )
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self.http_client)
+        self._semaphore = asyncio.Semaphore(settings.LLM_CONCURRENCY)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def submit(self, coro):
+        """把协程交给后台事件循环，返回 concurrent.futures.Future"""
+        if self._closed:
+            coro.close()
+            raise RuntimeError("LLM 客户端已关闭")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    # === 事件循环内部 ===
+    @contextlib.asynccontextmanager
+    async def _request(self):
+        """限制并发并记录在途请求数，close() 据此等待"""
+        self._active += 1
+        self._idle.clear()
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.set()
+
+    async def _astream(self, **kwargs):
+        async with self._request():
+            stream = await self.client.chat.completions.create(stream=True, **kwargs)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                # 提前结束 (取消) 时关闭响应，服务商停止生成，连接归还连接池
+                await stream.close()
+
+    async def _complete(self, **kwargs):
+        async with self._request():
+            response = await self.client.chat.completions.create(**kwargs)
+            return response.choices[0].message.content
+
+    async def _pump(self, kwargs, put):
+        try:
+            async for delta in self._astream(**kwargs):
+                put(("delta", delta))
+            put(("end", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            put(("error", e))
+
+    async def _prewarm(self):
+        import httpx
+        t0 = time.monotonic()
+        url = httpx.URL(str(self.client.base_url))
+        try:
+            # 1. DNS 解析 (结果进系统缓存)
+            await self._loop.getaddrinfo(url.host, url.port or (443 if url.scheme == "https" else 80))
+        except OSError as e:
+            print(f"⚠️ [Brain] LLM 预热失败 (DNS): {e}")
+            return
+        # 2. 一个不消耗 token 的请求：完成 TCP + TLS 握手，连接留在连接池里
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            # 部分服务商没有 /models 接口，只要握手完成就不影响预热效果
+            print(f"⚠️ [Brain] 预热请求返回异常: {e}")
+        print(f"🔥 [Brain] LLM 连接预热完成 ({url.host}, {'HTTP/2' if self.http2 else 'HTTP/1.1'}): "
+              f"{(time.monotonic() - t0) * 1000:.0f} ms")
+
+    async def _aclose(self, timeout):
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ [Brain] 旧 LLM 客户端还有 {self._active} 个请求未结束，强制关闭")
+        try:
+            await self.http_client.aclose()
+        finally:
+            self._loop.stop()
+
+    # === 对外接口 ===
+    def stream(self, cancel=None, **kwargs):
+        """
+        同步生成器：逐段产出增量文本；关闭生成器会取消上游请求
+        :param cancel: threading.Event，被设置后 (例如对冲请求输了) 还没等到首 token 也立刻取消
+        """
+        items = queue.Queue()
+        future = self.submit(self._pump(kwargs, items.put))
+        try:
+            while True:
+                if cancel is None:
+                    kind, value = items.get()
+                else:
+                    try:
+                        kind, value = items.get(timeout=0.05)
+                    except queue.Empty:
+                        if cancel.is_set():
+                            return
+                        continue
+                if kind == "delta":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    async def astream(self, **kwargs):
+        """异步生成器：可以在任意事件循环里使用 (例如 FastAPI 的)"""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            async for delta in self._astream(**kwargs):
+                yield delta
+            return
+        items = asyncio.Queue()
+        future = self.submit(self._pump(kwargs, lambda item: loop.call_soon_threadsafe(items.put_nowait, item)))
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "delta":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    def complete(self, timeout=None, **kwargs):
+        """同步调用：等完整回复，返回文本"""
+        future = self.submit(self._complete(**kwargs))
+        try:
+            return future.result(timeout)
+        finally:
+            future.cancel()
+
+    def prewarm(self, wait=False, timeout=15.0):
+        """预热 DNS / TLS；wait=False 时在后台进行，立刻返回"""
+        future = self.submit(self._prewarm())
+        if wait:
+            future.result(timeout)
+        return future
+
+    def close(self, wait=False, timeout=None):
+        """
+        等在途请求结束 (最多 LLM_TIMEOUT 秒) 后关闭连接池并停掉事件循环线程
+        之后再发请求会抛 RuntimeError；wait=False 时在后台收尾，立刻返回
+        """
+        if self._closed:
+            return
+        future = self.submit(self._aclose(settings.LLM_TIMEOUT if timeout is None else timeout))
+        self._closed = True
+        if wait:
+            future.result()
+            self._thread.join()
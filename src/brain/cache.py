@@ -0,0 +1,242 @@
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+from configs.settings import settings
+from src.metrics import record_event
+from src.store import get_state_store
+
+# ==========================================
+# LLM 回复缓存 (按人设隔离)
+# ==========================================
+# 打招呼、常见问题、重复提问不必每次都请求服务商：
+#   - 键 = 规范化后的用户输入 + 人设 + 服务商/模型 + 上一轮对话的指纹
+#     (第一轮指纹为空，所以开场的问候、常见问题可以跨会话命中)
+#   - 内存 LRU + 状态存储 (磁盘 / SQLite，多副本共享)，超过 LLM_CACHE_TTL 过期
+#   - 同一个键并发请求只打一次上游 (single-flight)，其它请求等结果；
+#     同步 (serve) 和 asyncio (aserve) 调用方共用同一组进行中的请求
+#   - 依赖上下文的提问 (“刚才”、“它”、“继续”……) 自动绕过缓存
+# 命中的回复按句切开产出，调用方看到的仍是流式输出。
+
+# 指代上文、要求延续的说法：这类回答取决于对话内容，不缓存
+_CONTEXT_RE = re.compile(
+    r"(刚才|上面|之前|前面|继续|接着|还有呢|然后呢|为什么|怎么说|再说|换个|另一个|这个|那个|它|他|她|"
+    r"\b(it|that|this|those|these|again|more|why|continue)\b)",
+    re.IGNORECASE
+)
+_NORMALIZE_RE = re.compile(r"[\s\W_]+")
+# 命中时按句产出 (和真实流式一样，第一段就是完整的一句，可以直接送去 TTS)
+_PIECE_RE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;\n]*|[。！？!?；;\n]+")
+
+
+def _normalize(text):
+    """忽略大小写、空白和标点"""
+    return _NORMALIZE_RE.sub("", (text or "").lower())
+
+
+def _digest(*parts):
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """一次正在进行的上游请求，其它相同请求在这里等结果"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.reply = None
+
+
+class ResponseCache:
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or settings.LLM_CACHE_SIZE
+        self.ttl = ttl or settings.LLM_CACHE_TTL
+        self._memory = OrderedDict()   # key -> (写入时间, 回复)
+        self._flights = {}             # key -> _Flight
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    # === 键 ===
+    def key_for(self, brain, user_input, conversation):
+        """返回缓存键；这一轮不适合缓存时返回 None"""
+        if not settings.LLM_CACHE_ENABLED:
+            return None
+        question = _normalize(user_input)
+        if not question or len(question) > settings.LLM_CACHE_MAX_INPUT:
+            return None
+        data = conversation.to_dict()
+        if brain.provider == "google":
+            turns = data.get("gemini_history", [])[2:]
+        else:
+            turns = data["openai_history"][1:]
+        if turns and _CONTEXT_RE.search(user_input):
+            return None
+        # 上一轮的一问一答作为上下文指纹；摘要里的早期内容也算上下文
+        fingerprint = _digest(conversation.summary, *[_normalize(self._text(m)) for m in turns[-2:]]) if turns else ""
+        return _digest(brain.provider, brain.model_name, brain.persona, fingerprint, question)
+
+    @staticmethod
+    def _text(message):
+        if "content" in message:
+            return message["content"] or ""
+        return "".join(message.get("parts") or [])
+
+    # === 存取 ===
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if now - item[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return item[1]
+                self._memory.pop(key, None)
+        try:
+            data = get_state_store().get("llm_cache", key)
+        except Exception as e:
+            print(f"⚠️ [LLMCache] 读取缓存失败: {e}")
+            return None
+        if not data or now - data.get("created", 0) > self.ttl:
+            return None
+        self._remember(key, data["created"], data["reply"])
+        return data["reply"]
+
+    def put(self, key, reply):
+        now = time.time()
+        self._remember(key, now, reply)
+        try:
+            get_state_store().put("llm_cache", key, {"created": now, "reply": reply})
+        except Exception as e:
+            print(f"⚠️ [LLMCache] 写入缓存失败: {e}")
+        self._purge_store()
+
+    def _remember(self, key, created, reply):
+        with self._lock:
+            self._memory[key] = (created, reply)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _purge_store(self):
+        """磁盘上的过期条目由任意副本顺手清理，最多每分钟一次"""
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        try:
+            get_state_store().purge("llm_cache", self.ttl)
+        except Exception as e:
+            print(f"⚠️ [LLMCache] 清理过期缓存失败: {e}")
+
+    # === single-flight ===
+    def _join(self, key):
+        """返回 (缓存的回复, 进行中的请求, 是否由自己领头请求上游)"""
+        reply = self.get(key)
+        if reply is not None:
+            return reply, None, False
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                return None, flight, True
+        return None, flight, False
+
+    def _land(self, key, flight, text, ok):
+        """领头的请求结束：成功 (哪怕已经说了一半也算出错) 时写入缓存，唤醒等待者"""
+        try:
+            if ok and text.strip():
+                flight.reply = text.strip()
+                self.put(key, flight.reply)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    # === 对外接口 ===
+    def serve(self, key, produce, on_hit, succeeded):
+        """
+        生成器：命中缓存时按句产出缓存的回复 (并调用 on_hit 写入记忆)，
+        否则调用 produce() 产出真实回复，succeeded() 为真时写入缓存。
+        相同键并发时只有一个请求打到上游。
+        """
+        reply, flight, leader = self._join(key)
+        source = "cache"
+        if flight is not None and not leader:
+            source = "flight"
+            flight.event.wait(settings.LLM_TIMEOUT)
+            reply = flight.reply
+
+        if reply is not None:
+            record_event("llm_cache_hit", source=source)
+            on_hit(reply)
+            yield from self.fake_stream(reply)
+            return
+        if not leader:
+            # 领头的请求失败或被取消：自己请求一次 (不再合并)
+            yield from produce()
+            return
+
+        text = ""
+        ok = False
+        try:
+            for delta in produce():
+                text += delta
+                yield delta
+            ok = succeeded()
+        finally:
+            self._land(key, flight, text, ok)
+
+    async def aserve(self, key, produce, on_hit, succeeded):
+        """serve 的 asyncio 版：produce() 返回异步生成器，等待进行中的请求时不阻塞事件循环"""
+        reply, flight, leader = self._join(key)
+        source = "cache"
+        if flight is not None and not leader:
+            source = "flight"
+            await asyncio.get_running_loop().run_in_executor(None, flight.event.wait, settings.LLM_TIMEOUT)
+            reply = flight.reply
+
+        if reply is not None:
+            record_event("llm_cache_hit", source=source)
+            on_hit(reply)
+            for delta in self.fake_stream(reply):
+                yield delta
+            return
+        stream = produce()
+        if not leader:
+            try:
+                async for delta in stream:
+                    yield delta
+            finally:
+                await stream.aclose()
+            return
+
+        text = ""
+        ok = False
+        try:
+            async for delta in stream:
+                text += delta
+                yield delta
+            ok = succeeded()
+        finally:
+            # 提前关闭 (客户端断开) 时立刻关掉上游流
+            try:
+                await stream.aclose()
+            finally:
+                self._land(key, flight, text, ok)
+
+    @staticmethod
+    def fake_stream(reply):
+        yield from _PIECE_RE.findall(reply)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -1,8 +1,57 @@
 import os
+import json
+import time
+import asyncio
+import threading
 from dotenv import load_dotenv
 
+from configs.settings import settings
+from src.metrics import observe_latency
+from src.brain.memory import get_memory_manager
+from src.brain.cache import get_response_cache
+
 load_dotenv()
 
+class Conversation:
+    """
+    单个会话的对话记忆 (轻量)：
+    模型客户端由 LLMEngine 全局共享，每个用户只持有自己的历史
+    """
+    def __init__(self, persona):
+        # OpenAI/DeepSeek 使用列表维护记忆
+        self.openai_history = [{"role": "system", "content": persona}]
+        # Google Gemini 使用 ChatSession 对象维护记忆
+        self.gemini_chat = None
+        # 最近一次回复的首 token 延迟 (秒)
+        self.last_ttft = None
+        # 最近一次回复中途出错时的错误信息 (正常完成为 None)
+        self.last_error = None
+        # 早期对话的摘要 (src/brain/memory.py 按 token 预算折叠)
+        self.summary = ""
+        # 后台生成好、等下一轮开始时换进记忆的摘要: (被折叠的对话, 摘要)
+        self.pending_fold = None
+
+    def approx_bytes(self):
+        """粗略估算占用内存 (按文本字节数)，供会话管理器做内存预算"""
+        total = sum(len(m["content"].encode("utf-8")) for m in self.openai_history)
+        total += len(self.summary.encode("utf-8"))
+        if self.gemini_chat is not None:
+            for msg in getattr(self.gemini_chat, "history", []):
+                for part in getattr(msg, "parts", []):
+                    total += len(getattr(part, "text", "").encode("utf-8"))
+        return total
+
+    def to_dict(self):
+        """序列化为 JSON 字典，存入状态存储 (多副本共享会话)"""
+        data = {"openai_history": list(self.openai_history), "summary": self.summary}
+        if self.gemini_chat is not None:
+            data["gemini_history"] = [
+                {"role": msg.role, "parts": [getattr(p, "text", "") for p in msg.parts]}
+                for msg in self.gemini_chat.history
+            ]
+        return data
+
+
 class LLMEngine:
     def __init__(self):
         self.provider = os.getenv("LLM_PROVIDER", "openai")
@@ -10,63 +59,538 @@ class LLMEngine:
         self.base_url = os.getenv("LLM_BASE_URL")
         self.model_name = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
         self.persona = os.getenv("DIGITAL_HUMAN_PERSONA", "你是一个数字人。")
+        # 可选：更快更便宜的模型先说一句开场白 (同一服务商、同一套 Key)
+        self.fast_model_name = os.getenv("LLM_FAST_MODEL", "")
         
         if not self.api_key:
             raise ValueError("❌ 未配置 API Key")
 
-        # === 记忆初始化 ===
-        # OpenAI/DeepSeek 使用列表维护记忆
-        self.openai_history = [{"role": "system", "content": self.persona}]
-        
-        # Google Gemini 使用 ChatSession 对象维护记忆
-        self.gemini_chat = None 
-
-        print(f"[Brain] 初始化: {self.provider} / {self.model_name}")
+        print(f"[Brain] 初始化: {self.provider} / {self.model_name}"
+              + (f" (开场: {self.fast_model_name})" if self.fast_model_name else ""))
 
-        # === 客户端初始化 ===
+        # === 客户端初始化 (所有会话共享) ===
+        self.aclient = None
         if self.provider == "google":
             import google.generativeai as genai
             genai.configure(api_key=self.api_key)
             self.client = genai.GenerativeModel(self.model_name)
-            # 启动 Gemini 的聊天模式 (它会自动管理 history)
-            self.gemini_chat = self.client.start_chat(history=[
-                {"role": "user", "parts": [f"System Prompt: {self.persona}"]},
-                {"role": "model", "parts": ["OK, I understand my persona."]}
-            ])
+            self.fast_client = genai.GenerativeModel(self.fast_model_name) if self.fast_model_name else None
         else:
             from openai import OpenAI
             self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            # 异步客户端：共享连接池 + keep-alive，请求在后台事件循环里并发，不各占一个线程
+            if settings.LLM_ASYNC:
+                from src.brain.aio import AsyncLLMClient
+                self.aclient = AsyncLLMClient(self.api_key, self.base_url)
+
+        # === 多端点路由 (可选) ===
+        self.router = self._build_router()
+
+        # === 记忆初始化 ===
+        # 默认会话：命令行等单用户场景直接使用
+        self.conversation = self.new_conversation()
+
+    # 兼容旧代码：直接访问默认会话的记忆
+    @property
+    def openai_history(self):
+        return self.conversation.openai_history
+
+    @property
+    def gemini_chat(self):
+        return self.conversation.gemini_chat
 
-    def think(self, user_input: str) -> str:
+    def new_conversation(self):
+        """创建一份新的对话记忆 (不重新创建客户端)"""
+        conversation = Conversation(self.persona)
+        if self.provider == "google":
+            # 启动 Gemini 的聊天模式 (它会自动管理 history)
+            conversation.gemini_chat = self.client.start_chat(history=self.persona_history())
+        return conversation
+
+    def persona_history(self, summary=""):
+        """Gemini 没有 system 角色：人设 (和早期对话摘要) 作为开头的一问一答"""
+        prompt = f"System Prompt: {self.persona}"
+        if summary:
+            prompt += f"\n\n之前对话的摘要：{summary}"
+        return [
+            {"role": "user", "parts": [prompt]},
+            {"role": "model", "parts": ["OK, I understand my persona."]}
+        ]
+
+    def restore_conversation(self, data):
+        """从 Conversation.to_dict() 的结果恢复对话记忆"""
+        conversation = Conversation(self.persona)
+        conversation.openai_history = list(data.get("openai_history") or conversation.openai_history)
+        conversation.summary = data.get("summary") or ""
+        if self.provider == "google":
+            history = data.get("gemini_history")
+            if history:
+                conversation.gemini_chat = self.client.start_chat(history=history)
+            else:
+                conversation.gemini_chat = self.new_conversation().gemini_chat
+        return conversation
+
+    def think(self, user_input: str, conversation: Conversation = None) -> str:
+        """
+        非流式：等完整回复后一次性返回 (兼容旧调用方)
+        :param conversation: 会话记忆，None 时使用默认会话
+        """
+        return "".join(self.think_stream(user_input, conversation)).strip()
+
+    def think_stream(self, user_input: str, conversation: Conversation = None):
+        """
+        流式思考：逐段产出增量文本
+        - 流正常结束后把完整回复写入记忆
+        - 中途被关闭 (轮次取消) 时只记下已经说出的部分，记忆保持 一问一答 交替
+        - 首 token 延迟记在 conversation.last_ttft，并计入 metrics 的 brain_ttft
+        """
+        conversation = conversation or self.conversation
+        cache = get_response_cache()
+        key = cache.key_for(self, user_input, conversation)
+        if key is None:
+            yield from self._think_upstream(user_input, conversation)
+            return
+        # 命中缓存 / 合并到相同的进行中请求：直接把回复写进记忆，切片产出
+        yield from cache.serve(
+            key,
+            lambda: self._think_upstream(user_input, conversation),
+            lambda reply: self.remember(conversation, user_input, reply),
+            lambda: conversation.last_error is None
+        )
+
+    def _think_upstream(self, user_input, conversation):
         print(f"[Brain] 思考中 ({self.provider}): {user_input}")
 
+        # === 分支 A: Google Gemini (有上下文) ===
+        if self.provider == "google":
+            yield from self._stream_gemini(user_input, conversation)
+        # === 分支 B: OpenAI / DeepSeek (有上下文) ===
+        else:
+            yield from self._stream_openai(user_input, conversation, self.model_name)
+
+    def _observe_ttft(self, conversation, t0):
+        conversation.last_ttft = time.monotonic() - t0
+        observe_latency("brain_ttft", conversation.last_ttft)
+        print(f"[Brain] 首 token: {conversation.last_ttft * 1000:.0f} ms")
+
+    def _stream_openai(self, user_input, conversation, model, extra_messages=(), prefix=""):
+        """
+        :param extra_messages: 只发给模型、不写入记忆的附加消息 (例如续写指令)
+        :param prefix: 已经说出的开头，写入记忆时拼在回复前面
+        """
+        memory = get_memory_manager()
+        memory.prepare(self, conversation)
+        history = conversation.openai_history
+        # 1. 手动把用户的话加入历史列表
+        history.append({"role": "user", "content": user_input})
+        reply = ""
+        stream = None
+        conversation.last_error = None
+        t0 = time.monotonic()
         try:
-            # === 分支 A: Google Gemini (有上下文) ===
-            if self.provider == "google":
-                # 直接发送消息，Gemini 对象内部会自动 append history
-                response = self.gemini_chat.send_message(user_input)
-                return response.text
+            # 2. 发送整个列表，stream=True 边生成边返回
+            stream = self._openai_stream(
+                routed=model == self.model_name,
+                model=model,
+                messages=memory.build_messages(conversation) + list(extra_messages), # 人设 + 摘要 + 最近几轮 (按 token 预算)
+                temperature=0.7,
+                max_tokens=200
+            )
+            for delta in stream:
+                if not reply:
+                    self._observe_ttft(conversation, t0)
+                reply += delta
+                yield delta
+        except Exception as e:
+            error_msg = f"大脑短路: {str(e)}"
+            print(error_msg)
+            conversation.last_error = error_msg
+            if not reply and not prefix:
+                yield error_msg
+        finally:
+            # 关闭流会断开上游连接，服务商停止生成
+            if stream is not None:
+                stream.close()
+            # 3. 手动把 AI 的话加入历史列表
+            self._finish_openai(history, prefix + reply)
+            memory.after_turn(self, conversation)
+
+    @staticmethod
+    def _finish_openai(history, full_reply):
+        """一个字都没说出来就撤回用户这句，保持 一问一答 交替"""
+        full_reply = full_reply.strip()
+        if full_reply:
+            history.append({"role": "assistant", "content": full_reply})
+        elif history and history[-1]["role"] == "user":
+            history.pop()
 
-            # === 分支 B: OpenAI / DeepSeek (有上下文) ===
+    async def athink_stream(self, user_input: str, conversation: Conversation = None):
+        """
+        asyncio 版 think_stream：在 FastAPI 等事件循环里直接使用，不占线程
+        OpenAI 协议走共享连接池；Gemini / 未开启 LLM_ASYNC / 多端点路由时在线程池里逐段拉取同步流
+        """
+        conversation = conversation or self.conversation
+        if not self.aclient or self.router:
+            loop = asyncio.get_running_loop()
+            generator = self.think_stream(user_input, conversation)
+            try:
+                while True:
+                    delta = await loop.run_in_executor(None, next, generator, None)
+                    if delta is None:
+                        return
+                    yield delta
+            finally:
+                try:
+                    generator.close()
+                except ValueError:
+                    # 取消时生成器还在线程池里执行，等它自己跑完
+                    pass
+
+        cache = get_response_cache()
+        key = cache.key_for(self, user_input, conversation)
+        if key is None:
+            generator = self._athink_upstream(user_input, conversation)
+        else:
+            # 和同步路径共用 single-flight：相同问题并发时只有一个请求打到上游
+            generator = cache.aserve(
+                key,
+                lambda: self._athink_upstream(user_input, conversation),
+                lambda reply: self.remember(conversation, user_input, reply),
+                lambda: conversation.last_error is None
+            )
+        try:
+            async for delta in generator:
+                yield delta
+        finally:
+            await generator.aclose()
+
+    async def _athink_upstream(self, user_input, conversation):
+        print(f"[Brain] 思考中 ({self.provider}, async): {user_input}")
+        memory = get_memory_manager()
+        memory.prepare(self, conversation)
+        history = conversation.openai_history
+        history.append({"role": "user", "content": user_input})
+        reply = ""
+        conversation.last_error = None
+        t0 = time.monotonic()
+        try:
+            async for delta in self.aclient.astream(
+                model=self.model_name,
+                messages=memory.build_messages(conversation),
+                temperature=0.7,
+                max_tokens=200
+            ):
+                if not reply:
+                    self._observe_ttft(conversation, t0)
+                reply += delta
+                yield delta
+        except Exception as e:
+            error_msg = f"大脑短路: {str(e)}"
+            print(error_msg)
+            conversation.last_error = error_msg
+            if not reply:
+                yield error_msg
+        finally:
+            self._finish_openai(history, reply)
+            memory.after_turn(self, conversation)
+
+    def _stream_gemini(self, user_input, conversation):
+        memory = get_memory_manager()
+        memory.prepare(self, conversation)
+        chat = conversation.gemini_chat
+        reply = ""
+        response = None
+        finished = False
+        conversation.last_error = None
+        t0 = time.monotonic()
+        try:
+            # Gemini 对象内部会自动 append history (前提是流被完整读完)
+            response = chat.send_message(user_input, stream=True)
+            for chunk in response:
+                delta = self._gemini_text(chunk)
+                if not delta:
+                    continue
+                if not reply:
+                    self._observe_ttft(conversation, t0)
+                reply += delta
+                yield delta
+            finished = True
+        except Exception as e:
+            error_msg = f"大脑短路: {str(e)}"
+            print(error_msg)
+            conversation.last_error = error_msg
+            if not reply:
+                yield error_msg
+        finally:
+            if response is not None and not finished:
+                # 流没读完 (取消或出错)，ChatSession 的历史是半截状态：回退后手动补上已说出的部分
+                try:
+                    chat.rewind()
+                except Exception:
+                    pass
+                if reply.strip():
+                    self.remember(conversation, user_input, reply.strip())
+            memory.after_turn(self, conversation)
+
+    @staticmethod
+    def _gemini_text(chunk):
+        # 被安全策略拦截等情况下 chunk 没有文本，访问 .text 会抛异常
+        try:
+            return chunk.text
+        except Exception:
+            return ""
+
+    # === 两级生成：快模型开场 + 主模型续写 ===
+    def think_with_opener(self, user_input: str, conversation: Conversation = None):
+        """
+        先用 LLM_FAST_MODEL 生成一句简短的开场白立刻产出 (TTS 可以马上开始)，
+        再让主模型在已说出开场白的前提下流式接着回答。
+        记忆里只保存一条完整回复 (开场白 + 续写)。
+        """
+        conversation = conversation or self.conversation
+        cache = get_response_cache()
+        key = cache.key_for(self, user_input, conversation)
+        if key is not None and cache.get(key) is not None:
+            # 整段回复已经缓存，不需要开场白
+            yield from self.think_stream(user_input, conversation)
+            return
+        t0 = time.monotonic()
+        opener = self._fast_opener(user_input, conversation)
+        if not opener:
+            yield from self.think_stream(user_input, conversation)
+            return
+        self._observe_ttft(conversation, t0)
+        yield opener
+        yield from self._continue_after(user_input, opener, conversation)
+
+    def _fast_opener(self, user_input, conversation):
+        instruction = (
+            "请先用一句简短自然、符合你人设的话回应用户 (不超过20个字，以句号、问号或感叹号结尾)，"
+            "例如确认问题或表达态度，不要展开具体内容。只输出这一句话。"
+        )
+        try:
+            if self.provider == "google":
+                history = conversation.to_dict().get("gemini_history", [])[-6:]
+                response = self.fast_client.generate_content(
+                    history + [{"role": "user", "parts": [f"{user_input}\n\n({instruction})"]}],
+                    generation_config={"max_output_tokens": 40, "temperature": 0.7}
+                )
+                opener = response.text
             else:
-                # 1. 手动把用户的话加入历史列表
-                self.openai_history.append({"role": "user", "content": user_input})
-                
-                # 2. 发送整个列表
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=self.openai_history, # <--- 关键：这里传的是整个历史
+                # 只带人设和最近几轮，开场白不需要完整上下文
+                messages = conversation.openai_history[:1] + conversation.openai_history[1:][-6:]
+                messages = messages + [
+                    {"role": "user", "content": user_input},
+                    {"role": "system", "content": instruction}
+                ]
+                opener = self._openai_complete(
+                    model=self.fast_model_name,
+                    messages=messages,
                     temperature=0.7,
-                    max_tokens=200
+                    max_tokens=40
                 )
-                reply_text = response.choices[0].message.content.strip()
+            return (opener or "").strip()
+        except Exception as e:
+            print(f"⚠️ [Brain] 开场白生成失败，直接使用主模型: {e}")
+            return ""
 
-                # 3. 手动把 AI 的话加入历史列表
-                self.openai_history.append({"role": "assistant", "content": reply_text})
-                
-                return reply_text
+    def _continue_after(self, user_input, opener, conversation):
+        """主模型流式续写：开场白已经播出，只补后面的内容"""
+        instruction = f"你已经说出了开场白“{opener}”，请直接接着往下说，不要重复开场白。"
+        if self.provider != "google":
+            yield from self._stream_openai(
+                user_input, conversation, self.model_name,
+                extra_messages=[
+                    {"role": "assistant", "content": opener},
+                    {"role": "system", "content": instruction}
+                ],
+                prefix=opener
+            )
+            return
 
+        history = conversation.to_dict().get("gemini_history", [])
+        rest = ""
+        try:
+            response = self.client.generate_content(history + [
+                {"role": "user", "parts": [user_input]},
+                {"role": "model", "parts": [opener]},
+                {"role": "user", "parts": [f"({instruction})"]}
+            ], stream=True)
+            for chunk in response:
+                delta = self._gemini_text(chunk)
+                if delta:
+                    rest += delta
+                    yield delta
         except Exception as e:
-            error_msg = f"大脑短路: {str(e)}"
-            print(error_msg)
-            return error_msg
\ No newline at end of file
+            print(f"大脑短路: {str(e)}")
+        finally:
+            # 开场白已经说出去了，记忆里至少保留它
+            self.remember(conversation, user_input, (opener + rest).strip())
+
+    def warmup(self):
+        """发一个不消耗 token 的请求，提前建立到服务商的连接 (DNS / TLS / 连接池)"""
+        if self.provider == "google":
+            self.client.count_tokens("ping")
+        elif self.aclient:
+            self.aclient.prewarm(wait=True)
+        else:
+            self.client.models.list()
+
+    def prewarm(self):
+        """启动预热：后台建立连接，不阻塞启动流程"""
+        if self.aclient:
+            self.aclient.prewarm()
+        else:
+            threading.Thread(target=self._safe_warmup, daemon=True).start()
+
+    def close(self):
+        """释放异步客户端 (连接池 + 事件循环线程)；在途请求结束后才真正关闭"""
+        clients = [self.aclient] if self.aclient else []
+        if self.router:
+            clients += [e.aclient for e in self.router.endpoints if e.aclient and e.aclient is not self.aclient]
+        for aclient in clients:
+            aclient.close()
+
+    def _safe_warmup(self):
+        try:
+            self.warmup()
+        except Exception as e:
+            print(f"⚠️ [Brain] LLM 预热失败: {e}")
+
+    def _build_router(self):
+        """配置了 LLM_ENDPOINTS 时，主端点 + 额外端点组成路由 (主对话记忆必须是 OpenAI 协议格式)"""
+        from src.brain.router import Endpoint, LLMRouter, load_endpoint_configs
+        configs = load_endpoint_configs()
+        if not configs:
+            return None
+        if self.provider == "google":
+            print("⚠️ [Brain] 多端点路由需要主服务商为 OpenAI 协议 (Gemini 的记忆在 ChatSession 里)，已忽略 LLM_ENDPOINTS")
+            return None
+        endpoints = [Endpoint("primary", "openai", self.model_name, client=self.client, aclient=self.aclient)]
+        for i, config in enumerate(configs):
+            try:
+                endpoints.append(Endpoint(
+                    config.get("name") or f"endpoint{i + 1}", config.get("provider", "openai"),
+                    config["model"], api_key=config.get("api_key"), base_url=config.get("base_url")
+                ))
+            except Exception as e:
+                print(f"⚠️ [Brain] 端点 {config.get('name') or i + 1} 初始化失败: {e}")
+        print(f"[Brain] 多端点路由: {', '.join(e.name for e in endpoints)}")
+        return LLMRouter(endpoints)
+
+    # === OpenAI 协议调用：有异步客户端时走共享连接池 ===
+    def _openai_stream(self, routed=False, **kwargs):
+        """:param routed: 主模型的回复走多端点路由 (开场白、摘要等辅助调用不走)"""
+        if routed and self.router:
+            kwargs.pop("model")
+            return self.router.stream(**kwargs)
+        if self.aclient:
+            return self.aclient.stream(**kwargs)
+        return self._sync_stream(**kwargs)
+
+    def _sync_stream(self, **kwargs):
+        stream = self.client.chat.completions.create(stream=True, **kwargs)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    def _openai_complete(self, **kwargs):
+        if self.aclient:
+            return self.aclient.complete(timeout=settings.LLM_TIMEOUT, **kwargs)
+        response = self.client.chat.completions.create(**kwargs)
+        return response.choices[0].message.content
+
+    def remember(self, conversation, user_input, reply_text):
+        """把一问一答直接写入记忆 (回复来自缓存、没有真正调用模型时使用)"""
+        conversation = conversation or self.conversation
+        if self.provider == "google":
+            conversation.gemini_chat.history = list(conversation.gemini_chat.history) + [
+                {"role": "user", "parts": [user_input]},
+                {"role": "model", "parts": [reply_text]}
+            ]
+        else:
+            conversation.openai_history.append({"role": "user", "content": user_input})
+            conversation.openai_history.append({"role": "assistant", "content": reply_text})
+        get_memory_manager().after_turn(self, conversation)
+
+    def summarize(self, previous_summary, messages, max_chars=300):
+        """把早期对话 (和已有摘要) 压缩成一段摘要；有快模型时用快模型"""
+        transcript = "\n".join(
+            f"{'用户' if m['role'] == 'user' else '你'}: {m['content']}" for m in messages
+        )
+        instruction = (
+            f"请把下面的对话整理成一段不超过 {max_chars} 字的摘要，保留用户的身份、偏好、已确认的事实和没聊完的话题。"
+            "只输出摘要本身。"
+        )
+        if previous_summary:
+            instruction += f"\n\n已有摘要：{previous_summary}"
+        prompt = f"{instruction}\n\n对话：\n{transcript}"
+        if self.provider == "google":
+            client = self.fast_client or self.client
+            return (client.generate_content(prompt).text or "").strip()
+        return (self._openai_complete(
+            model=self.fast_model_name or self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=max_chars * 2
+        ) or "").strip()
+
+    def predict_followups(self, conversation=None, count=2):
+        """
+        预测用户接下来最可能问的问题，并按人设给出回答 (不写入记忆)
+        返回 [{"question": ..., "answer": ...}]，失败返回空列表
+        """
+        conversation = conversation or self.conversation
+        instruction = (
+            f"根据以上对话，预测用户接下来最可能问的 {count} 个问题，并以你的身份分别简短作答。"
+            '只输出 JSON 数组，不要其它内容，格式: [{"question": "...", "answer": "..."}]'
+        )
+        try:
+            if self.provider == "google":
+                history = conversation.to_dict().get("gemini_history", [])
+                response = self.client.generate_content(history + [{"role": "user", "parts": [instruction]}])
+                text = response.text
+            else:
+                messages = get_memory_manager().build_messages(conversation) + [{"role": "user", "content": instruction}]
+                text = self._openai_complete(
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=400
+                )
+            items = json.loads(text[text.index("["):text.rindex("]") + 1])
+        except Exception as e:
+            print(f"⚠️ [Brain] 预测后续问题失败: {e}")
+            return []
+        return [
+            {"question": str(item["question"]).strip(), "answer": str(item["answer"]).strip()}
+            for item in items[:count]
+            if isinstance(item, dict) and item.get("question") and item.get("answer")
+        ]
+
+
+# LLM 客户端全局共享；每个会话的对话记忆由 src/session.py 管理
+_brain_instance = None
+_brain_lock = threading.Lock()
+
+def get_brain():
+    global _brain_instance
+    with _brain_lock:
+        if _brain_instance is None:
+            _brain_instance = LLMEngine()
+    return _brain_instance
+
+
+def reset_brain():
+    """
+    丢弃大脑单例 (配置页保存后调用)，下次 get_brain() 按新配置重建
+    旧实例的连接池等在途请求结束后关闭
+    """
+    global _brain_instance
+    with _brain_lock:
+        old, _brain_instance = _brain_instance, None
+    if old is not None:
+        old.close()
@@ -0,0 +1,170 @@
+import re
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from configs.settings import settings
+
+# ==========================================
+# 对话记忆的 token 预算
+# ==========================================
+# 每轮发给模型的提示 = 人设 + 早期对话摘要 + 最近几轮原文，长度基本不随会话变长：
+#   - 用本地分词器计数 (装了 tiktoken 用 tiktoken，否则按 中文一字一 token / 英文四字符一 token 估算)
+#   - 人设与最近 MEMORY_KEEP_TURNS 轮原样保留
+#   - 超出预算的早期对话在后台 (BATCH 优先级) 折叠进摘要，下一轮开始时再替换进记忆，不卡当前轮
+#   - 摘要还没出来时，放不下的早期对话先不发 (OpenAI 协议按预算截断提示)
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+# 每条消息的格式开销 (role、分隔符)
+MESSAGE_OVERHEAD = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """懒加载 tiktoken (首次加载要读 BPE 词表，较慢)；没装或加载失败返回 False"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(settings.MEMORY_TOKENIZER)
+            except Exception as e:
+                print(f"⚠️ [Memory] 未使用 tiktoken ({e})，按字符数估算 token")
+                _encoding = False
+        return _encoding
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_messages(messages):
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def pretokenize(text):
+    """输入时预热：提前加载分词器，并把输入中的文本计数结果放进缓存"""
+    count_tokens(text)
+
+
+class MemoryManager:
+    def __init__(self, budget=None, keep_turns=None, summary_chars=None):
+        self.budget = budget or settings.MEMORY_TOKEN_BUDGET
+        self.keep_messages = 2 * (keep_turns or settings.MEMORY_KEEP_TURNS)
+        self.summary_chars = summary_chars or settings.MEMORY_SUMMARY_CHARS
+        self._running = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory")
+
+    # === 统一视图：人设之后的对话 [{"role", "content"}] ===
+    @staticmethod
+    def _turns(brain, conversation):
+        if brain.provider == "google":
+            # 前两条是人设 (user: System Prompt / model: OK)
+            return [
+                {"role": "assistant" if m["role"] == "model" else "user", "content": "".join(m["parts"])}
+                for m in conversation.to_dict().get("gemini_history", [])[2:]
+            ]
+        return list(conversation.openai_history[1:])
+
+    def _head(self, conversation):
+        head = list(conversation.openai_history[:1])
+        if conversation.summary:
+            head.append({"role": "system", "content": f"之前对话的摘要：{conversation.summary}"})
+        return head
+
+    # === 热路径 ===
+    def build_messages(self, conversation):
+        """OpenAI 协议：按预算拼出本轮提示 (最近几轮一定保留，更早的放得下才放)"""
+        head = self._head(conversation)
+        turns = conversation.openai_history[1:]
+        if not settings.MEMORY_ENABLED:
+            return head + list(turns)
+        remaining = self.budget - count_messages(head)
+        tail = []
+        for message in reversed(turns):
+            cost = count_messages([message])
+            if len(tail) >= self.keep_messages and cost > remaining:
+                break
+            tail.append(message)
+            remaining -= cost
+        tail.reverse()
+        # 截断点落在回答上时去掉它，提示从用户的话开始
+        while len(tail) > 1 and tail[0]["role"] == "assistant":
+            tail.pop(0)
+        return head + tail
+
+    def prepare(self, brain, conversation):
+        """每轮开始前调用：把后台生成好的摘要换进记忆 (此时没有生成在进行，不会和流式写入冲突)"""
+        pending = conversation.pending_fold
+        if pending is None:
+            return
+        conversation.pending_fold = None
+        snapshot, summary = pending
+        if self._turns(brain, conversation)[:len(snapshot)] != snapshot:
+            # 记忆在摘要期间被清空或替换过，作废
+            return
+        conversation.summary = summary
+        if brain.provider == "google":
+            history = conversation.to_dict().get("gemini_history", [])
+            chat = conversation.gemini_chat
+            chat.history = brain.persona_history(summary) + history[2 + len(snapshot):]
+        else:
+            del conversation.openai_history[1:1 + len(snapshot)]
+        print(f"🧠 [Memory] 已把 {len(snapshot)} 条早期对话折叠进摘要")
+
+    # === 后台摘要 ===
+    def after_turn(self, brain, conversation):
+        """每轮结束后调用：超出预算就在后台把早期对话折叠进摘要"""
+        if not settings.MEMORY_ENABLED or conversation.pending_fold is not None:
+            return
+        turns = self._turns(brain, conversation)
+        older = turns[:-self.keep_messages] if len(turns) > self.keep_messages else []
+        # 折叠点对齐到完整的一问一答
+        if len(older) % 2:
+            older = older[:-1]
+        if not older:
+            return
+        total = count_messages(self._head(conversation)) + count_messages(turns)
+        if total <= self.budget:
+            return
+        with self._lock:
+            if id(conversation) in self._running:
+                return
+            self._running.add(id(conversation))
+        self._executor.submit(self._summarize, brain, conversation, older)
+
+    def _summarize(self, brain, conversation, snapshot):
+        from src.scheduler import stage_slot, BATCH
+        try:
+            # 和预取一样走 BATCH 优先级，不和用户正在等的对话抢 brain 阶段
+            with stage_slot("brain", BATCH):
+                summary = brain.summarize(conversation.summary, snapshot, self.summary_chars)
+            if summary:
+                conversation.pending_fold = (snapshot, summary)
+        except Exception as e:
+            print(f"⚠️ [Memory] 摘要生成失败，下一轮再试: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(id(conversation))
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_memory_manager():
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = MemoryManager()
+        return _memory
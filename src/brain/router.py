@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+from configs.settings import settings
+from src.metrics import record_event, observe_latency, percentile
+
+# ==========================================
+# 多服务商路由 + 对冲请求
+# ==========================================
+# LLM_ENDPOINTS 里配置多个端点 (OpenAI 协议 / Gemini)，连同 LLM_* 配置的主端点一起参与路由：
+#   - 每个端点记录首 token 延迟 (EWMA + 最近样本) 和错误率 (EWMA)
+#   - 每次请求先发给当前最快的端点
+#   - 超过该端点首 token 延迟的 LLM_HEDGE_PERCENTILE 分位还没出字，再向第二快的端点发一份，
+#     谁先出首 token 用谁，另一个立刻取消
+#   - 端点报错时自动换下一个，全部失败才算 “大脑短路”
+# 被取消的请求会立刻断开上游连接 (异步客户端停止读取；同步 OpenAI 流关闭响应；Gemini 取消 gRPC 流)，
+# 不会等到它的首 token 才停，避免白白计费。
+# 首 token 之后的中途出错不再切换 (已经说出去的内容无法撤回)。
+#
+# LLM_ENDPOINTS 可以是 JSON 字符串或 JSON 文件路径，例如：
+#   [{"name": "deepseek", "provider": "openai", "base_url": "https://api.deepseek.com",
+#     "model": "deepseek-chat", "api_key": "sk-..."},
+#    {"name": "gemini", "provider": "google", "model": "gemini-1.5-flash", "api_key_env": "GEMINI_API_KEY"}]
+
+
+def load_endpoint_configs(value=None):
+    value = (settings.LLM_ENDPOINTS if value is None else value).strip()
+    if not value:
+        return []
+    if not value.startswith("["):
+        with open(value, "r", encoding="utf-8") as f:
+            value = f.read()
+    configs = json.loads(value)
+    for config in configs:
+        if not config.get("api_key") and config.get("api_key_env"):
+            config["api_key"] = os.getenv(config["api_key_env"])
+    return configs
+
+
+class Endpoint:
+    def __init__(self, name, provider, model, api_key=None, base_url=None, client=None, aclient=None):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.client = client
+        self.aclient = aclient
+        self.ttft = None                 # 首 token 延迟 EWMA (秒)
+        self.error_rate = 0.0            # 错误率 EWMA
+        self.samples = deque(maxlen=200) # 最近的首 token 延迟，用来算对冲阈值
+        self._lock = threading.Lock()
+
+        if client is not None:
+            return
+        if provider == "google":
+            # 每个端点一个独立客户端：genai.configure() 是进程全局的，多个 Gemini 端点会互相覆盖 Key
+            from google.ai import generativelanguage as glm
+            self.client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        else:
+            from openai import OpenAI
+            self.client = OpenAI(api_key=api_key, base_url=base_url)
+            if settings.LLM_ASYNC:
+                from src.brain.aio import AsyncLLMClient
+                self.aclient = AsyncLLMClient(api_key, base_url)
+
+    # === 统计 ===
+    def observe_ttft(self, seconds):
+        alpha = settings.LLM_ROUTER_ALPHA
+        with self._lock:
+            self.ttft = seconds if self.ttft is None else alpha * seconds + (1 - alpha) * self.ttft
+            self.samples.append(seconds)
+            self.error_rate = (1 - alpha) * self.error_rate
+        observe_latency(f"brain_ttft_{self.name}", seconds)
+
+    def observe_loss(self, seconds):
+        """对冲输了被取消：它的首 token 延迟至少是 seconds"""
+        with self._lock:
+            if self.ttft is None or seconds > self.ttft:
+                self.ttft = seconds if self.ttft is None else \
+                    settings.LLM_ROUTER_ALPHA * seconds + (1 - settings.LLM_ROUTER_ALPHA) * self.ttft
+
+    def observe_error(self):
+        alpha = settings.LLM_ROUTER_ALPHA
+        with self._lock:
+            self.error_rate = alpha + (1 - alpha) * self.error_rate
+
+    def score(self, prior):
+        """越小越好：延迟按错误率加罚；没有样本的端点用先验值，保证会被试到"""
+        ttft = self.ttft if self.ttft is not None else prior
+        return ttft * (1 + settings.LLM_ROUTER_ERROR_PENALTY * self.error_rate)
+
+    def hedge_after(self):
+        """等首 token 多久后发对冲请求"""
+        with self._lock:
+            samples = list(self.samples)
+        if len(samples) < 10:
+            return settings.LLM_HEDGE_DEFAULT
+        return max(settings.LLM_HEDGE_MIN, percentile(samples, settings.LLM_HEDGE_PERCENTILE))
+
+    def stats(self):
+        return {
+            "name": self.name, "provider": self.provider, "model": self.model,
+            "ttft": round(self.ttft, 3) if self.ttft is not None else None,
+            "error_rate": round(self.error_rate, 3), "samples": len(self.samples)
+        }
+
+    # === 请求 ===
+    def open_stream(self, messages, cancel, on_open=None, temperature=0.7, max_tokens=200):
+        """
+        返回逐段产出增量文本的生成器 (OpenAI 协议格式的 messages)
+        同步流建立后把 “断开上游” 的函数交给 on_open，取消方可以在别的线程里直接调用
+        """
+        on_open = on_open or (lambda close: None)
+        if self.provider == "google":
+            return self._gemini_stream(messages, on_open, temperature, max_tokens)
+        if self.aclient:
+            return self.aclient.stream(cancel=cancel, model=self.model, messages=messages,
+                                       temperature=temperature, max_tokens=max_tokens)
+        return self._openai_stream(messages, on_open, temperature, max_tokens)
+
+    def _openai_stream(self, messages, on_open, temperature, max_tokens):
+        stream = self.client.chat.completions.create(model=self.model, messages=messages,
+                                                     temperature=temperature, max_tokens=max_tokens, stream=True)
+        on_open(stream.close)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    def _gemini_stream(self, messages, on_open, temperature, max_tokens):
+        from google.ai import generativelanguage as glm
+        # system 消息合并成 system_instruction，assistant 对应 model
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        request = {
+            "model": self.model if self.model.startswith("models/") else f"models/{self.model}",
+            "contents": [
+                glm.Content(role="model" if m["role"] == "assistant" else "user", parts=[glm.Part(text=m["content"])])
+                for m in messages if m["role"] != "system"
+            ],
+            "generation_config": glm.GenerationConfig(temperature=temperature, max_output_tokens=max_tokens),
+        }
+        if system:
+            request["system_instruction"] = glm.Content(parts=[glm.Part(text=system)])
+        stream = self.client.stream_generate_content(request=glm.GenerateContentRequest(**request))
+        on_open(stream.cancel)
+        try:
+            for chunk in stream:
+                if not chunk.candidates:
+                    continue
+                text = "".join(part.text for part in chunk.candidates[0].content.parts)
+                if text:
+                    yield text
+        finally:
+            stream.cancel()
+
+
+class _Attempt:
+    def __init__(self, endpoint, hedge):
+        self.endpoint = endpoint
+        self.hedge = hedge
+        self.cancel = threading.Event()
+        self.t0 = time.monotonic()
+        self._close = None
+        self._lock = threading.Lock()
+
+    def bind(self, close):
+        """记下断开上游的函数；已经被取消的话立刻断开"""
+        with self._lock:
+            self._close = close
+            cancelled = self.cancel.is_set()
+        if cancelled:
+            close()
+
+    def stop(self):
+        """取消：异步流靠 cancel 事件停止，同步流直接断开连接 (读取线程会随即报错退出)"""
+        with self._lock:
+            if self.cancel.is_set():
+                return
+            self.cancel.set()
+            close = self._close
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+
+class LLMRouter:
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+
+    def ranked(self):
+        known = [e.ttft for e in self.endpoints if e.ttft is not None]
+        prior = min(known) if known else 0.0
+        return sorted(self.endpoints, key=lambda e: e.score(prior))
+
+    def stats(self):
+        return [e.stats() for e in self.endpoints]
+
+    def _start(self, endpoint, hedge, messages, kwargs, events):
+        attempt = _Attempt(endpoint, hedge)
+
+        def pump():
+            generator = None
+            try:
+                generator = endpoint.open_stream(messages, attempt.cancel, on_open=attempt.bind, **kwargs)
+                for delta in generator:
+                    if attempt.cancel.is_set():
+                        return
+                    events.put((attempt, "delta", delta))
+                events.put((attempt, "end", None))
+            except Exception as e:
+                # 被取消时断开连接引起的报错不算端点出错
+                if not attempt.cancel.is_set():
+                    events.put((attempt, "error", e))
+            finally:
+                if generator is not None:
+                    generator.close()
+
+        threading.Thread(target=pump, daemon=True, name=f"llm-{endpoint.name}").start()
+        return attempt
+
+    def stream(self, messages, temperature=0.7, max_tokens=200):
+        """同步生成器：路由 + 对冲，产出胜出端点的增量文本"""
+        kwargs = {"temperature": temperature, "max_tokens": max_tokens}
+        candidates = self.ranked()
+        events = queue.Queue()
+        running = [self._start(candidates.pop(0), False, messages, kwargs, events)]
+        hedges = 0
+        hedge_at = running[0].t0 + running[0].endpoint.hedge_after()
+        deadline = running[0].t0 + settings.LLM_TIMEOUT
+        last_error = None
+        winner = None
+
+        try:
+            # 1. 等首 token：超过阈值发对冲，出错换下一个端点
+            while winner is None:
+                now = time.monotonic()
+                can_hedge = candidates and hedges < settings.LLM_HEDGE_MAX
+                wait = (hedge_at if can_hedge else deadline) - now
+                try:
+                    attempt, kind, value = events.get(timeout=max(0.0, wait))
+                except queue.Empty:
+                    if not can_hedge:
+                        raise TimeoutError(f"{settings.LLM_TIMEOUT:.0f}s 内没有端点返回首 token")
+                    hedges += 1
+                    endpoint = candidates.pop(0)
+                    running.append(self._start(endpoint, True, messages, kwargs, events))
+                    # 下一次对冲从这次起重新计时，不然会连着把剩下的端点一口气全发出去
+                    hedge_at = running[-1].t0 + endpoint.hedge_after()
+                    record_event("llm_hedge", primary=running[0].endpoint.name, hedge=endpoint.name,
+                                 waited=round(now - running[0].t0, 3))
+                    continue
+                if attempt not in running:
+                    continue
+                if kind == "error":
+                    attempt.endpoint.observe_error()
+                    running.remove(attempt)
+                    last_error = value
+                    print(f"⚠️ [Router] {attempt.endpoint.name} 失败: {value}")
+                    if not running:
+                        if not candidates:
+                            raise last_error
+                        # 没有在跑的请求了：立刻换下一个端点 (不算对冲次数)
+                        running.append(self._start(candidates.pop(0), False, messages, kwargs, events))
+                        hedge_at = running[-1].t0 + running[-1].endpoint.hedge_after()
+                    continue
+                winner = attempt
+                elapsed = time.monotonic() - attempt.t0
+                attempt.endpoint.observe_ttft(elapsed)
+                for other in running:
+                    if other is not attempt:
+                        other.stop()
+                        other.endpoint.observe_loss(time.monotonic() - other.t0)
+                if attempt.hedge:
+                    record_event("llm_hedge_win", winner=attempt.endpoint.name, ttft=round(elapsed, 3))
+                if kind == "end":
+                    return
+                yield value
+
+            # 2. 只转发胜出端点的后续内容
+            while True:
+                try:
+                    attempt, kind, value = events.get(timeout=settings.LLM_TIMEOUT)
+                except queue.Empty:
+                    raise TimeoutError(f"{winner.endpoint.name} {settings.LLM_TIMEOUT:.0f}s 没有新内容")
+                if attempt is not winner:
+                    continue
+                if kind == "delta":
+                    yield value
+                elif kind == "end":
+                    return
+                else:
+                    winner.endpoint.observe_error()
+                    raise value
+        finally:
+            for attempt in running:
+                attempt.stop()
@@ -0,0 +1,108 @@
+import threading
+
+# ==========================================
+# 轮次取消令牌
+# ==========================================
+# 每一轮对话 (turn) 持有一个 CancelToken。
+# 新消息、清空记忆、客户端断开时取消旧令牌，
+# 正在跑的 LLM / TTS / 渲染子进程会尽快停下来，把算力还给新请求。
+
+
+class TurnCancelled(Exception):
+    """当前轮次已被取消"""
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """阶段没能在截止时间内完成 (例如渲染超时)"""
+    pass
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = ""
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception as e:
+                print(f"⚠️ [Cancel] 回调执行失败: {e}")
+
+    def on_cancel(self, cb):
+        """注册取消回调 (例如杀掉渲染子进程)；已取消则立刻执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(cb)
+                return
+        cb()
+
+    def remove_callback(self, cb):
+        with self._lock:
+            if cb in self._callbacks:
+                self._callbacks.remove(cb)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TurnCancelled(self.reason)
+
+    def wait(self, timeout=None):
+        """等待被取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+
+def check_cancelled(token):
+    """token 可以为 None，方便旧调用方不传"""
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+# === 按会话登记的当前轮次 ===
+_turns = {}
+_turns_lock = threading.Lock()
+
+
+def begin_turn(session_id):
+    """开始新一轮：先取消该会话上一轮，再登记新令牌"""
+    token = CancelToken()
+    with _turns_lock:
+        old = _turns.get(session_id)
+        _turns[session_id] = token
+    if old is not None:
+        old.cancel("new input")
+    return token
+
+
+def cancel_turn(session_id, reason="cancelled"):
+    with _turns_lock:
+        token = _turns.pop(session_id, None)
+    if token is not None:
+        print(f"🛑 [Cancel] 会话 {str(session_id)[:8]} 的旧轮次已取消 ({reason})")
+        token.cancel(reason)
+
+
+def has_active_turn(session_id):
+    """该会话是否有正在进行的轮次"""
+    with _turns_lock:
+        token = _turns.get(session_id)
+    return token is not None and not token.cancelled
+
+
+def end_turn(session_id, token):
+    """轮次正常结束，只移除自己的令牌"""
+    with _turns_lock:
+        if _turns.get(session_id) is token:
+            del _turns[session_id]
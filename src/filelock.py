@@ -0,0 +1,140 @@
+import os
+import time
+import uuid
+import threading
+
+# ==========================================
+# 跨进程文件锁 (Windows / Linux 通用)
+# ==========================================
+# 多个 webui 副本、worker 共享同一份磁盘缓存时，用 O_CREAT|O_EXCL 创建锁文件互斥：
+# 不依赖 fcntl/msvcrt，网络盘上也能用。持锁进程崩溃后，超过 stale 秒的锁文件会被接管。
+# 持锁期间后台线程定时刷新锁文件的修改时间，生成再久也不会被当成遗留锁；
+# 锁文件里写有本次持锁的令牌，释放时令牌不符 (锁已被别人接管) 就不删别人的锁。
+
+
+class LockTimeout(Exception):
+    """等锁超时"""
+    pass
+
+
+class FileLock:
+    def __init__(self, path, timeout=30.0, stale=120.0, poll=0.05):
+        """
+        :param path: 被保护的文件路径，锁文件为 path + ".lock"
+        :param timeout: 最多等待多少秒，None 表示一直等
+        :param stale: 锁文件超过多少秒未更新视为遗留锁
+        """
+        self.lock_path = path + ".lock"
+        self.timeout = timeout
+        self.stale = stale
+        self.poll = poll
+        self._fd = None
+        self._token = None
+        self._stop = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        start = time.monotonic()
+        while True:
+            try:
+                self._fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                self._token = f"{os.getpid()}:{uuid.uuid4().hex}"
+                os.write(self._fd, f"{self._token}\n".encode())
+                self._start_heartbeat()
+                return self
+            except FileExistsError:
+                self._break_stale()
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise LockTimeout(f"等待文件锁超时: {self.lock_path}")
+            time.sleep(self.poll)
+
+    def _break_stale(self):
+        try:
+            age = time.time() - os.path.getmtime(self.lock_path)
+        except OSError:
+            return
+        if age > self.stale:
+            # 先改名再删，避免两个进程同时接管
+            grave = f"{self.lock_path}.{uuid.uuid4().hex[:6]}.stale"
+            try:
+                os.replace(self.lock_path, grave)
+                os.remove(grave)
+                print(f"🔓 [Lock] 接管遗留锁: {self.lock_path}")
+            except OSError:
+                pass
+
+    def _owned(self):
+        try:
+            with open(self.lock_path, "r", encoding="utf-8") as f:
+                return f.read().strip() == self._token
+        except OSError:
+            return False
+
+    def _start_heartbeat(self):
+        stop = self._stop = threading.Event()
+        interval = max(self.stale / 4, 0.5)
+
+        def beat():
+            while not stop.wait(interval):
+                if not self._owned():
+                    print(f"⚠️ [Lock] 锁已被其它进程接管: {self.lock_path}")
+                    return
+                try:
+                    os.utime(self.lock_path)
+                except OSError:
+                    return
+
+        threading.Thread(target=beat, daemon=True, name="filelock-heartbeat").start()
+
+    def release(self):
+        if self._fd is None:
+            return
+        self._stop.set()
+        os.close(self._fd)
+        self._fd = None
+        try:
+            # 只删自己的锁：被接管过的锁属于别的进程
+            if self._owned():
+                os.remove(self.lock_path)
+        except OSError:
+            pass
+        self._token = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def atomic_write(path, data):
+    """先写临时文件再改名，读者永远看不到写了一半的文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+    mode = "wb" if isinstance(data, bytes) else "w"
+    kwargs = {} if isinstance(data, bytes) else {"encoding": "utf-8"}
+    with open(tmp, mode, **kwargs) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def cached_file(path, build, timeout=300.0):
+    """
+    多进程共享的磁盘缓存：path 存在直接返回；否则持锁调用 build(tmp_path) 生成
+    同一时刻只有一个进程在生成，其它进程等锁后直接复用结果
+    """
+    if os.path.exists(path):
+        return path
+    with FileLock(path, timeout=timeout):
+        if os.path.exists(path):
+            return path
+        root, ext = os.path.splitext(path)
+        tmp = f"{root}.{uuid.uuid4().hex[:6]}.tmp{ext}"
+        try:
+            if not build(tmp) or not os.path.exists(tmp):
+                return None
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return path
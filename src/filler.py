@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import random
+import shutil
+import hashlib
+import threading
+
+from configs.settings import settings
+from src.scheduler import BATCH
+from src.filelock import cached_file, atomic_write
+
+# ==========================================
+# 垫场短片 (掩盖 LLM / TTS 的等待)
+# ==========================================
+# 每个 音色 + 形象 组合预先渲染几段 "嗯……让我想想" 之类的短片。
+# 一轮开始时立刻播放其中一段，真正的第一段回复到了再接上，
+# 冷启动时用户也能马上看到数字人有反应。
+# 短片存放在共享缓存 CACHE_DIR/fillers/<组合哈希>/，多个副本共用，只生成一次。
+
+
+class FillerLibrary:
+    def __init__(self, phrases=None):
+        self.phrases = phrases or settings.FILLER_PHRASES
+        self._ready = {}          # key -> [{"text", "audio", "video"}]
+        self._building = set()
+        self._failed = {}         # key -> 上次失败时间
+        self.retry_after = 300
+        self._lock = threading.Lock()
+
+    def _key(self, ref_audio, ref_text, avatar_config):
+        avatar = avatar_config or {}
+        profile = {
+            "voice": ref_audio, "ref_text": ref_text or "", "phrases": self.phrases,
+            "engine": avatar.get("engine"), "img": avatar.get("img"),
+            "still": avatar.get("still"), "enhancer": avatar.get("enhancer"), "bbox": avatar.get("bbox")
+        }
+        return hashlib.sha1(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _root(self, key):
+        return os.path.abspath(os.path.join(settings.CACHE_DIR, "fillers", key))
+
+    def _load_manifest(self, key):
+        path = os.path.join(self._root(key), "manifest.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                clips = json.load(f)
+        except Exception:
+            return None
+        return [c for c in clips if c.get("audio") and os.path.exists(c["audio"])] or None
+
+    def prepare_async(self, ref_audio, ref_text, avatar_config):
+        """后台生成 (形象激活时调用)；已生成或正在生成则直接返回"""
+        if not settings.FILLER_ENABLED or not ref_audio:
+            return
+        key = self._key(ref_audio, ref_text, avatar_config)
+        with self._lock:
+            if key in self._ready or key in self._building:
+                return
+            # 失败后冷却一段时间再重试，避免每轮都重新渲染
+            if time.monotonic() - self._failed.get(key, -self.retry_after) < self.retry_after:
+                return
+            self._building.add(key)
+        threading.Thread(
+            target=self._build, args=(key, ref_audio, ref_text, avatar_config), daemon=True
+        ).start()
+
+    def _build(self, key, ref_audio, ref_text, avatar_config):
+        from src.pipeline import tts_bridge, video_bridge
+
+        try:
+            clips = self._load_manifest(key)
+            if clips is None:
+                root = self._root(key)
+                clips = []
+                for i, phrase in enumerate(self.phrases):
+                    audio = cached_file(
+                        os.path.join(root, f"{i}.wav"),
+                        lambda tmp: tts_bridge(phrase, ref_audio, ref_text, output_path=tmp, priority=BATCH)
+                    )
+                    if not audio:
+                        print("⚠️ [Filler] 语音模型未就绪，稍后再生成垫场短片")
+                        return
+                    video = None
+                    img = (avatar_config or {}).get("img")
+                    if img and os.path.isfile(img):
+                        try:
+                            video = cached_file(
+                                os.path.join(root, f"{i}.mp4"),
+                                lambda tmp: self._render(audio, tmp, avatar_config, video_bridge)
+                            )
+                        except Exception as e:
+                            # 视频失败也保留音频垫场
+                            print(f"⚠️ [Filler] 垫场视频渲染失败: {e}")
+                    clips.append({"text": phrase, "audio": audio, "video": video})
+                atomic_write(os.path.join(root, "manifest.json"), json.dumps(clips, ensure_ascii=False, indent=2))
+            with self._lock:
+                self._ready[key] = clips
+            print(f"🎞️ [Filler] 垫场短片就绪: {len(clips)} 段")
+        except Exception as e:
+            print(f"⚠️ [Filler] 生成垫场短片失败: {e}")
+            with self._lock:
+                self._failed[key] = time.monotonic()
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def _render(self, audio, tmp_path, avatar_config, video_bridge):
+        work_dir = tmp_path + ".work"
+        os.makedirs(work_dir, exist_ok=True)
+        try:
+            video = video_bridge(audio, out_dir=work_dir, priority=BATCH, avatar_config=avatar_config)
+            if not video:
+                return False
+            shutil.move(video, tmp_path)
+            return True
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def pick(self, ref_audio, ref_text, avatar_config):
+        """随机取一段已生成的短片；还没有就触发后台生成并返回 None"""
+        if not settings.FILLER_ENABLED or not ref_audio:
+            return None
+        key = self._key(ref_audio, ref_text, avatar_config)
+        with self._lock:
+            clips = self._ready.get(key)
+        if clips is None:
+            # 可能是别的副本已经生成好了
+            clips = self._load_manifest(key)
+            if clips is None:
+                self.prepare_async(ref_audio, ref_text, avatar_config)
+                return None
+            with self._lock:
+                self._ready[key] = clips
+        return random.choice(clips)
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_filler_library():
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = FillerLibrary()
+        return _library
@@ -0,0 +1,85 @@
+import os
+import sys
+import math
+import time
+import argparse
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from configs.settings import settings
+from .queue import open_job_queue
+
+# ==========================================
+# 按队列深度扩缩 worker 进程
+# ==========================================
+# 和 WebUI 跑在同一台机器上 (队列仅单机)，它根据队列的排队数和处理中的任务数启停 worker：
+#   目标数 = clamp(处理中 + ceil(排队数 / 每个 worker 承担的排队数), min, max)
+# 缩容时发 SIGTERM，worker 做完手上的任务再退出；退出前仍计入 worker 总数，不会超过 max。
+#
+#   python -m src.jobs.autoscale --stage avatar --min-workers 0 --max-workers 4
+
+
+def desired_workers(depth, busy, per_worker, min_workers, max_workers):
+    """
+    正在处理任务的 worker 一个都不缩，避免队列刚被领空就把忙碌的 worker 停掉、
+    随后又冷启动新的 (加载模型很慢)
+    """
+    target = busy + (math.ceil(depth / per_worker) if depth > 0 else 0)
+    return max(min_workers, min(max_workers, target))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按队列深度扩缩 worker")
+    parser.add_argument("--stage", choices=["tts", "avatar"], required=True)
+    parser.add_argument("--queue", default=settings.JOB_QUEUE)
+    parser.add_argument("--min-workers", type=int, default=0)
+    parser.add_argument("--max-workers", type=int, default=2)
+    parser.add_argument("--per-worker", type=int, default=2, help="每个 worker 承担的排队任务数")
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--cooldown", type=float, default=30.0, help="缩容前至少等待的秒数")
+    args = parser.parse_args()
+
+    if not args.queue or args.queue == "memory":
+        parser.error("autoscale 需要可共享的队列，例如 --queue sqlite:///assets/jobs/jobs.db")
+
+    queue = open_job_queue(args.queue)
+    cmd = [sys.executable, "-m", "src.jobs.worker", "--stage", args.stage, "--queue", args.queue]
+    procs = []
+    # 已发 SIGTERM、还在做手上任务的 worker
+    stopping = []
+    last_scale_up = 0.0
+
+    print(f"📈 [Autoscale] 监控 {args.stage} 队列 ({args.min_workers}~{args.max_workers} 个 worker)")
+    try:
+        while True:
+            procs = [p for p in procs if p.poll() is None]
+            stopping = [p for p in stopping if p.poll() is None]
+            depth = queue.depth(args.stage)
+            busy = queue.busy(args.stage)
+            target = desired_workers(depth, busy, args.per_worker, args.min_workers, args.max_workers)
+
+            # 正在退出的 worker 还占着显存，扩容时一起算进上限
+            spawn = min(target - len(procs), args.max_workers - len(procs) - len(stopping))
+            if spawn > 0:
+                for _ in range(spawn):
+                    procs.append(subprocess.Popen(cmd, cwd=PROJECT_ROOT))
+                last_scale_up = time.monotonic()
+                print(f"⬆️ [Autoscale] 排队 {depth}，处理中 {busy}，worker 扩到 {len(procs)}")
+            elif target < len(procs) and time.monotonic() - last_scale_up > args.cooldown:
+                for p in procs[target:]:
+                    p.terminate()
+                stopping.extend(procs[target:])
+                procs = procs[:target]
+                print(f"⬇️ [Autoscale] 排队 {depth}，处理中 {busy}，worker 缩到 {len(procs)}")
+
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        for p in procs + stopping:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from configs.settings import settings
+from src.scheduler import ServerBusyError, INTERACTIVE
+from src.cancel import TurnCancelled, DeadlineExceeded
+from src.metrics import record_event
+from .queue import get_job_queue, InProcessJobQueue
+
+# ==========================================
+# 提交方：把阶段任务交给 worker 并等待产物
+# ==========================================
+
+_local_workers = {}
+_local_lock = threading.Lock()
+
+
+def remote_enabled(stage):
+    """该阶段是否交给任务队列执行"""
+    return bool(settings.JOB_QUEUE) and stage in settings.JOB_STAGES
+
+
+def _ensure_local_workers(queue, stage):
+    """memory 模式：本进程里起 worker 线程消费队列"""
+    if not isinstance(queue, InProcessJobQueue):
+        return
+    with _local_lock:
+        if stage in _local_workers:
+            return
+        from .worker import Worker
+        workers = []
+        for i in range(max(1, settings.JOB_LOCAL_WORKERS)):
+            worker = Worker(stage, queue, worker_id=f"local-{stage}-{i}")
+            threading.Thread(target=worker.run, daemon=True).start()
+            workers.append(worker)
+        _local_workers[stage] = workers
+
+
+def dispatch_job(stage, payload, files=None, output_path=None, priority=INTERACTIVE,
+                 cancel_token=None, timeout=None):
+    """
+    提交任务并阻塞等待结果，返回产物在本地的路径
+    - 队列过深抛出 ServerBusyError
+    - 超时抛出 DeadlineExceeded，轮次取消抛出 TurnCancelled (两者都会取消队列里的任务)
+    - 任务记录在等待期间消失 (例如被 purge 清掉) 时按失败处理，返回 None
+    """
+    queue = get_job_queue()
+    _ensure_local_workers(queue, stage)
+
+    if queue.depth(stage) >= settings.JOB_MAX_DEPTH:
+        raise ServerBusyError(f"{stage} 任务队列已满")
+
+    t0 = time.monotonic()
+    job_id = queue.submit(stage, payload, priority=priority, files=files)
+    job = queue.wait(job_id, timeout=timeout, cancel_token=cancel_token)
+
+    if job is None:
+        if cancel_token is None or not cancel_token.cancelled:
+            if queue.get(job_id) is None:
+                # wait() 在任务记录不存在时也返回 None，这不是超时
+                print(f"❌ [Jobs] {stage} 任务记录已丢失: {job_id}")
+                queue.release(job_id)
+                return None
+        # 任务由 worker 收尾时清理
+        queue.cancel(job_id)
+        if cancel_token is not None and cancel_token.cancelled:
+            raise TurnCancelled(cancel_token.reason)
+        raise DeadlineExceeded(f"{stage} 任务超时" + (f" ({timeout:.1f}s)" if timeout is not None else ""))
+
+    record_event("job_finished", stage=stage, job=job_id, status=job["status"],
+                 worker=job.get("worker"), elapsed=round(time.monotonic() - t0, 3))
+    try:
+        if job["status"] != "done":
+            print(f"❌ [Jobs] {stage} 任务失败: {job.get('error') or job['status']}")
+            return None
+        return queue.get_file(job_id, "output", output_path)
+    finally:
+        # 结果已取走：删除任务记录、文件和缓冲目录
+        queue.release(job_id)
@@ -0,0 +1,442 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+
+from configs.settings import settings
+
+# ==========================================
+# 任务队列 (TTS / Avatar 阶段的独立 worker 进程)
+# ==========================================
+# 接口统一，两种实现：
+# - InProcessJobQueue：进程内，文件只传路径，配合本进程的 worker 线程使用
+# - SQLiteJobQueue：同一台机器上的多个进程共享同一个数据库文件，输入输出文件以 BLOB 存库，
+#   worker 不需要和 WebUI 共享目录结构。只支持单机：WAL 依赖共享内存 (-shm 文件)，
+#   放在 NFS/SMB 上供多台机器访问会损坏队列或丢任务
+#
+# 跨机 worker (渲染 / TTS 放到别的机器上) 暂未实现：需要 Redis / Postgres 这类服务端队列，
+# 而本项目目前不依赖任何外部服务。要支持时实现一个新的 JobQueue 子类 (文件同样随任务存进队列)，
+# 在 open_job_queue() 里按 URL 前缀 (redis:// 等) 创建即可，worker / autoscale / 提交方都不用改。
+#
+# 任务 (job) 是一个字典：
+# {"id", "stage", "status", "priority", "payload", "result", "progress", "message", "error"}
+# status: queued -> running -> done / failed / cancelled
+# 任务结束后：worker 调 cleanup() 清理自己的缓冲目录，提交方取完结果后调 release() 删除任务和文件；
+# 没人取的旧任务 (提交方崩溃) 由 purge() 按 JOB_RETENTION 清理。
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobQueue:
+    def submit(self, stage, payload, priority=0, files=None):
+        """提交任务；files 为 {名字: 本地路径}，随任务一起交给 worker"""
+        raise NotImplementedError
+
+    def claim(self, stage, worker_id, timeout=1.0):
+        """领取一个排队中的任务 (优先级高、提交早的优先)；没有任务返回 None"""
+        raise NotImplementedError
+
+    def progress(self, job_id, progress, message=""):
+        """上报进度，同时作为心跳；任务已被取消时返回 False"""
+        raise NotImplementedError
+
+    def complete(self, job_id, result=None, files=None):
+        """提交产物；任务已被取消时返回 False"""
+        raise NotImplementedError
+
+    def fail(self, job_id, error):
+        raise NotImplementedError
+
+    def cancel(self, job_id):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def get_file(self, job_id, name, dest=None):
+        """取任务附带的文件，返回可以直接读取的本地路径"""
+        raise NotImplementedError
+
+    def depth(self, stage):
+        """排队中 (未被领取) 的任务数"""
+        raise NotImplementedError
+
+    def busy(self, stage):
+        """已被领取、正在处理的任务数"""
+        raise NotImplementedError
+
+    def release(self, job_id):
+        """提交方已取走结果 (或放弃)：删除任务及其文件"""
+        raise NotImplementedError
+
+    def cleanup(self, job_id):
+        """worker 处理完任务：删除本地缓冲目录 (产物已交给队列时)"""
+        raise NotImplementedError
+
+    def purge(self, older_than):
+        """清理超过 older_than 秒仍没人取的已结束任务"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _remove_spool(job_id):
+        shutil.rmtree(os.path.join(settings.JOB_SPOOL_DIR, job_id), ignore_errors=True)
+
+    def wait(self, job_id, timeout=None, cancel_token=None, poll=0.2):
+        """
+        等待任务结束并返回任务字典
+        超时返回 None；取消令牌触发时返回 None (调用方负责 cancel)
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return job
+            if cancel_token is not None and cancel_token.cancelled:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+
+# === 进程内实现 ===
+class InProcessJobQueue(JobQueue):
+    """文件只传路径 (产物留在 worker 的缓冲目录)，所以缓冲目录等提交方 release() 时才删"""
+    def __init__(self):
+        self._jobs = {}
+        self._files = {}
+        self._cond = threading.Condition()
+        self._seq = 0
+
+    def submit(self, stage, payload, priority=0, files=None):
+        job_id = uuid.uuid4().hex
+        with self._cond:
+            self._seq += 1
+            self._jobs[job_id] = {
+                "id": job_id, "stage": stage, "status": "queued", "priority": priority,
+                "payload": payload, "result": None, "progress": 0.0, "message": "",
+                "error": None, "seq": self._seq, "updated": time.time()
+            }
+            self._files[job_id] = dict(files or {})
+            self._cond.notify_all()
+        return job_id
+
+    def claim(self, stage, worker_id, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                queued = [j for j in self._jobs.values() if j["stage"] == stage and j["status"] == "queued"]
+                if queued:
+                    job = min(queued, key=lambda j: (j["priority"], j["seq"]))
+                    job["status"] = "running"
+                    job["worker"] = worker_id
+                    return dict(job)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def progress(self, job_id, progress, message=""):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] == "cancelled":
+                return False
+            job["progress"] = progress
+            job["message"] = message
+            return True
+
+    def complete(self, job_id, result=None, files=None):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] == "cancelled":
+                return False
+            job.update(status="done", result=result, progress=1.0, updated=time.time())
+            self._files[job_id].update(files or {})
+            self._cond.notify_all()
+            return True
+
+    def fail(self, job_id, error):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] != "cancelled":
+                job.update(status="failed", error=str(error), updated=time.time())
+                self._cond.notify_all()
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in FINISHED:
+                return
+            if job["status"] == "queued":
+                # 还没被领取：直接删掉
+                self._drop_locked(job_id)
+            else:
+                # 正在跑：worker 收尾时 cleanup() 删除
+                job.update(status="cancelled", updated=time.time())
+            self._cond.notify_all()
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_file(self, job_id, name, dest=None):
+        with self._cond:
+            path = self._files.get(job_id, {}).get(name)
+        if path and dest and os.path.abspath(path) != os.path.abspath(dest):
+            os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+            shutil.copy(path, dest)
+            return dest
+        return path
+
+    def depth(self, stage):
+        with self._cond:
+            return sum(1 for j in self._jobs.values() if j["stage"] == stage and j["status"] == "queued")
+
+    def busy(self, stage):
+        with self._cond:
+            return sum(1 for j in self._jobs.values() if j["stage"] == stage and j["status"] == "running")
+
+    def _drop_locked(self, job_id):
+        self._jobs.pop(job_id, None)
+        self._files.pop(job_id, None)
+        self._remove_spool(job_id)
+
+    def release(self, job_id):
+        with self._cond:
+            self._drop_locked(job_id)
+
+    def cleanup(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            # 被取消的任务没人来取，worker 收尾时直接删；其它的产物还要交给提交方
+            if job is None or job["status"] == "cancelled":
+                self._drop_locked(job_id)
+
+    def purge(self, older_than):
+        cutoff = time.time() - older_than
+        with self._cond:
+            for job_id in [k for k, j in self._jobs.items() if j["status"] in FINISHED and j["updated"] < cutoff]:
+                self._drop_locked(job_id)
+
+
+# === SQLite 实现 ===
+class SQLiteJobQueue(JobQueue):
+    """
+    同一台机器上多个进程共享的任务队列 (仅限单机，数据库文件不能放在网络文件系统上)
+    worker 通过心跳刷新 updated 字段，超过 stale_seconds 没有心跳的任务会被重新排队
+    """
+    def __init__(self, path, stale_seconds=None):
+        self.path = os.path.abspath(path)
+        self.stale_seconds = stale_seconds or settings.JOB_STALE_SECONDS
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, stage TEXT, status TEXT, priority INTEGER,
+                    payload TEXT, result TEXT, progress REAL, message TEXT, error TEXT,
+                    worker TEXT, created REAL, updated REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (stage, status, priority, created);
+                CREATE TABLE IF NOT EXISTS job_files (
+                    job_id TEXT, name TEXT, filename TEXT, data BLOB,
+                    PRIMARY KEY (job_id, name)
+                );
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _store_files(self, conn, job_id, files):
+        for name, path in (files or {}).items():
+            if not path or not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            conn.execute(
+                "INSERT OR REPLACE INTO job_files (job_id, name, filename, data) VALUES (?, ?, ?, ?)",
+                (job_id, name, os.path.basename(path), data)
+            )
+
+    def submit(self, stage, payload, priority=0, files=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._store_files(conn, job_id, files)
+            conn.execute(
+                "INSERT INTO jobs (id, stage, status, priority, payload, progress, message, created, updated) "
+                "VALUES (?, ?, 'queued', ?, ?, 0, '', ?, ?)",
+                (job_id, stage, priority, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self, stage, worker_id, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # 1. 心跳超时的任务 (worker 崩溃) 重新排队
+                conn.execute(
+                    "UPDATE jobs SET status='queued', worker=NULL WHERE stage=? AND status='running' AND updated<?",
+                    (stage, time.time() - self.stale_seconds)
+                )
+                # 2. 按优先级领取
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE stage=? AND status='queued' ORDER BY priority, created LIMIT 1",
+                    (stage,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status='running', worker=?, updated=? WHERE id=?",
+                        (worker_id, time.time(), row["id"])
+                    )
+                conn.execute("COMMIT")
+            if row is not None:
+                job = self._row_to_job(row)
+                job["status"] = "running"
+                return job
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def progress(self, job_id, progress, message=""):
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET progress=?, message=?, updated=? WHERE id=? AND status='running'",
+                (progress, message, time.time(), job_id)
+            )
+            return cur.rowcount > 0
+
+    def complete(self, job_id, result=None, files=None):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "UPDATE jobs SET status='done', result=?, progress=1, updated=? WHERE id=? AND status='running'",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id)
+            )
+            if cur.rowcount > 0:
+                self._store_files(conn, job_id, files)
+            conn.execute("COMMIT")
+            return cur.rowcount > 0
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status='failed', error=?, updated=? WHERE id=? AND status='running'",
+                (str(error), time.time(), job_id)
+            )
+
+    def cancel(self, job_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status='cancelled', updated=? WHERE id=? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def get_file(self, job_id, name, dest=None):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT filename, data FROM job_files WHERE job_id=? AND name=?", (job_id, name)
+            ).fetchone()
+        if row is None:
+            return None
+        if not dest:
+            dest = os.path.join(settings.JOB_SPOOL_DIR, job_id, row["filename"])
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        with open(dest, "wb") as f:
+            f.write(row["data"])
+        return dest
+
+    def depth(self, stage):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE stage=? AND status='queued'", (stage,)
+            ).fetchone()
+        return row[0]
+
+    def busy(self, stage):
+        # 心跳超时的任务 claim() 时会被重新排队，这里不算在内
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE stage=? AND status='running' AND updated>=?",
+                (stage, time.time() - self.stale_seconds)
+            ).fetchone()
+        return row[0]
+
+    def release(self, job_id):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM job_files WHERE job_id=?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+            conn.execute("COMMIT")
+        self._remove_spool(job_id)
+
+    def cleanup(self, job_id):
+        # 产物已经以 BLOB 存进数据库，worker 的缓冲目录可以直接删
+        self._remove_spool(job_id)
+
+    def purge(self, older_than):
+        """清理已结束的旧任务及其文件"""
+        cutoff = time.time() - older_than
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM job_files WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated<?)",
+                (cutoff,)
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND updated<?", (cutoff,)
+            )
+            conn.execute("COMMIT")
+
+
+# === 全局队列 ===
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def open_job_queue(url):
+    """
+    按 URL 创建队列：
+    - "memory"            进程内
+    - "sqlite:///a/b.db"  SQLite 文件
+    """
+    if url == "memory":
+        return InProcessJobQueue()
+    if url.startswith("sqlite:///"):
+        return SQLiteJobQueue(url[len("sqlite:///"):])
+    if url.split("://", 1)[0] in ("redis", "rediss", "postgres", "postgresql"):
+        raise ValueError(f"跨机任务队列暂未实现，目前只支持 memory 和单机的 sqlite:///: {url}")
+    raise ValueError(f"未知的任务队列: {url}")
+
+
+def get_job_queue():
+    """返回配置的全局队列；JOB_QUEUE 为空时返回 None (各阶段在本进程直接执行)"""
+    global _queue
+    if not settings.JOB_QUEUE:
+        return None
+    with _queue_lock:
+        if _queue is None:
+            _queue = open_job_queue(settings.JOB_QUEUE)
+        return _queue
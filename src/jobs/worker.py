@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import uuid
+import socket
+import signal
+import argparse
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from configs.settings import settings
+from src.cancel import CancelToken, TurnCancelled
+from .queue import open_job_queue
+
+# ==========================================
+# 阶段 worker (TTS / Avatar)
+# ==========================================
+# 从任务队列领取任务，在本进程执行，上报进度与产物。
+# 独立进程启动:
+#   python -m src.jobs.worker --stage tts --queue sqlite:///assets/jobs/jobs.db
+# 收到 SIGTERM 后做完手上的任务再退出，方便 autoscale 缩容。
+
+
+def _spool_path(job_id, filename):
+    path = os.path.join(settings.JOB_SPOOL_DIR, job_id, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def handle_tts(queue, job, cancel_token, report):
+    from src.pipeline import tts_local
+    payload = job["payload"]
+    ref_audio = queue.get_file(job["id"], "ref_audio")
+    report(0.1, "synthesizing")
+    audio_path = tts_local(
+        payload["text"], ref_audio, payload.get("ref_text", ""),
+        output_path=_spool_path(job["id"], "reply.wav"),
+        priority=job["priority"], cancel_token=cancel_token,
+        flow_steps=payload.get("flow_steps")
+    )
+    if not audio_path:
+        raise RuntimeError("TTS 未产出音频 (模型未加载?)")
+    return {"filename": os.path.basename(audio_path)}, {"output": audio_path}
+
+
+def handle_avatar(queue, job, cancel_token, report):
+    from src.pipeline import video_local
+    payload = job["payload"]
+    config = dict(payload["avatar_config"])
+    config["img"] = queue.get_file(job["id"], "img")
+    audio_path = queue.get_file(job["id"], "audio")
+    report(0.1, "rendering")
+    video_path = video_local(
+        audio_path, out_dir=os.path.dirname(_spool_path(job["id"], "video")),
+        priority=job["priority"], cancel_token=cancel_token,
+        timeout=payload.get("timeout"), quality=payload.get("quality"), config=config
+    )
+    if not video_path:
+        raise RuntimeError("渲染未产出视频")
+    return {"filename": os.path.basename(video_path)}, {"output": video_path}
+
+
+HANDLERS = {"tts": handle_tts, "avatar": handle_avatar}
+
+
+class Worker:
+    def __init__(self, stage, queue, worker_id=None):
+        self.stage = stage
+        self.queue = queue
+        self.handler = HANDLERS[stage]
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self._stop = threading.Event()
+
+    def stop(self):
+        """做完当前任务后退出"""
+        self._stop.set()
+
+    def _heartbeat(self, job_id, token, state, done):
+        """定期上报进度；任务被提交方取消时触发 token，杀掉正在跑的推理/渲染"""
+        while not done.wait(settings.JOB_HEARTBEAT):
+            if not self.queue.progress(job_id, state["progress"], state["message"]):
+                token.cancel("job cancelled")
+                return
+
+    def run_one(self, job):
+        job_id = job["id"]
+        token = CancelToken()
+        state = {"progress": 0.0, "message": "started"}
+        done = threading.Event()
+
+        def report(progress, message=""):
+            state["progress"], state["message"] = progress, message
+            if not self.queue.progress(job_id, progress, message):
+                token.cancel("job cancelled")
+
+        beat = threading.Thread(target=self._heartbeat, args=(job_id, token, state, done), daemon=True)
+        beat.start()
+        t0 = time.monotonic()
+        try:
+            result, files = self.handler(self.queue, job, token, report)
+            token.raise_if_cancelled()
+            if not self.queue.complete(job_id, result, files):
+                raise TurnCancelled("job cancelled")
+            print(f"✅ [Worker] {self.stage} 任务 {job_id[:8]} 完成 ({time.monotonic() - t0:.1f}s)")
+        except TurnCancelled:
+            print(f"🛑 [Worker] {self.stage} 任务 {job_id[:8]} 已取消")
+        except Exception as e:
+            print(f"❌ [Worker] {self.stage} 任务 {job_id[:8]} 失败: {e}")
+            self.queue.fail(job_id, e)
+        finally:
+            done.set()
+            self.queue.cleanup(job_id)
+
+    def run(self, idle_exit=None):
+        """
+        主循环
+        :param idle_exit: 连续空闲多少秒后自动退出 (None 表示常驻)
+        """
+        print(f"👷 [Worker] {self.worker_id} 开始消费 {self.stage} 队列")
+        idle_since = time.monotonic()
+        last_purge = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() - last_purge > 60:
+                # 提交方崩溃、没人取走的旧任务
+                last_purge = time.monotonic()
+                try:
+                    self.queue.purge(settings.JOB_RETENTION)
+                except Exception as e:
+                    print(f"⚠️ [Worker] 清理旧任务失败: {e}")
+            job = self.queue.claim(self.stage, self.worker_id, timeout=1.0)
+            if job is None:
+                if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+                    break
+                continue
+            self.run_one(job)
+            idle_since = time.monotonic()
+        print(f"👋 [Worker] {self.worker_id} 退出")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS / Avatar 阶段 worker")
+    parser.add_argument("--stage", choices=sorted(HANDLERS), required=True)
+    parser.add_argument("--queue", default=settings.JOB_QUEUE, help="例如 sqlite:///assets/jobs/jobs.db")
+    parser.add_argument("--idle-exit", type=float, default=None, help="空闲多少秒后退出")
+    args = parser.parse_args()
+
+    if not args.queue or args.queue == "memory":
+        parser.error("独立 worker 需要可共享的队列，例如 --queue sqlite:///assets/jobs/jobs.db")
+
+    worker = Worker(args.stage, open_job_queue(args.queue))
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+
+    if args.stage == "tts":
+        from src.audio.runtime import load_tts_from_config
+        if load_tts_from_config() is None:
+            print("❌ [Worker] TTS 模型加载失败，请先在 WebUI 里保存 tts_config.json")
+            sys.exit(1)
+
+    try:
+        worker.run(idle_exit=args.idle_exit)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
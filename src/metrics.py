@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# ==========================================
+# 流水线指标与决策日志
+# ==========================================
+# 每个决策 (例如 "本段只出音频") 都以 JSON 行写入日志，方便之后调整预算；
+# 同时在内存里保留各阶段最近的耗时，供调度与降级逻辑参考。
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVENT_LOG_PATH = os.path.join(PROJECT_ROOT, "assets", "logs", "pipeline_events.jsonl")
+
+_log_lock = threading.Lock()
+_latency_lock = threading.Lock()
+_latencies = {}
+_collectors = []
+_WINDOW = 50
+
+
+def record_event(event, **fields):
+    """追加一条决策/事件记录"""
+    record = {"ts": round(time.time(), 3), "event": event}
+    record.update(fields)
+    line = json.dumps(record, ensure_ascii=False)
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(EVENT_LOG_PATH), exist_ok=True)
+            with open(EVENT_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except Exception as e:
+        print(f"⚠️ [Metrics] 写日志失败: {e}")
+
+
+def observe_latency(stage, seconds):
+    """记录某阶段一次耗时 (秒)"""
+    with _latency_lock:
+        window = _latencies.setdefault(stage, deque(maxlen=_WINDOW))
+        window.append(seconds)
+        collectors = list(_collectors)
+    for collect in collectors:
+        collect(stage, seconds)
+
+
+def add_latency_collector(collect):
+    """注册 (stage, seconds) 回调，拿到完整的耗时序列 (例如批量模式统计 p95)"""
+    with _latency_lock:
+        _collectors.append(collect)
+
+
+def remove_latency_collector(collect):
+    with _latency_lock:
+        if collect in _collectors:
+            _collectors.remove(collect)
+
+
+def recent_latencies(stage):
+    with _latency_lock:
+        return list(_latencies.get(stage, ()))
+
+
+def percentile(values, q):
+    """简单分位数 (q 取 0~100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[k]
@@ -0,0 +1,534 @@
+import os
+import threading
+import queue
+import time
+import uuid
+
+from configs.settings import settings
+from src.audio.runtime import get_tts
+from src.avatar.config import load_a2f_config
+from src.avatar.engine import get_engine
+from src.brain.llm_engine import get_brain
+from src.scheduler import stage_slot, ServerBusyError, INTERACTIVE, BUSY_MESSAGE
+from src.cancel import TurnCancelled, DeadlineExceeded
+from src.metrics import record_event, observe_latency
+from src.quality import get_quality_controller
+from src.jobs.client import remote_enabled, dispatch_job
+from src.session import save_session
+from src.store import replica_dir
+from src.prefetch import get_prefetcher
+from src.filler import get_filler_library
+from src.text_stream import TextNormalizer, join_sentences, normalize_text
+
+# ==========================================
+# 分句流式流水线 (LLM -> TTS -> Avatar)
+# ==========================================
+
+_STOP = object()
+
+
+class TurnBudget:
+    """
+    单轮延迟预算：
+    - 整段模式：视频必须在 轮次开始 + total 秒内完成
+    - 分句模式：每段视频必须在 该段音频就绪 + segment 秒内完成
+    超出截止时间的渲染会被取消，该段降级为只出音频。
+    """
+    def __init__(self, total, segment):
+        self.total = total
+        self.segment = segment
+        self.start = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def video_deadline(self, audio_ready_at=None):
+        if audio_ready_at is None:
+            return self.start + self.total
+        return audio_ready_at + self.segment
+
+    def time_left(self, deadline):
+        return max(0.0, deadline - time.monotonic())
+
+
+class StreamingPipeline:
+    """
+    两级后台流水线：
+    - TTS 线程：按顺序把句子合成为音频，合成完立刻产出 audio 事件
+    - 渲染线程：按顺序把音频渲染成视频，产出 video 事件
+    LLM 仍在调用方线程里生成，三者互相重叠。
+    """
+    def __init__(self, tts_fn, render_fn=None, cancel_token=None):
+        """
+        :param tts_fn: (text, index) -> audio_path
+        :param render_fn: (audio_path, index, audio_ready_at) -> video_path，为 None 时只出音频
+        :param cancel_token: 轮次取消后，尚未开始的句子直接跳过
+        """
+        self.tts_fn = tts_fn
+        self.render_fn = render_fn
+        self.cancel_token = cancel_token
+        self._tts_queue = queue.Queue()
+        self._render_queue = queue.Queue()
+        self._out_queue = queue.Queue()
+        self._count = 0
+        self._closed = False
+        self._stop_sent = False
+
+        self._tts_thread = threading.Thread(target=self._tts_loop, daemon=True)
+        self._render_thread = threading.Thread(target=self._render_loop, daemon=True)
+        self._tts_thread.start()
+        self._render_thread.start()
+
+    def _cancelled(self):
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    # === 后台线程 ===
+    def _tts_loop(self):
+        while True:
+            item = self._tts_queue.get()
+            if item is _STOP:
+                self._render_queue.put(_STOP)
+                return
+            index, text, emotion = item
+            audio_path = None
+            if self._cancelled():
+                self._render_queue.put((index, text, emotion, None, None))
+                continue
+            try:
+                audio_path = self.tts_fn(text, index)
+            except Exception as e:
+                print(f"❌ [Pipeline] 第 {index} 句 TTS 失败: {e}")
+            ready_at = time.monotonic()
+            # 音频先行：不等渲染，先把这一段交给调用方播放
+            self._out_queue.put({
+                "kind": "audio", "index": index, "text": text, "emotion": emotion,
+                "audio": audio_path, "video": None
+            })
+            self._render_queue.put((index, text, emotion, audio_path, ready_at))
+
+    def _render_loop(self):
+        while True:
+            item = self._render_queue.get()
+            if item is _STOP:
+                self._out_queue.put(_STOP)
+                return
+            index, text, emotion, audio_path, ready_at = item
+            video_path = None
+            if audio_path and self.render_fn and not self._cancelled():
+                try:
+                    video_path = self.render_fn(audio_path, index, ready_at)
+                except Exception as e:
+                    print(f"❌ [Pipeline] 第 {index} 句渲染失败: {e}")
+            self._out_queue.put({
+                "kind": "video", "index": index, "text": text, "emotion": emotion,
+                "audio": audio_path, "video": video_path
+            })
+
+    # === 调用方接口 ===
+    def submit(self, text, emotion="default"):
+        """提交一句话 (情绪随片段事件一起交给下游)"""
+        self._tts_queue.put((self._count, text, emotion))
+        self._count += 1
+
+    def poll(self):
+        """非阻塞：取出所有已经完成的片段"""
+        ready = []
+        while True:
+            try:
+                item = self._out_queue.get_nowait()
+            except queue.Empty:
+                return ready
+            if item is _STOP:
+                self._closed = True
+                return ready
+            ready.append(item)
+
+    def close(self):
+        """不再提交新句子 (可重复调用)"""
+        if not self._stop_sent:
+            self._stop_sent = True
+            self._tts_queue.put(_STOP)
+
+    def drain(self):
+        """阻塞：依次产出剩余的片段，直到流水线结束"""
+        while not self._closed:
+            item = self._out_queue.get()
+            if item is _STOP:
+                self._closed = True
+                return
+            yield item
+
+
+# ==========================================
+# 桥接函数 (Brain / TTS / Avatar)
+# ==========================================
+def choose_quality(turn_id):
+    """每轮开始时按当前负载选择画质等级；关闭自适应时返回 None (使用原配置)"""
+    if not settings.QUALITY_ADAPTIVE:
+        return None
+    return get_quality_controller().choose(turn_id)
+
+
+def tts_bridge(text, ref_audio, ref_text, output_path=None, priority=INTERACTIVE, cancel_token=None, quality=None,
+               on_chunk=None):
+    """
+    :param on_chunk: 本地合成时每个 PCM 块到达就回调 on_chunk(pcm, sample_rate)；
+                     交给远程 worker 时不回调，只能等整段文件
+    """
+    if not text or not ref_audio: return None
+    if not output_path:
+        output_path = os.path.join(replica_dir("assets"), "reply.wav")
+    flow_steps = quality.get("tts_steps") if quality else None
+    if remote_enabled("tts"):
+        # 交给 TTS worker (可能在另一台机器上)
+        payload = {"text": text, "ref_text": ref_text or "", "flow_steps": flow_steps}
+        return dispatch_job("tts", payload, files={"ref_audio": ref_audio}, output_path=output_path,
+                            priority=priority, cancel_token=cancel_token, timeout=settings.STAGE_WAIT_TIMEOUT)
+    return tts_local(text, ref_audio, ref_text, output_path, priority, cancel_token, flow_steps, on_chunk)
+
+
+def tts_local(text, ref_audio, ref_text, output_path, priority=INTERACTIVE, cancel_token=None, flow_steps=None,
+              on_chunk=None):
+    """在本进程合成 (WebUI 直连或 TTS worker 调用)"""
+    tts = get_tts() 
+    if not tts: return None
+    # TTS 模型是全局共享的，必须经过调度器限流
+    with stage_slot("tts", priority, cancel_token=cancel_token):
+        t0 = time.monotonic()
+        result = tts.speak(text, ref_audio, ref_text, output_file=output_path,
+                           cancel_token=cancel_token, flow_steps=flow_steps, on_chunk=on_chunk)
+        observe_latency("tts", time.monotonic() - t0)
+        return result
+
+
+def video_bridge(audio_path, out_dir="results", priority=INTERACTIVE, cancel_token=None, timeout=None,
+                 quality=None, avatar_config=None):
+    """
+    :param timeout: 渲染预算 (秒)，包含排队时间；超时抛出 DeadlineExceeded
+    :param quality: 画质等级 (见 src/quality.py)，None 表示完全按 a2f_config.json
+    :param avatar_config: 会话自己的形象配置，None 时读全局默认
+    """
+    # 1. 优先用会话形象，否则直接从 JSON 文件读取最新的配置
+    config = avatar_config or load_a2f_config()
+
+    if not config.get("img"):
+        raise ValueError("请先在'形象激活'面板上传图片并点击'激活配置'")
+
+    if remote_enabled("avatar"):
+        # 交给渲染 worker：图片和音频随任务上传，视频下载回 out_dir
+        payload = {"avatar_config": dict(config, img=None), "quality": quality, "timeout": timeout}
+        files = {"img": config["img"], "audio": audio_path}
+        output_path = os.path.join(out_dir, os.path.splitext(os.path.basename(audio_path))[0] + ".mp4")
+        t0 = time.monotonic()
+        video_path = dispatch_job("avatar", payload, files=files, output_path=output_path,
+                                  priority=priority, cancel_token=cancel_token, timeout=timeout)
+        if video_path:
+            observe_latency("avatar", time.monotonic() - t0)
+        return video_path
+    return video_local(audio_path, out_dir, priority, cancel_token, timeout, quality, config)
+
+
+def video_local(audio_path, out_dir="results", priority=INTERACTIVE, cancel_token=None, timeout=None,
+                quality=None, config=None):
+    """在本进程渲染 (WebUI 直连或渲染 worker 调用)"""
+    engine_name = config.get("engine", "SadTalker")
+    img_path = config.get("img")
+
+    # 2. 传入引擎名称，修复 TypeError
+    engine = get_engine(engine_name)
+    
+    # 3. 根据不同引擎传入对应参数 (渲染占用 GPU，经过调度器限流)
+    t0 = time.monotonic()
+    with stage_slot("avatar", priority, timeout=timeout, cancel_token=cancel_token):
+        if timeout is not None:
+            timeout -= time.monotonic() - t0
+            if timeout <= 0:
+                raise DeadlineExceeded("排队已耗尽渲染预算")
+        t1 = time.monotonic()
+        video_path = _render(engine, engine_name, img_path, audio_path, out_dir, config, cancel_token, timeout, quality)
+        if video_path:
+            observe_latency("avatar", time.monotonic() - t1)
+        return video_path
+
+
+def _render(engine, engine_name, img_path, audio_path, out_dir, config, cancel_token=None, timeout=None, quality=None):
+    video_path = None
+    if engine_name == "SadTalker":
+        use_enhancer = config.get("enhancer", True)
+        if quality and not quality["enhancer"]:
+            use_enhancer = False
+        video_path = engine.generate(
+            img=img_path, 
+            audio=audio_path, 
+            out_dir=out_dir,
+            use_still=config.get("still", False),
+            use_enhancer=use_enhancer,
+            preprocess=quality["preprocess"] if quality else "full",
+            cancel_token=cancel_token,
+            timeout=timeout
+        )
+    elif engine_name == "MuseTalk":
+        extra = {}
+        if quality:
+            extra = {"batch_size": quality["mt_batch_size"], "resolution": quality["mt_resolution"]}
+        video_path = engine.generate(
+            img=img_path, 
+            audio=audio_path, 
+            out_dir=out_dir,
+            bbox_shift=config.get("bbox", 0),
+            cancel_token=cancel_token,
+            timeout=timeout,
+            **extra
+        )
+    
+    return video_path
+
+
+def render_within_deadline(audio_path, out_dir, budget, deadline, turn_id, index=None, cancel_token=None,
+                           quality=None, avatar_config=None):
+    """
+    在截止时间内渲染视频；来不及就放弃，该段只保留音频。
+    每次决策都写入 assets/logs/pipeline_events.jsonl，用于调整预算。
+    """
+    time_left = budget.time_left(deadline)
+    decision, reason, video_path = "audio_only", "", None
+    t0 = time.monotonic()
+
+    if time_left <= 0:
+        reason = "budget_exhausted"
+    else:
+        try:
+            video_path = video_bridge(audio_path, out_dir=out_dir, cancel_token=cancel_token,
+                                      timeout=time_left, quality=quality, avatar_config=avatar_config)
+            if video_path:
+                decision, reason = "video", "in_time"
+            else:
+                reason = "cancelled" if cancel_token and cancel_token.cancelled else "render_failed"
+        except DeadlineExceeded as e:
+            reason = "deadline"
+            print(f"⏱️ [Deadline] 第 {index} 段放弃视频: {e}")
+        except ServerBusyError as e:
+            reason = "avatar_busy"
+            print(f"🚦 [Scheduler] 渲染繁忙: {e}")
+        except TurnCancelled:
+            reason = "cancelled"
+
+    record_event(
+        "video_decision", turn=turn_id, segment=index,
+        decision=decision, reason=reason,
+        tier=quality["name"] if quality else None,
+        time_left=round(time_left, 3),
+        render_s=round(time.monotonic() - t0, 3),
+        turn_elapsed=round(budget.elapsed(), 3)
+    )
+    return video_path
+
+
+# ==========================================
+# 一轮完整对话 (不依赖 Gradio)
+# ==========================================
+
+
+def think_stream(session, user_text, cancel_token=None, priority=INTERACTIVE):
+    """
+    大脑阶段：排队进入 brain 阶段后逐段产出回复文本 (增量)
+    队列已满时抛出 ServerBusyError
+    """
+    brain = get_brain()
+    conversation = session.get_conversation(brain) if session else None
+    with stage_slot("brain", priority, cancel_token=cancel_token):
+        t0 = time.monotonic()
+        if brain.fast_model_name:
+            # 两级生成：快模型的开场白先进流水线，TTS 不必等主模型
+            generator = brain.think_with_opener(user_text, conversation)
+        else:
+            generator = brain.think_stream(user_text, conversation)
+        for chunk in generator:
+            # 轮次被取消：停止拉取后续 token (关闭流会断开上游连接)
+            if cancel_token is not None and cancel_token.cancelled:
+                generator.close()
+                return
+            yield chunk
+        observe_latency("brain", time.monotonic() - t0)
+
+
+def run_turn(session, user_text, cancel_token=None, ref_audio=None, ref_text=None,
+             stream=True, render=True, priority=INTERACTIVE, budget=None, on_audio_chunk=None):
+    """
+    brain -> TTS -> avatar，以事件流的形式产出一轮对话的全部结果：
+    - {"type": "filler", "text", "audio", "video"} 垫场短片，在真正的回复之前播放
+    - {"type": "text", "delta", "text"}        LLM 增量文本 / 累计文本
+    - {"type": "audio", "index", "path", "text"} 一段语音合成完毕 (音频先行)
+    - {"type": "video", "index", "path", "text"} 一段视频在截止时间内渲染完毕
+    - {"type": "busy" | "error", "message"}      拒绝或出错，本轮结束
+    - {"type": "done", "turn", "text"}           本轮结束
+    :param stream: True 分句流式；False 等整段回复后再合成/渲染
+    :param render: False 时只出文本和语音
+    :param budget: 延迟预算 (TurnBudget)，默认按 TURN_BUDGET / SEGMENT_RENDER_BUDGET
+    :param on_audio_chunk: on_audio_chunk(index, pcm, sample_rate)，本地合成时每个 PCM 块到达就回调
+                           (在合成线程里调用)，之后照常产出该段的 audio 事件
+    """
+    turn_id = uuid.uuid4().hex[:8]
+    # 产物按副本分目录，多个 webui 副本共用工作目录时互不覆盖
+    audio_dir = replica_dir("assets")
+    turn_dir = os.path.abspath(os.path.join(replica_dir("results"), turn_id))
+    os.makedirs(audio_dir, exist_ok=True)
+    budget = budget or TurnBudget(settings.TURN_BUDGET, settings.SEGMENT_RENDER_BUDGET)
+    quality = choose_quality(turn_id)
+    avatar_config = session.avatar if session else None
+
+    def chunk_fn(index):
+        if on_audio_chunk is None:
+            return None
+        return lambda pcm, sample_rate: on_audio_chunk(index, pcm, sample_rate)
+
+    def tts_fn(text, index):
+        output_path = os.path.join(audio_dir, f"reply_{turn_id}_{index}.wav")
+        return tts_bridge(text, ref_audio, ref_text, output_path=output_path,
+                          priority=priority, cancel_token=cancel_token, quality=quality, on_chunk=chunk_fn(index))
+
+    def render_fn(audio_path, index, ready_at):
+        seg_dir = os.path.join(turn_dir, str(index))
+        os.makedirs(seg_dir, exist_ok=True)
+        deadline = budget.video_deadline(ready_at)
+        return render_within_deadline(
+            audio_path, seg_dir, budget, deadline, turn_id, index, cancel_token,
+            quality, avatar_config
+        )
+
+    def to_event(segment):
+        path = segment[segment["kind"]]
+        if not path:
+            return None
+        return {"type": segment["kind"], "index": segment["index"], "path": path,
+                "text": segment["text"], "emotion": segment["emotion"]}
+
+    # 0. 真实请求到达：预取任务让路；命中预测的追问就直接用预先渲染好的结果
+    if priority == INTERACTIVE:
+        prefetcher = get_prefetcher()
+        prefetcher.step_aside()
+        hit = prefetcher.lookup(session, user_text, ref_audio, ref_text, avatar_config, render)
+        if hit:
+            yield from _serve_prefetched(session, user_text, hit, turn_id, ref_audio, ref_text, avatar_config, render)
+            return
+
+    # 垫场短片：先让数字人有反应 ("嗯……")，真正的第一段回复到了再接上
+    if priority == INTERACTIVE and ref_audio:
+        clip = get_filler_library().pick(ref_audio, ref_text, avatar_config or load_a2f_config())
+        if clip:
+            yield {"type": "filler", "text": clip["text"], "audio": clip["audio"],
+                   "video": clip["video"] if render else None}
+
+    normalizer = TextNormalizer(min_chars=settings.STREAM_MIN_CHARS, max_chars=settings.STREAM_MAX_CHARS)
+    pipeline = None
+    if stream and ref_audio:
+        pipeline = StreamingPipeline(tts_fn, render_fn if render else None, cancel_token)
+
+    full_text = ""
+    spoken = []        # 朗读文本 (整段模式送去 TTS)
+    try:
+        # 1. 思考 (流式出字)，规整后每说完一句就送进流水线
+        try:
+            opener_pending = bool(get_brain().fast_model_name)
+            for delta in think_stream(session, user_text, cancel_token, priority):
+                events = normalizer.feed(delta)
+                if opener_pending and any(e["type"] == "text" for e in events):
+                    # 快模型的开场白再短也单独成句，TTS 立刻开始
+                    opener_pending = False
+                    events += normalizer.flush()
+                for item in events:
+                    if item["type"] == "text":
+                        full_text += item["delta"]
+                        yield {"type": "text", "delta": item["delta"], "text": full_text}
+                    elif item["type"] == "emotion":
+                        yield item
+                    else:
+                        spoken.append(item["text"])
+                        if pipeline:
+                            pipeline.submit(item["text"], item["emotion"])
+                if pipeline:
+                    for segment in pipeline.poll():
+                        event = to_event(segment)
+                        if event: yield event
+        except ServerBusyError as e:
+            print(f"🚦 [Scheduler] 拒绝请求: {e}")
+            yield {"type": "busy", "message": BUSY_MESSAGE}
+            return
+        except TurnCancelled:
+            return
+        except Exception as e:
+            yield {"type": "error", "message": f"Error: {e}"}
+            return
+
+        if cancel_token is not None and cancel_token.cancelled:
+            return
+
+        for item in normalizer.flush():
+            if item["type"] == "text":
+                full_text += item["delta"]
+                yield {"type": "text", "delta": item["delta"], "text": full_text}
+            elif item["type"] == "emotion":
+                yield item
+            elif item["type"] == "sentence":
+                spoken.append(item["text"])
+                if pipeline:
+                    pipeline.submit(item["text"], item["emotion"])
+
+        if pipeline:
+            # 2a. 分句模式：冲刷最后半句，等待剩余片段
+            pipeline.close()
+            for segment in pipeline.poll():
+                event = to_event(segment)
+                if event: yield event
+            for segment in pipeline.drain():
+                event = to_event(segment)
+                if event: yield event
+        elif ref_audio and spoken:
+            # 2b. 整段模式：音频先行，视频赶不上本轮预算就只保留音频
+            audio_path = None
+            try:
+                output_path = os.path.join(audio_dir, f"reply_{turn_id}.wav")
+                audio_path = tts_bridge(join_sentences(spoken), ref_audio, ref_text, output_path=output_path,
+                                        priority=priority, cancel_token=cancel_token, quality=quality,
+                                        on_chunk=chunk_fn(0))
+            except ServerBusyError as e:
+                print(f"🚦 [Scheduler] TTS 繁忙: {e}")
+            except TurnCancelled:
+                return
+            if audio_path and not (cancel_token and cancel_token.cancelled):
+                yield {"type": "audio", "index": 0, "path": audio_path, "text": full_text,
+                       "emotion": normalizer.emotion}
+                if render:
+                    video_path = render_within_deadline(
+                        audio_path, turn_dir, budget, budget.video_deadline(), turn_id,
+                        cancel_token=cancel_token, quality=quality, avatar_config=avatar_config
+                    )
+                    if video_path:
+                        yield {"type": "video", "index": 0, "path": video_path, "text": full_text,
+                               "emotion": normalizer.emotion}
+
+        if priority == INTERACTIVE:
+            get_prefetcher().schedule(session, ref_audio, ref_text, avatar_config, render)
+        yield {"type": "done", "turn": turn_id, "text": full_text}
+    finally:
+        if pipeline:
+            pipeline.close()
+        # 对话记忆写回存储，下一轮落到别的副本也能接上
+        if session is not None and full_text:
+            save_session(session)
+
+
+def _serve_prefetched(session, user_text, entry, turn_id, ref_audio, ref_text, avatar_config, render):
+    """用预取缓存回答本轮：补写对话记忆，按正常顺序产出 文本 -> 音频 -> 视频"""
+    get_brain().remember(session.get_conversation(get_brain()), user_text, entry["answer"])
+    answer, _, emotion = normalize_text(entry["answer"])
+    save_session(session)
+    print(f"🔮 [Prefetch] 命中预测: {entry['question']}")
+
+    yield {"type": "text", "delta": answer, "text": answer}
+    if entry["audio"]:
+        yield {"type": "audio", "index": 0, "path": entry["audio"], "text": answer, "emotion": emotion}
+    if render and entry["video"]:
+        yield {"type": "video", "index": 0, "path": entry["video"], "text": answer, "emotion": emotion}
+    get_prefetcher().schedule(session, ref_audio, ref_text, avatar_config, render)
+    yield {"type": "done", "turn": turn_id, "text": answer}
@@ -0,0 +1,220 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import difflib
+import threading
+from collections import OrderedDict
+
+from configs.settings import settings
+from src.scheduler import stage_slot, scheduler_stats, ServerBusyError, BATCH
+from src.cancel import CancelToken, TurnCancelled, DeadlineExceeded
+from src.metrics import record_event
+from src.store import replica_dir
+from src.utils import parse_emotion
+
+# ==========================================
+# 空闲时预测性预渲染
+# ==========================================
+# 一轮结束后，TTS 与渲染器一直闲到下一条消息。趁这段时间：
+#   1. 让 LLM 预测用户最可能追问的几个问题并作答
+#   2. 用当前音色/形象把回答预先合成、渲染好，放进有上限的缓存
+# 下一条消息和某个预测足够接近时，直接从缓存出结果：
+# 规范化后完全相同，或者差别只在语气词 (“吗”、“呢”、“呀”……) 上才算命中。
+# 多一个“不”、换了个名词的问题，字面再像也是另一个问题 (命中会跳过 LLM，错的回答还会写进记忆)。
+# 预取任务全部以 BATCH 优先级排队；真实请求一到就取消 (渲染子进程会被杀掉)。
+
+
+def _normalize(text):
+    """去掉标点、空白，比较问题时忽略这些差异"""
+    return re.sub(r"[\s\W_]+", "", (text or "").lower())
+
+
+# 增删这些字不改变问题的意思
+_FILLER_CHARS = set("吗呢吧啊呀嘛哦哇啦么了的请")
+
+
+def _same_question(a, b):
+    """两个规范化后的问题是否等价：相同，或只差语气词"""
+    if a == b:
+        return True
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != "equal" and not set(a[i1:i2] + b[j1:j2]) <= _FILLER_CHARS:
+            return False
+    return True
+
+
+def _effective_avatar(avatar_config, render):
+    """会话没有单独选形象时，用全局默认形象"""
+    if not render:
+        return None
+    if avatar_config:
+        return avatar_config
+    from src.avatar.config import load_a2f_config
+    return load_a2f_config()
+
+
+def _profile_key(ref_audio, ref_text, avatar_config):
+    """缓存只对同一音色 + 同一形象有效"""
+    avatar = None
+    if avatar_config:
+        avatar = (avatar_config.get("engine"), avatar_config.get("img"))
+    return (ref_audio, ref_text or "", avatar)
+
+
+class Prefetcher:
+    def __init__(self, max_entries=None, count=None, match=None, idle_delay=None):
+        self.max_entries = max_entries or settings.PREFETCH_CACHE_SIZE
+        self.count = count or settings.PREFETCH_COUNT
+        self.match = match or settings.PREFETCH_MATCH
+        self.idle_delay = settings.PREFETCH_IDLE_DELAY if idle_delay is None else idle_delay
+        self._cache = OrderedDict()   # entry_id -> entry
+        self._tokens = set()          # 正在跑的预取任务
+        self._generation = {}         # session_id -> 代数，会话进入下一轮后旧预取作废
+        self._lock = threading.Lock()
+
+    # === 缓存 ===
+    def _drop_locked(self, entry_id):
+        entry = self._cache.pop(entry_id, None)
+        if entry and entry.get("dir"):
+            shutil.rmtree(entry["dir"], ignore_errors=True)
+
+    def _store(self, entry):
+        with self._lock:
+            if self._generation.get(entry["session"]) != entry["generation"]:
+                shutil.rmtree(entry["dir"], ignore_errors=True)
+                return
+            self._cache[entry["id"]] = entry
+            while len(self._cache) > self.max_entries:
+                self._drop_locked(next(iter(self._cache)))
+
+    def lookup(self, session, user_text, ref_audio, ref_text, avatar_config, render):
+        """找与 user_text 等价的预测 (相似度过阈值且只差语气词)；命中后从缓存移除并返回条目"""
+        if session is None:
+            return None
+        question = _normalize(user_text)
+        profile = _profile_key(ref_audio, ref_text, _effective_avatar(avatar_config, render))
+        best, best_ratio = None, 0.0
+        with self._lock:
+            for entry in self._cache.values():
+                if entry["session"] != session.session_id or entry["profile"] != profile:
+                    continue
+                ratio = difflib.SequenceMatcher(None, question, entry["key"]).ratio()
+                if ratio > best_ratio and ratio >= self.match and _same_question(question, entry["key"]):
+                    best, best_ratio = entry, ratio
+            if best is None or best_ratio < self.match:
+                return None
+            # 文件交给调用方使用，不再由缓存删除
+            self._cache.pop(best["id"], None)
+        record_event("prefetch_hit", session=str(session.session_id)[:8],
+                     question=best["question"], ratio=round(best_ratio, 3))
+        return best
+
+    # === 调度 ===
+    def step_aside(self):
+        """真实请求到达：取消所有正在跑的预取任务"""
+        with self._lock:
+            tokens, self._tokens = self._tokens, set()
+        for token in tokens:
+            token.cancel("real work arrived")
+
+    def invalidate(self, session_id):
+        """作废该会话的全部预测 (新一轮开始、清空记忆时)，返回新的代数"""
+        with self._lock:
+            generation = self._generation.get(session_id, 0) + 1
+            self._generation[session_id] = generation
+            for entry_id in [k for k, e in self._cache.items() if e["session"] == session_id]:
+                self._drop_locked(entry_id)
+            return generation
+
+    def schedule(self, session, ref_audio, ref_text, avatar_config, render):
+        """一轮结束后调用：作废该会话旧的预测，后台开始新一批预取"""
+        if not settings.PREFETCH_ENABLED or session is None:
+            return
+        token = CancelToken()
+        generation = self.invalidate(session.session_id)
+        with self._lock:
+            self._tokens.add(token)
+        threading.Thread(
+            target=self._run,
+            args=(session, generation, token, ref_audio, ref_text, avatar_config, render),
+            daemon=True
+        ).start()
+
+    def _system_idle(self):
+        return all(st["running"] == 0 and st["waiting"] == 0 for st in scheduler_stats().values())
+
+    def _wait_idle(self, token, max_wait=30.0):
+        """等到所有阶段都空闲 (稍微延迟一下，给用户紧接着的下一条消息让路)"""
+        start = time.monotonic()
+        while time.monotonic() - start < max_wait:
+            if token.wait(self.idle_delay):
+                return False
+            if self._system_idle():
+                return True
+        return False
+
+    def _run(self, session, generation, token, ref_audio, ref_text, avatar_config, render):
+        from src.brain.llm_engine import get_brain
+        from src.pipeline import tts_bridge, video_bridge
+
+        entry_dir = None
+        try:
+            if not self._wait_idle(token) or session.conversation is None:
+                return
+            avatar_config = _effective_avatar(avatar_config, render)
+            profile = _profile_key(ref_audio, ref_text, avatar_config)
+            brain = get_brain()
+            with stage_slot("brain", BATCH, cancel_token=token):
+                items = brain.predict_followups(session.conversation, self.count)
+
+            for item in items:
+                token.raise_if_cancelled()
+                entry_dir = os.path.join(replica_dir("assets"), "prefetch", uuid.uuid4().hex[:8])
+                os.makedirs(entry_dir, exist_ok=True)
+                entry = {
+                    "id": uuid.uuid4().hex, "session": session.session_id, "generation": generation,
+                    "question": item["question"], "key": _normalize(item["question"]),
+                    "answer": item["answer"], "dir": entry_dir,
+                    "profile": profile,
+                    "audio": None, "video": None
+                }
+                if ref_audio:
+                    # 情绪标签不读出来
+                    entry["audio"] = tts_bridge(
+                        parse_emotion(item["answer"])[0], ref_audio, ref_text,
+                        output_path=os.path.join(entry_dir, "reply.wav"),
+                        priority=BATCH, cancel_token=token
+                    )
+                if render and entry["audio"] and avatar_config and avatar_config.get("img"):
+                    entry["video"] = video_bridge(
+                        entry["audio"], out_dir=entry_dir, priority=BATCH,
+                        cancel_token=token, avatar_config=avatar_config
+                    )
+                token.raise_if_cancelled()
+                self._store(entry)
+                entry_dir = None
+                print(f"🔮 [Prefetch] 已预备: {item['question']}")
+        except (TurnCancelled, ServerBusyError, DeadlineExceeded):
+            pass
+        except Exception as e:
+            print(f"⚠️ [Prefetch] 预取失败: {e}")
+        finally:
+            # 做了一半被打断的条目，删掉它的文件
+            if entry_dir:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            with self._lock:
+                self._tokens.discard(token)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
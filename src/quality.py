@@ -0,0 +1,96 @@
+import threading
+import time
+
+from configs.settings import settings
+from src.scheduler import scheduler_stats
+from src.metrics import record_event, recent_latencies, percentile
+
+# ==========================================
+# 负载自适应画质控制
+# ==========================================
+# 系统饱和时，每一轮沿着画质阶梯往下走一级；负载回落后再往上走。
+# 0 级完全遵循 a2f_config.json / TTS 默认参数，后面每级逐步减负。
+
+QUALITY_TIERS = [
+    # 0: 原画质
+    {"name": "high", "enhancer": True, "preprocess": "full",
+     "mt_batch_size": 8, "mt_resolution": 512, "tts_steps": None},
+    # 1: 关闭 GFPGAN 面部增强 (SadTalker 最耗时的一步)
+    {"name": "medium", "enhancer": False, "preprocess": "full",
+     "mt_batch_size": 8, "mt_resolution": 512, "tts_steps": 8},
+    # 2: full -> crop 预处理，MuseTalk 降批量与分辨率
+    {"name": "low", "enhancer": False, "preprocess": "crop",
+     "mt_batch_size": 4, "mt_resolution": 384, "tts_steps": 6},
+    # 3: 最低档，保证能出结果
+    {"name": "minimal", "enhancer": False, "preprocess": "crop",
+     "mt_batch_size": 2, "mt_resolution": 256, "tts_steps": 4},
+]
+
+
+class QualityController:
+    """
+    观察各阶段排队深度与最近渲染/合成耗时，决定每轮使用的画质等级
+    - 任一阶段排队数 >= 并发数，或渲染 p50 超过预算的 step_down_ratio：降一级
+    - 全部阶段无排队，且渲染 p50 低于预算的 step_up_ratio：升一级
+    - 两次调整之间至少间隔 dwell 秒，避免来回抖动
+    """
+    def __init__(self, tiers=QUALITY_TIERS, render_budget=None, dwell=None,
+                 step_down_ratio=0.8, step_up_ratio=0.4):
+        self.tiers = tiers
+        self.render_budget = render_budget or settings.SEGMENT_RENDER_BUDGET
+        self.dwell = settings.QUALITY_DWELL if dwell is None else dwell
+        self.step_down_ratio = step_down_ratio
+        self.step_up_ratio = step_up_ratio
+        self.level = 0
+        self._last_change = 0.0
+        self._lock = threading.Lock()
+
+    def _load_signals(self):
+        stats = scheduler_stats()
+        saturated = [name for name, st in stats.items() if st["waiting"] >= st["concurrency"]]
+        idle = all(st["waiting"] == 0 for st in stats.values())
+        render_p50 = percentile(recent_latencies("avatar")[-10:], 50)
+        tts_p50 = percentile(recent_latencies("tts")[-10:], 50)
+        return stats, saturated, idle, render_p50, tts_p50
+
+    def choose(self, turn_id=None):
+        """为新的一轮选择画质等级，返回 tier 字典"""
+        stats, saturated, idle, render_p50, tts_p50 = self._load_signals()
+        render_ratio = render_p50 / self.render_budget if render_p50 else 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            old_level = self.level
+            reason = "steady"
+            if now - self._last_change >= self.dwell:
+                if saturated or render_ratio > self.step_down_ratio:
+                    if self.level < len(self.tiers) - 1:
+                        self.level += 1
+                        reason = f"saturated:{','.join(saturated)}" if saturated else "render_slow"
+                elif idle and render_ratio < self.step_up_ratio:
+                    if self.level > 0:
+                        self.level -= 1
+                        reason = "load_dropped"
+            if self.level != old_level:
+                self._last_change = now
+            level = self.level
+
+        tier = dict(self.tiers[level], level=level)
+        if level != old_level:
+            print(f"🎚️ [Quality] {self.tiers[old_level]['name']} -> {tier['name']} ({reason})")
+        record_event(
+            "quality_tier", turn=turn_id, tier=tier["name"], level=level, reason=reason,
+            queue={name: st["waiting"] for name, st in stats.items()},
+            render_p50=render_p50, tts_p50=tts_p50
+        )
+        return tier
+
+
+_controller = None
+
+
+def get_quality_controller():
+    global _controller
+    if _controller is None:
+        _controller = QualityController()
+    return _controller
@@ -0,0 +1,132 @@
+import threading
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+
+from configs.settings import settings
+from src.cancel import check_cancelled
+
+# ==========================================
+# 分阶段调度器 (Brain / TTS / Avatar)
+# ==========================================
+
+# 优先级：数值越小越先执行
+INTERACTIVE = 0   # 用户正在等的对话
+BATCH = 1         # 离线批处理、预渲染等后台任务
+
+BUSY_MESSAGE = "⚠️ 服务器繁忙，请稍后再试"
+
+
+class ServerBusyError(RuntimeError):
+    """队列已满或排队超时，快速拒绝"""
+    pass
+
+
+class StageLimiter:
+    """
+    单个阶段的并发闸门：
+    - 同时最多 concurrency 个任务在跑
+    - 排队数量有上限，满了直接拒绝 (不会无限堆积)
+    - 按优先级出队，同优先级先来先服务
+    - 后台任务最多只能占用一半的排队位，给交互请求留位置
+    """
+    def __init__(self, name, concurrency, max_queue, wait_timeout=None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self.rejected = 0
+
+    def _queue_limit(self, priority):
+        if priority >= BATCH:
+            return self.max_queue // 2
+        return self.max_queue
+
+    def acquire(self, priority=INTERACTIVE, timeout=None, cancel_token=None):
+        if timeout is None:
+            timeout = self.wait_timeout
+        check_cancelled(cancel_token)
+
+        with self._cond:
+            # 1. 有空位且没人排队：直接执行
+            if self._running < self.concurrency and not self._waiting:
+                self._running += 1
+                return
+
+            # 2. 队列已满：快速拒绝
+            if len(self._waiting) >= self._queue_limit(priority):
+                self.rejected += 1
+                raise ServerBusyError(f"{self.name} 队列已满 ({len(self._waiting)})")
+
+            # 3. 排队等待
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            deadline = time.monotonic() + timeout if timeout else None
+            try:
+                while not (self._running < self.concurrency and self._waiting[0] == ticket):
+                    remaining = deadline - time.monotonic() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        self.rejected += 1
+                        raise ServerBusyError(f"{self.name} 排队超时")
+                    # 带取消令牌时分片等待，轮次被取消就立刻离开队列
+                    if cancel_token is not None:
+                        remaining = min(remaining, 0.2) if remaining is not None else 0.2
+                    self._cond.wait(remaining)
+                    check_cancelled(cancel_token)
+                heapq.heappop(self._waiting)
+                self._running += 1
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+    def release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, timeout=None, cancel_token=None):
+        self.acquire(priority, timeout, cancel_token)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._running,
+                "waiting": len(self._waiting),
+                "concurrency": self.concurrency,
+                "max_queue": self.max_queue,
+                "rejected": self.rejected
+            }
+
+
+# === 全局阶段表 ===
+_stages = {
+    "brain": StageLimiter("brain", settings.BRAIN_CONCURRENCY, settings.BRAIN_QUEUE_SIZE, settings.STAGE_WAIT_TIMEOUT),
+    "tts": StageLimiter("tts", settings.TTS_CONCURRENCY, settings.TTS_QUEUE_SIZE, settings.STAGE_WAIT_TIMEOUT),
+    "avatar": StageLimiter("avatar", settings.AVATAR_CONCURRENCY, settings.AVATAR_QUEUE_SIZE, settings.STAGE_WAIT_TIMEOUT),
+}
+
+
+def get_stage(name):
+    return _stages[name]
+
+
+def stage_slot(name, priority=INTERACTIVE, timeout=None, cancel_token=None):
+    """用法: with stage_slot("tts"): ..."""
+    return _stages[name].slot(priority, timeout, cancel_token)
+
+
+def scheduler_stats():
+    return {name: stage.stats() for name, stage in _stages.items()}
@@ -0,0 +1,412 @@
+import os
+import sys
+import json
+import uuid
+import base64
+import asyncio
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from configs.settings import settings
+from src.utils import load_tts_settings
+from src.audio.runtime import load_tts_from_config
+from src.audio.voices import get_voice_registry
+from src.pipeline import run_turn
+from src.scheduler import scheduler_stats, get_stage, ServerBusyError, INTERACTIVE
+from src.cancel import begin_turn, cancel_turn, end_turn, TurnCancelled
+from src.session import get_session, get_session_manager, save_session
+from src.brain.llm_engine import get_brain
+from src.warmup import get_warmer
+
+# ==========================================
+# 无界面 HTTP + WebSocket 服务
+# ==========================================
+# 与 webui.py 共用同一条 brain -> TTS -> avatar 流水线 (src/pipeline.run_turn)，
+# 但不经过 Gradio，前端和负载均衡可以直接对接。
+#
+# 启动: python -m src.server.app --port 8000
+
+app = FastAPI(title="guanhelujue API")
+
+# 只能下载本副本交给客户端的产物 (令牌 -> 绝对路径)，状态存储、缓存、任务目录一律不可访问
+_artifacts = OrderedDict()
+_artifacts_lock = threading.Lock()
+
+
+class ChatRequest(BaseModel):
+    text: str
+    session_id: str | None = None
+
+
+class VoiceRequest(BaseModel):
+    name: str
+    ref_text: str = ""
+    audio: str                  # base64 编码的参考音频
+    ext: str = ".wav"
+
+
+class TurnRequest(BaseModel):
+    text: str
+    session_id: str | None = None
+    voice_id: str | None = None
+    stream: bool = True
+    render: bool = True
+
+
+# === 工具函数 ===
+def _resolve_voice(session, voice_id=None):
+    """
+    音色优先级：本次请求的音色 ID > 会话记住的 > tts_config.json 默认
+    客户端不能直接指定服务器上的文件路径，新音色先通过 POST /v1/voices 上传注册
+    """
+    voice = get_voice_registry().get(voice_id) if voice_id else None
+    if voice_id and voice is None:
+        raise HTTPException(status_code=404, detail=f"未知音色: {voice_id}")
+    if voice:
+        session.voice = {"ref_audio": voice["ref_audio"], "ref_text": voice["ref_text"]}
+    if not session.voice.get("ref_audio"):
+        config = load_tts_settings()
+        session.voice = {"ref_audio": config.get("ref_audio"), "ref_text": config.get("ref_text") or ""}
+    return session.voice.get("ref_audio"), session.voice.get("ref_text")
+
+
+def _artifact_url(path):
+    """登记一个产物并返回下载地址；地址里只有随机令牌，不暴露服务器路径"""
+    if not path:
+        return None
+    token = uuid.uuid4().hex
+    with _artifacts_lock:
+        _artifacts[token] = os.path.abspath(path)
+        while len(_artifacts) > settings.API_ARTIFACT_MAX:
+            _artifacts.popitem(last=False)
+    return f"/v1/artifacts/{token}/{os.path.basename(path)}"
+
+
+def _read_pcm16(path):
+    """读取音频并转为 16bit 单声道 PCM (兼容其它采样格式的 WAV)"""
+    import torchaudio
+    waveform, sample_rate = torchaudio.load(path)
+    pcm = (waveform[0].clamp(-1, 1) * 32767).short().numpy().tobytes()
+    return pcm, sample_rate
+
+
+def _encode_opus(path):
+    """用 FFmpeg 把音频转成 Ogg/Opus 字节流"""
+    cmd = ["ffmpeg", "-loglevel", "error", "-i", path, "-c:a", "libopus", "-b:a", "32k", "-f", "ogg", "pipe:1"]
+    return subprocess.run(cmd, check=True, capture_output=True).stdout
+
+
+def _encode_audio(path, audio_format):
+    if audio_format == "opus":
+        return _encode_opus(path), 48000
+    if audio_format == "wav":
+        with open(path, "rb") as f:
+            return f.read(), None
+    return _read_pcm16(path)
+
+
+# === REST ===
+@app.get("/v1/health")
+async def health():
+    return {"status": "ok", "stages": scheduler_stats(), "sessions": get_session_manager().stats()}
+
+
+@app.get("/v1/voices")
+async def voices():
+    """音色库 (在 WebUI 语音面板注册)，turn 请求可以用 voice_id 选择"""
+    return [{"id": v["id"], "name": v["name"], "ref_text": v["ref_text"]} for v in get_voice_registry().list()]
+
+
+@app.post("/v1/voices")
+async def register_voice(req: VoiceRequest):
+    """上传参考音频 (base64) 注册音色，返回音色 ID"""
+    ext = req.ext if req.ext.lower() in (".wav", ".mp3", ".flac", ".ogg", ".m4a") else ".wav"
+    try:
+        data = base64.b64decode(req.audio, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="audio 不是合法的 base64")
+    fd, tmp = tempfile.mkstemp(suffix=ext)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # 注册时会复制到共享缓存，临时文件随后删除
+        voice = await run_in_threadpool(get_voice_registry().register, req.name, tmp, req.ref_text)
+    finally:
+        os.remove(tmp)
+    return {"id": voice["id"], "name": voice["name"], "ref_text": voice["ref_text"]}
+
+
+@app.post("/v1/turn")
+async def turn(req: TurnRequest, request: Request):
+    """完整的一轮：等全部结果生成后一次性返回；客户端断开时取消本轮，释放 TTS / 渲染名额"""
+    session_id = req.session_id or uuid.uuid4().hex
+    session = get_session(session_id)
+    ref_audio, ref_text = _resolve_voice(session, req.voice_id)
+    cancel_token = begin_turn(session_id)
+
+    def collect():
+        result = {"session_id": session_id, "status": "ok", "text": "", "audio": [], "video": []}
+        try:
+            for event in run_turn(session, req.text, cancel_token, ref_audio, ref_text,
+                                  stream=req.stream, render=req.render):
+                kind = event["type"]
+                if kind in ("audio", "video"):
+                    result[kind].append(_artifact_url(event["path"]))
+                elif kind in ("busy", "error"):
+                    result["status"] = kind
+                    result["message"] = event["message"]
+                elif kind == "done":
+                    result["turn"] = event["turn"]
+                    result["text"] = event["text"]
+        finally:
+            end_turn(session_id, cancel_token)
+        return result
+
+    task = asyncio.ensure_future(run_in_threadpool(collect))
+    while not task.done():
+        await asyncio.wait({task}, timeout=0.5)
+        if not task.done() and await request.is_disconnected():
+            cancel_token.cancel("client disconnect")
+            # 等流水线收尾 (释放令牌)，结果已经没人要了
+            await asyncio.wait({task})
+            return None
+    result = task.result()
+    if result["status"] == "busy":
+        raise HTTPException(status_code=503, detail=result["message"])
+    return result
+
+
+@app.post("/v1/chat")
+async def chat(req: ChatRequest):
+    """
+    只要文字回复：SSE 流式返回 LLM 增量文本
+    直接在事件循环里跑 (共享连接池的异步客户端)，不占线程，适合大量并发会话
+    和其它入口一样先排队进入 brain 阶段 (满了返回 503)，同一会话的新一轮会取消它；
+    被取消时以 {"type": "cancelled"} 结束
+    """
+    session_id = req.session_id or uuid.uuid4().hex
+    session = get_session(session_id)
+    brain = get_brain()
+    conversation = session.get_conversation(brain)
+    cancel_token = begin_turn(session_id)
+    stage = get_stage("brain")
+
+    def cancelled_event():
+        return f"data: {json.dumps({'type': 'cancelled', 'reason': cancel_token.reason}, ensure_ascii=False)}\n\n"
+
+    try:
+        # 排队是阻塞等待，放到线程池里
+        await run_in_threadpool(stage.acquire, INTERACTIVE, None, cancel_token)
+    except ServerBusyError as e:
+        end_turn(session_id, cancel_token)
+        raise HTTPException(status_code=503, detail=str(e))
+    except TurnCancelled:
+        end_turn(session_id, cancel_token)
+        return StreamingResponse(iter([cancelled_event()]), media_type="text/event-stream")
+
+    once = threading.Lock()
+
+    def finish():
+        # 生成器收尾和响应结束后的后台任务都会调用；客户端早早断开时生成器可能根本没开始
+        if once.acquire(blocking=False):
+            stage.release()
+            end_turn(session_id, cancel_token)
+
+    async def events():
+        full_text = ""
+        generator = brain.athink_stream(req.text, conversation)
+        try:
+            yield f"data: {json.dumps({'type': 'session', 'session_id': session_id})}\n\n"
+            async for delta in generator:
+                if cancel_token.cancelled:
+                    yield cancelled_event()
+                    return
+                full_text += delta
+                yield f"data: {json.dumps({'type': 'text', 'delta': delta}, ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps({'type': 'done', 'text': full_text}, ensure_ascii=False)}\n\n"
+        finally:
+            # 关闭生成器会断开上游连接
+            await generator.aclose()
+            finish()
+            if full_text:
+                await run_in_threadpool(save_session, session)
+
+    return StreamingResponse(events(), media_type="text/event-stream", background=BackgroundTask(finish))
+
+
+@app.get("/v1/artifacts/{token}/{name}")
+async def artifact(token: str, name: str):
+    with _artifacts_lock:
+        full_path = _artifacts.get(token)
+    if not full_path or os.path.basename(full_path) != name or not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="not found")
+    return FileResponse(full_path)
+
+
+# === WebSocket ===
+@app.websocket("/v1/stream")
+async def stream(ws: WebSocket):
+    """
+    客户端发送:
+      {"type": "turn", "text": ..., "session_id"?, "voice_id"?, "turn_id"?,
+       "render"?: true, "audio_format"?: "pcm" | "opus" | "wav", "audio_chunks"?: false}
+      {"type": "cancel"}
+      {"type": "typing", "text": ...}   用户输入中，预热 LLM 连接 / TTS / 形象
+    服务端推送 (JSON)：session / filler / text / emotion / audio / video / busy / error / done；
+    每个 audio 消息之后紧跟一帧二进制音频数据。
+    新的 turn 会取消上一轮，上一轮剩下的消息直接丢弃，新一轮的消息要等上一轮完全收尾后才开始推送。
+    除 session 外的消息都带 turn_id (客户端没给时由服务端编号)，客户端据此区分各轮。
+    audio_chunks=true (仅 pcm)：边合成边推 audio_chunk 消息 (index、sample_rate、bytes)，各跟一帧 PCM；
+    该段合成完后的 audio 消息带 streamed=true，不再重复发送音频数据 (只给下载地址)。
+    某段只有 audio_chunk 而没有 audio 消息，说明合成中途失败，应丢弃这些数据。
+    TTS 交给远程 worker 时没有 audio_chunk，照常整段发送。
+    """
+    await ws.accept()
+    loop = asyncio.get_running_loop()
+    send_lock = asyncio.Lock()
+    session_id = ws.query_params.get("session_id") or uuid.uuid4().hex
+    current = {"task": None, "seq": 0}
+
+    async def send_json(data):
+        async with send_lock:
+            await ws.send_json(data)
+
+    async def send_pair(header, data):
+        # JSON 头和二进制帧必须成对发出：轮次被取消也要把这一对发完
+        async def pair():
+            async with send_lock:
+                await ws.send_json(header)
+                await ws.send_bytes(data)
+        await asyncio.shield(pair())
+
+    async def run(msg, turn_id):
+        async def send(data):
+            await send_json({**data, "turn_id": turn_id})
+
+        session = get_session(session_id)
+        try:
+            ref_audio, ref_text = _resolve_voice(session, msg.get("voice_id"))
+        except HTTPException as e:
+            await send({"type": "error", "message": e.detail})
+            return
+        audio_format = msg.get("audio_format", "pcm")
+        chunked = bool(msg.get("audio_chunks")) and audio_format == "pcm"
+        streamed = set()    # 已经边合成边推过的段
+        cancel_token = begin_turn(session_id)
+        events = asyncio.Queue()
+
+        def on_audio_chunk(index, pcm, sample_rate):
+            # 合成线程里调用：转交给事件循环，和其它事件保持先后顺序
+            loop.call_soon_threadsafe(events.put_nowait, {"type": "audio_chunk", "index": index,
+                                                          "pcm": pcm, "sample_rate": sample_rate})
+
+        def produce():
+            try:
+                for event in run_turn(session, msg.get("text", ""), cancel_token, ref_audio, ref_text,
+                                      stream=True, render=msg.get("render", True),
+                                      on_audio_chunk=on_audio_chunk if chunked else None):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, {"type": "error", "message": str(e)})
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                kind = event["type"]
+                if kind == "text":
+                    await send({"type": "text", "delta": event["delta"]})
+                elif kind == "audio_chunk":
+                    streamed.add(event["index"])
+                    await send_pair({"type": "audio_chunk", "index": event["index"], "turn_id": turn_id,
+                                     "sample_rate": event["sample_rate"], "bytes": len(event["pcm"])},
+                                    event["pcm"])
+                elif kind == "audio" and event["index"] in streamed:
+                    await send({"type": "audio", "index": event["index"], "text": event["text"],
+                                "emotion": event.get("emotion", "default"), "format": audio_format,
+                                "streamed": True, "bytes": 0, "url": _artifact_url(event["path"])})
+                elif kind == "audio":
+                    data, sample_rate = await run_in_threadpool(_encode_audio, event["path"], audio_format)
+                    await send_pair({
+                        "type": "audio", "index": event["index"], "text": event["text"],
+                        "emotion": event.get("emotion", "default"), "turn_id": turn_id,
+                        "format": audio_format, "sample_rate": sample_rate,
+                        "bytes": len(data), "url": _artifact_url(event["path"])
+                    }, data)
+                elif kind == "video":
+                    await send({"type": "video", "index": event["index"], "emotion": event.get("emotion", "default"),
+                                "url": _artifact_url(event["path"])})
+                elif kind == "filler":
+                    await send({"type": "filler", "text": event["text"],
+                                "audio_url": _artifact_url(event["audio"]),
+                                "video_url": _artifact_url(event["video"])})
+                else:
+                    await send(event)
+        finally:
+            cancel_token.cancel("turn closed")
+            end_turn(session_id, cancel_token)
+
+    await send_json({"type": "session", "session_id": session_id})
+    try:
+        while True:
+            msg = await ws.receive_json()
+            if msg.get("type") == "cancel":
+                cancel_turn(session_id, "client cancel")
+            elif msg.get("type") == "typing":
+                get_warmer().touch(session_id, msg.get("text", ""))
+            elif msg.get("type") == "turn":
+                old = current["task"]
+                if old and not old.done():
+                    # 停止转发上一轮剩下的事件，等它收尾 (释放令牌) 后再开始新一轮
+                    cancel_turn(session_id, "new input")
+                    old.cancel()
+                    await asyncio.wait({old})
+                current["seq"] += 1
+                turn_id = str(msg.get("turn_id") or current["seq"])
+                current["task"] = asyncio.create_task(run(msg, turn_id))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        cancel_turn(session_id, "disconnect")
+        if current["task"]:
+            current["task"].cancel()
+
+
+@app.on_event("startup")
+async def on_startup():
+    # 提前创建大脑并在后台预热 DNS / TLS，第一个请求不用等冷连接
+    try:
+        if settings.LLM_PREWARM:
+            brain = await run_in_threadpool(get_brain)
+            brain.prewarm()
+    except Exception as e:
+        print(f"⚠️ [Server] 大脑初始化失败: {e}")
+    if settings.API_LOAD_TTS:
+        await run_in_threadpool(load_tts_from_config)
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="guanhelujue 无界面服务")
+    parser.add_argument("--host", default=settings.API_HOST)
+    parser.add_argument("--port", type=int, default=settings.API_PORT)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,176 @@
+import time
+import json
+import uuid
+import random
+import asyncio
+import hashlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ==========================================
+# 本地模拟 LLM 服务 (OpenAI chat-completions 协议)
+# ==========================================
+# 压测和延迟测试不需要真实 Key 和网络：
+#   python -m src.server.mock_llm --port 8001 --ttft 0.4 --tps 30 --jitter 0.2 --error-rate 0.02
+# 然后把 LLM_BASE_URL 指向 http://127.0.0.1:8001/v1 (LLM_API_KEY 随便填)。
+#
+# - 支持 stream=true (SSE) 与普通返回，/v1/models 供连接预热使用
+# - 回复内容和时延由 (种子, 请求消息, 同样消息的第几次请求) 决定，重启后重放结果一样，方便复现
+# - 运行中可以 POST /mock/config 修改参数 (例如让某个端点突然变慢，测试路由与对冲)
+# - GET /mock/stats 查看请求数、出错数、在途数
+
+SENTENCES = [
+    "好的，我来帮你看看。", "这个问题很常见。", "简单来说，可以分成三步。",
+    "首先要确认当前的配置是否正确。", "然后再逐项检查日志里的报错。", "如果还有问题，可以换一个参数再试一次。",
+    "我觉得这个思路是可行的。", "另外，也要注意运行环境的差异。", "希望这些信息对你有帮助！",
+    "还有什么想了解的吗？"
+]
+
+config = {
+    "ttft": 0.4,            # 首 token 延迟 (秒)
+    "tps": 30.0,            # 每秒 token 数
+    "jitter": 0.2,          # 时延随机抖动比例 (±)
+    "error_rate": 0.0,      # 直接返回错误的概率
+    "error_status": 500,    # 注入错误的 HTTP 状态码 (例如 429 模拟限流)
+    "stream_error_rate": 0.0,  # 流式输出中途断开的概率
+    "reply_tokens": 60,     # 回复长度上限 (token，仍受 max_tokens 限制)
+    "seed": 0
+}
+stats = {"requests": 0, "errors": 0, "stream_errors": 0, "active": 0}
+_seen = {}   # 消息摘要 -> 已请求次数
+
+app = FastAPI(title="mock LLM")
+
+
+def _rng(messages):
+    """同样的消息第 n 次请求，随机序列都一样 (重试可以得到不同结果，但整体可复现)"""
+    digest = hashlib.sha1(json.dumps([config["seed"], messages], ensure_ascii=False).encode("utf-8")).hexdigest()
+    attempt = _seen.get(digest, 0)
+    _seen[digest] = attempt + 1
+    return random.Random(f"{digest}:{attempt}")
+
+
+def _jittered(rng, seconds):
+    return max(0.0, seconds * (1 + rng.uniform(-config["jitter"], config["jitter"])))
+
+
+def _tokens(rng, max_tokens):
+    """按句拼出回复，再切成 1~2 个字一个的 token"""
+    limit = min(config["reply_tokens"], max_tokens or config["reply_tokens"])
+    text = ""
+    while len(text) < limit * 1.5:
+        text += rng.choice(SENTENCES)
+    tokens, i = [], 0
+    while i < len(text) and len(tokens) < limit:
+        size = rng.choice((1, 2))
+        tokens.append(text[i:i + size])
+        i += size
+    return tokens
+
+
+def _chunk(completion_id, model, created, delta, finish_reason=None):
+    return {
+        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    model = body.get("model") or "mock"
+    rng = _rng(messages)
+    stats["requests"] += 1
+
+    if rng.random() < config["error_rate"]:
+        stats["errors"] += 1
+        await asyncio.sleep(_jittered(rng, config["ttft"]) / 2)
+        return JSONResponse(status_code=config["error_status"],
+                            content={"error": {"message": "mock injected error", "type": "server_error"}})
+
+    tokens = _tokens(rng, body.get("max_tokens"))
+    ttft = _jittered(rng, config["ttft"])
+    intervals = [_jittered(rng, 1.0 / max(config["tps"], 0.001)) for _ in tokens]
+    break_at = rng.randrange(1, max(2, len(tokens))) if rng.random() < config["stream_error_rate"] else None
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        stats["active"] += 1
+        try:
+            await asyncio.sleep(ttft + sum(intervals))
+        finally:
+            stats["active"] -= 1
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": {"prompt_tokens": sum(len(m.get("content") or "") for m in messages),
+                      "completion_tokens": len(tokens),
+                      "total_tokens": sum(len(m.get("content") or "") for m in messages) + len(tokens)}
+        }
+
+    async def events():
+        stats["active"] += 1
+        try:
+            await asyncio.sleep(ttft)
+            yield f"data: {json.dumps(_chunk(completion_id, model, created, {'role': 'assistant', 'content': ''}))}\n\n"
+            for i, (token, interval) in enumerate(zip(tokens, intervals)):
+                if i == break_at:
+                    # 模拟连接中途断开：不发 [DONE] 直接结束
+                    stats["stream_errors"] += 1
+                    raise ConnectionResetError("mock injected stream break")
+                if i:
+                    await asyncio.sleep(interval)
+                yield f"data: {json.dumps(_chunk(completion_id, model, created, {'content': token}), ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps(_chunk(completion_id, model, created, {}, 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["active"] -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/mock/stats")
+async def get_stats():
+    return {"config": config, **stats}
+
+
+@app.post("/mock/config")
+async def set_config(request: Request):
+    """运行中修改参数，只更新传入的字段"""
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    return config
+
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务 (OpenAI 协议)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=config["ttft"], help="首 token 延迟 (秒)")
+    parser.add_argument("--tps", type=float, default=config["tps"], help="每秒 token 数")
+    parser.add_argument("--jitter", type=float, default=config["jitter"], help="时延抖动比例，0.2 表示 ±20%%")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="请求直接失败的概率")
+    parser.add_argument("--error-status", type=int, default=config["error_status"], help="注入错误的 HTTP 状态码")
+    parser.add_argument("--stream-error-rate", type=float, default=config["stream_error_rate"], help="流式中途断开的概率")
+    parser.add_argument("--reply-tokens", type=int, default=config["reply_tokens"], help="回复长度上限 (token)")
+    parser.add_argument("--seed", type=int, default=config["seed"])
+    args = parser.parse_args()
+    for key in config:
+        config[key] = getattr(args, key)
+    _seen.clear()
+    print(f"🧪 模拟 LLM 服务: http://{args.host}:{args.port}/v1  {config}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import OrderedDict
+
+from configs.settings import settings
+from src.cancel import cancel_turn, has_active_turn
+from src.store import get_state_store
+
+# ==========================================
+# 会话管理 (按 Gradio session 隔离)
+# ==========================================
+# 重资产 (LLM 客户端、TTS 模型、渲染引擎) 全进程共享；
+# 每个会话只保存轻量状态：对话记忆、音色选择、形象选择。
+# 超过 TTL 未活动、或超出数量/内存预算时按 LRU 淘汰；正在进行轮次的会话不淘汰。
+# 会话同时写入状态存储 (src/store.py)，本进程里的只是缓存：
+# 多个 webui 副本共用一个存储，请求落到任何副本都能接着聊。
+
+# 每个会话的固定开销估算 (字典、对象头等)
+_SESSION_OVERHEAD = 4 * 1024
+
+
+class SessionState:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.conversation = None   # src.brain.llm_engine.Conversation
+        self.voice = {}            # {"ref_audio": ..., "ref_text": ...}
+        self.avatar = None         # 与 a2f_config.json 同结构；None 表示使用全局默认
+        self.created = time.time()
+        self.last_active = self.created
+        self.updated = 0.0                 # 最后一次写入/读出存储时的时间戳
+        self._conversation_data = None     # 从存储读出、尚未恢复的对话记忆
+
+    def get_conversation(self, brain):
+        """取本会话的对话记忆，第一次使用时向共享的 LLMEngine 申请一份 (或从存储恢复)"""
+        if self.conversation is None:
+            if self._conversation_data:
+                self.conversation = brain.restore_conversation(self._conversation_data)
+                self._conversation_data = None
+            else:
+                self.conversation = brain.new_conversation()
+        return self.conversation
+
+    def reset_conversation(self):
+        self.conversation = None
+        self._conversation_data = None
+
+    def to_dict(self):
+        if self.conversation is not None:
+            conversation = self.conversation.to_dict()
+        else:
+            conversation = self._conversation_data
+        return {"conversation": conversation, "voice": self.voice, "avatar": self.avatar,
+                "created": self.created, "updated": self.updated}
+
+    def load(self, data):
+        self.conversation = None
+        self._conversation_data = data.get("conversation")
+        self.voice = data.get("voice") or {}
+        self.avatar = data.get("avatar")
+        self.created = data.get("created", self.created)
+        self.updated = data.get("updated", 0.0)
+
+    def approx_bytes(self):
+        size = _SESSION_OVERHEAD
+        if self.conversation is not None:
+            size += self.conversation.approx_bytes()
+        elif self._conversation_data:
+            size += sum(len(m["content"].encode("utf-8"))
+                        for m in self._conversation_data.get("openai_history", []))
+        return size
+
+
+class SessionManager:
+    def __init__(self, max_sessions=None, ttl=None, memory_budget_mb=None):
+        self.max_sessions = max_sessions or settings.SESSION_MAX
+        self.ttl = ttl or settings.SESSION_TTL
+        budget_mb = memory_budget_mb or settings.SESSION_MEMORY_MB
+        self.memory_budget = int(budget_mb * 1024 * 1024)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def get(self, session_id):
+        """取 (或创建) 会话，并标记为最近使用；存储里有更新的版本 (其它副本写的) 就先同步"""
+        session_id = session_id or "default"
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState(session_id)
+                self._sessions[session_id] = state
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_active = time.time()
+            evicted = self._evict_locked(keep=session_id)
+
+        self._sync(state)
+        for sid, reason in evicted:
+            self._on_evict(sid, reason)
+        self._purge_store()
+        return state
+
+    def _sync(self, state):
+        try:
+            data = get_state_store().get("session", state.session_id)
+        except Exception as e:
+            print(f"⚠️ [Session] 读取会话失败: {e}")
+            return
+        if data and data.get("updated", 0.0) > state.updated:
+            state.load(data)
+
+    def save(self, state):
+        """把会话写回存储 (每轮结束、切换音色/形象、清空记忆后调用)"""
+        state.updated = time.time()
+        try:
+            get_state_store().put("session", state.session_id, state.to_dict())
+        except Exception as e:
+            print(f"⚠️ [Session] 保存会话失败: {e}")
+
+    def _purge_store(self):
+        """存储里超过 TTL 的会话由任意副本顺手清理，最多每分钟一次"""
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        try:
+            get_state_store().purge("session", self.ttl)
+        except Exception as e:
+            print(f"⚠️ [Session] 清理过期会话失败: {e}")
+
+    def drop(self, session_id):
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+        if state is not None:
+            self._on_evict(session_id, "closed")
+        try:
+            get_state_store().delete("session", session_id)
+        except Exception as e:
+            print(f"⚠️ [Session] 删除会话失败: {e}")
+
+    def _evict_locked(self, keep=None):
+        evicted = []
+        now = time.time()
+
+        # 1. TTL：长时间不活动的会话
+        for sid, state in list(self._sessions.items()):
+            if sid != keep and now - state.last_active > self.ttl and not has_active_turn(sid):
+                del self._sessions[sid]
+                evicted.append((sid, "ttl"))
+
+        # 2. LRU：超出数量或内存预算，从最久未用的开始淘汰
+        def over_budget():
+            if len(self._sessions) > self.max_sessions:
+                return True
+            return sum(s.approx_bytes() for s in self._sessions.values()) > self.memory_budget
+
+        for sid in list(self._sessions.keys()):
+            if not over_budget():
+                break
+            # last_active 只在 get() 时刷新，跑着长轮次的会话可能显得 “最久未用”，不能把它的轮次杀掉
+            if sid == keep or has_active_turn(sid):
+                continue
+            del self._sessions[sid]
+            evicted.append((sid, "lru"))
+        return evicted
+
+    def _on_evict(self, session_id, reason):
+        cancel_turn(session_id, f"session {reason}")
+        print(f"🧹 [Session] 会话 {str(session_id)[:8]} 已释放 ({reason})")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "approx_bytes": sum(s.approx_bytes() for s in self._sessions.values()),
+                "max_sessions": self.max_sessions,
+                "memory_budget": self.memory_budget
+            }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SessionManager()
+        return _manager
+
+
+def get_session(session_id):
+    return get_session_manager().get(session_id)
+
+
+def save_session(state):
+    get_session_manager().save(state)
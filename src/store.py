@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import threading
+
+from configs.settings import settings
+from src.filelock import FileLock, atomic_write, cached_file
+
+# ==========================================
+# 状态存储 (会话 / 配置)
+# ==========================================
+# 让 webui 进程本身无状态：会话记忆、音色与形象选择、tts/a2f 配置都存到这里，
+# 多个副本指向同一个存储即可服务任意会话。
+#   STATE_STORE=file:///assets/state         本地目录，每个 key 一个 JSON 文件 (默认)
+#   STATE_STORE=sqlite:///assets/state.db    SQLite 文件
+# 值都是可 JSON 序列化的字典。
+
+
+class StateStore:
+    def get(self, namespace, key, default=None):
+        raise NotImplementedError
+
+    def put(self, namespace, key, value):
+        raise NotImplementedError
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def purge(self, namespace, older_than):
+        """删除超过 older_than 秒未更新的条目"""
+        raise NotImplementedError
+
+
+class FileStateStore(StateStore):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, namespace, key):
+        safe_key = re.sub(r"[^\w.-]", "_", str(key))
+        return os.path.join(self.root, namespace, f"{safe_key}.json")
+
+    def get(self, namespace, key, default=None):
+        path = self._path(namespace, key)
+        if not os.path.exists(path):
+            return default
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return default
+
+    def put(self, namespace, key, value):
+        path = self._path(namespace, key)
+        with FileLock(path, timeout=10):
+            atomic_write(path, json.dumps(value, indent=4, ensure_ascii=False))
+
+    def delete(self, namespace, key):
+        path = self._path(namespace, key)
+        with FileLock(path, timeout=10):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def purge(self, namespace, older_than):
+        folder = os.path.join(self.root, namespace)
+        if not os.path.isdir(folder):
+            return
+        cutoff = time.time() - older_than
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            try:
+                if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class SQLiteStateStore(StateStore):
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "namespace TEXT, key TEXT, value TEXT, updated REAL, PRIMARY KEY (namespace, key))"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, namespace, key, default=None):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM state WHERE namespace=? AND key=?", (namespace, str(key))
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, namespace, key, value):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                (namespace, str(key), json.dumps(value, ensure_ascii=False), time.time())
+            )
+
+    def delete(self, namespace, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM state WHERE namespace=? AND key=?", (namespace, str(key)))
+
+    def purge(self, namespace, older_than):
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM state WHERE namespace=? AND updated<?", (namespace, time.time() - older_than)
+            )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def open_state_store(url):
+    if url.startswith("sqlite:///"):
+        return SQLiteStateStore(url[len("sqlite:///"):])
+    if url.startswith("file:///"):
+        return FileStateStore(url[len("file:///"):])
+    raise ValueError(f"未知的状态存储: {url}")
+
+
+def get_state_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = open_state_store(settings.STATE_STORE)
+        return _store
+
+
+def replica_dir(root):
+    """
+    本副本的产物目录 (例如 assets/<副本ID>)
+    多个副本共用一个工作目录时，输出文件互不覆盖
+    """
+    return os.path.join(root, settings.REPLICA_ID)
+
+
+def share_file(path, kind):
+    """
+    把上传到本副本临时目录的文件 (Gradio 上传的图片/参考音频) 复制到共享缓存，
+    按内容哈希命名，其它副本和 worker 都能访问；返回共享路径
+    """
+    if not path or not os.path.isfile(path):
+        return path
+    cache_root = os.path.abspath(os.path.join(settings.CACHE_DIR, kind))
+    if os.path.abspath(path).startswith(cache_root + os.sep):
+        return path
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    ext = os.path.splitext(path)[1].lower()
+    target = os.path.join(cache_root, digest.hexdigest()[:16] + ext)
+    return cached_file(target, lambda tmp: shutil.copy(path, tmp))
@@ -0,0 +1,157 @@
+import re
+
+# ==========================================
+# 流式文本规整 (LLM 增量文本 -> 显示文本 / 情绪 / 句子)
+# ==========================================
+# 逐字符扫一遍 LLM 的增量输出，同时完成：
+#   - 情绪标签：(开心)、[生气]、（笑）这类短括号内容映射成情绪事件，从显示文本和朗读文本中去掉；
+#     标签被拆在两段增量里 ("(开" + "心)") 也能识别，不会被读出来
+#   - 朗读文本规整：其它短括号内容 (动作、旁白、注释)、Markdown 符号 (* # `) 不读，合并连续空白；
+#     显示文本只去掉情绪标签，其余原样保留 ("价格是(约100元)，C# 很好" 照常显示)
+#   - 分句：遇到句末标点且够长就出一句；句子过长时在逗号等分句点提前切开，
+#     TTS 不用等一整段长句
+# 下游 (TTS / 形象 / 界面) 直接用产出的事件，不用再扫描文本。
+
+# 句末标点：遇到这些字符就认为一句话说完了
+SENTENCE_ENDINGS = "。！？!?；;…\n"
+# 分句点：句子太长时可以在这里切开
+CLAUSE_BREAKS = "，,、：:"
+OPEN_BRACKETS = "([{（【"
+CLOSE_BRACKETS = ")]}）】"
+# 去掉的 Markdown 符号
+DROP_CHARS = "*#`"
+# 括号内容超过这个长度就不是标签，按正文处理
+MAX_TAG_CHARS = 12
+
+EMOTION_MAP = {
+    "开心": "happy", "高兴": "happy", "笑": "happy", "哈哈": "happy",
+    "生气": "angry", "愤怒": "angry", "哼": "angry",
+    "难过": "sad", "伤心": "sad", "呜呜": "sad",
+    "惊讶": "surprise", "震惊": "surprise",
+    "普通": "default", "平静": "default"
+}
+# 所有关键词编译成一个正则 (长词优先)，一次匹配代替逐个查找
+_EMOTION_RE = re.compile("|".join(re.escape(k) for k in sorted(EMOTION_MAP, key=len, reverse=True)))
+
+
+def join_sentences(sentences):
+    """把朗读句子拼成一段 (英文句子之间补空格)"""
+    text = ""
+    for sentence in sentences:
+        if text and text[-1].isascii() and sentence[:1].isascii():
+            text += " "
+        text += sentence
+    return text
+
+
+def match_emotion(tag):
+    """标签内容 -> 情绪；没有认识的关键词返回 None"""
+    match = _EMOTION_RE.search(tag)
+    return EMOTION_MAP[match.group(0)] if match else None
+
+
+class TextNormalizer:
+    """
+    增量规整器：feed(delta) / flush() 返回事件列表
+      {"type": "text", "delta": ...}                 显示文本 (只去掉情绪标签)
+      {"type": "emotion", "emotion": ...}            遇到情绪标签
+      {"type": "sentence", "text": ..., "emotion": ...} 一句完整的朗读文本 (规整后，可以送去 TTS)
+    太短的句子 (例如 "嗯。") 会合并到下一句，避免 TTS/渲染碎片化。
+    """
+    def __init__(self, min_chars=8, max_chars=40):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.emotion = "default"
+        self._sentence = ""
+        self._tag = None          # 正在读的括号内容 (含左括号)，None 表示不在括号里
+        self._last = ""           # 朗读文本上一个字符，用来合并空白
+
+    def feed(self, delta):
+        events = []
+        display = []
+        for ch in delta:
+            if self._tag is not None:
+                self._read_tag(ch, display, events)
+            elif ch in OPEN_BRACKETS:
+                self._tag = ch
+            else:
+                self._emit_char(ch, display, events)
+        self._push(display, events)
+        return events
+
+    def flush(self):
+        """流结束 (或需要立刻出句) 时取出剩余文本；情绪状态保留"""
+        display, events = [], []
+        if self._tag is not None:
+            # 没闭合的括号不是标签，原样当正文
+            tag, self._tag = self._tag, None
+            for ch in tag:
+                self._emit_char(ch, display, events)
+        self._cut(display, events)
+        self._push(display, events)
+        return events
+
+    # === 内部 ===
+    def _read_tag(self, ch, display, events):
+        if ch in CLOSE_BRACKETS:
+            tag, self._tag = self._tag + ch, None
+            emotion = match_emotion(tag[1:-1])
+            if emotion:
+                self.emotion = emotion
+                self._push(display, events, {"type": "emotion", "emotion": emotion})
+            else:
+                # 其它短括号内容 (动作、旁白、注释) 照常显示，只是不读出来
+                display.append(tag)
+            return
+        self._tag += ch
+        if len(self._tag) > MAX_TAG_CHARS + 1:
+            # 太长，不是标签：连同左括号一起按正文输出
+            tag, self._tag = self._tag, None
+            for c in tag:
+                self._emit_char(c, display, events)
+
+    def _emit_char(self, ch, display, events):
+        display.append(ch)
+        if ch in DROP_CHARS:
+            return
+        if ch in " \t\r　":
+            if self._last in (" ", "\n", ""):
+                return
+            ch = " "
+        elif ch == "\n" and self._last == "\n":
+            return
+        self._last = ch
+        self._sentence += ch
+        length = len(self._sentence.strip())
+        if ch in SENTENCE_ENDINGS and length >= self.min_chars:
+            self._cut(display, events)
+        elif ch in CLAUSE_BREAKS and length >= self.max_chars:
+            self._cut(display, events)
+        elif length >= self.max_chars * 2:
+            # 一直没有标点：硬切，避免一段话憋到最后
+            self._cut(display, events)
+
+    def _cut(self, display, events):
+        text = self._sentence.strip()
+        self._sentence = ""
+        if text:
+            self._push(display, events, {"type": "sentence", "text": text, "emotion": self.emotion})
+
+    @staticmethod
+    def _push(display, events, event=None):
+        """事件按文本中的先后顺序排列：先把攒下的显示文本作为一个 text 事件放进去"""
+        if display:
+            events.append({"type": "text", "delta": "".join(display)})
+            display.clear()
+        if event is not None:
+            events.append(event)
+
+
+def normalize_text(text):
+    """整段文本一次规整：返回 (显示文本, 朗读文本, 情绪)"""
+    normalizer = TextNormalizer(min_chars=0)
+    events = normalizer.feed(text) + normalizer.flush()
+    display = "".join(e["delta"] for e in events if e["type"] == "text")
+    speech = join_sentences(e["text"] for e in events if e["type"] == "sentence")
+    emotion = next((e["emotion"] for e in events if e["type"] == "emotion"), "default")
+    return display.strip(), speech, emotion
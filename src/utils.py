@@ -1,7 +1,6 @@
 import os
 import json
 from dotenv import load_dotenv
-import re
 import importlib
 import sys
 import tempfile
@@ -13,35 +12,12 @@ ENV_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
 def parse_emotion(text):
     """
     从文本中提取情绪标签，例如 "(开心)你好" -> 提取出 "happy"
-    返回: (clean_text, emotion_key)
+    返回: (clean_text, emotion_key)，clean_text 是送去 TTS 的朗读文本
+    流式场景请直接用 src/text_stream.TextNormalizer (标签被拆开也能识别)
     """
-    # 定义情绪映射表 (你可以根据需要添加更多)
-    emotion_map = {
-        "开心": "happy", "高兴": "happy", "笑": "happy", "哈哈": "happy",
-        "生气": "angry", "愤怒": "angry", "哼": "angry",
-        "难过": "sad", "伤心": "sad", "呜呜": "sad",
-        "惊讶": "surprise", "震惊": "surprise",
-        "普通": "default", "平静": "default"
-    }
-    
-    # 1. 尝试用正则提取圆括号内容，如 (开心) 或 [生气]
-    match = re.search(r"[\(\[\{](.*?)[\)\]\}]", text)
-    emotion = "default"
-    
-    if match:
-        tag = match.group(1)
-        # 查找映射表
-        for key, value in emotion_map.items():
-            if key in tag:
-                emotion = value
-                break
-        
-        # 2. 从文本中移除标签，避免 TTS 把 "(开心)" 读出来
-        clean_text = re.sub(r"[\(\[\{].*?[\)\]\}]", "", text)
-    else:
-        clean_text = text
-    
-    return clean_text.strip(), emotion
+    from src.text_stream import normalize_text
+    _, speech, emotion = normalize_text(text)
+    return speech, emotion
 
 # ==========================================
 # 1. 环境配置模块
@@ -56,16 +32,18 @@ def load_settings():
         "api_key": os.getenv("LLM_API_KEY", ""),
         "base_url": os.getenv("LLM_BASE_URL", "https://api.deepseek.com"),
         "model": os.getenv("LLM_MODEL", "deepseek-chat"),
-        "persona": os.getenv("DIGITAL_HUMAN_PERSONA", "你是一个数字人助手。")
+        "persona": os.getenv("DIGITAL_HUMAN_PERSONA", "你是一个数字人助手。"),
+        "fast_model": os.getenv("LLM_FAST_MODEL", "")
     }
 
-def save_settings(provider, api_key, base_url, model, persona):
+def save_settings(provider, api_key, base_url, model, persona, fast_model=""):
     """保存环境配置"""
     os.environ["LLM_PROVIDER"] = provider
     os.environ["LLM_API_KEY"] = api_key
     os.environ["LLM_BASE_URL"] = base_url
     os.environ["LLM_MODEL"] = model
     os.environ["DIGITAL_HUMAN_PERSONA"] = persona
+    os.environ["LLM_FAST_MODEL"] = fast_model or ""
     
     lines = []
     if os.path.exists(ENV_PATH):
@@ -77,7 +55,8 @@ def save_settings(provider, api_key, base_url, model, persona):
         "LLM_API_KEY": api_key,
         "LLM_BASE_URL": base_url,
         "LLM_MODEL": model,
-        "DIGITAL_HUMAN_PERSONA": persona
+        "DIGITAL_HUMAN_PERSONA": persona,
+        "LLM_FAST_MODEL": fast_model or ""
     }
 
     updated_lines = []
@@ -106,7 +85,11 @@ def save_settings(provider, api_key, base_url, model, persona):
 TTS_CONFIG_FILE = "tts_config.json"
 
 def load_tts_settings():
-    """加载TTS配置"""
+    """加载TTS配置 (状态存储优先，旧版 tts_config.json 作为回退)"""
+    from src.store import get_state_store
+    config = get_state_store().get("config", "tts")
+    if config is not None:
+        return config
     if not os.path.exists(TTS_CONFIG_FILE):
         return {
             "model_path": None,
@@ -125,6 +108,7 @@ def save_tts_settings(engine_type, model_name, ref_audio, ref_text=""):
     保存 TTS 配置
     """
     try:
+        from src.store import get_state_store
         config = load_tts_settings()
         config["engine_type"] = engine_type
         config["model_path"] = model_name
@@ -137,8 +121,7 @@ def save_tts_settings(engine_type, model_name, ref_audio, ref_text=""):
 
         config["ref_text"] = ref_text
         
-        with open(TTS_CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        get_state_store().put("config", "tts", config)
             
         return "✅ 配置已保存"
     except Exception as e:
@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+
+from configs.settings import settings
+
+# ==========================================
+# 输入时预热
+# ==========================================
+# 用户还在打字时就把这一轮要用的东西准备好，第一条消息不再付冷启动成本：
+#   - LLM：发一个不耗 token 的请求，建立/保持 HTTPS 连接 (DNS、TLS 握手)
+#   - TTS：模型未加载时按保存的配置加载
+#   - 形象：MuseTalk 的图片转视频输入放进共享缓存
+#   - 分词器：加载本地分词器并给输入中的文本计数 (对话记忆的 token 预算要用)
+# 输入事件经过防抖：停止输入 TYPING_DEBOUNCE 秒后才预热一次 (会话形象也是这时才去读，按键本身不碰状态存储)；
+# 每类资源都有最短间隔，连续打字不会反复请求。
+
+
+class Warmer:
+    def __init__(self, debounce=None, llm_interval=None):
+        self.debounce = settings.TYPING_DEBOUNCE if debounce is None else debounce
+        self.llm_interval = settings.LLM_KEEPALIVE_INTERVAL if llm_interval is None else llm_interval
+        self._pending = {}        # session_id -> (到期时间, 输入内容)
+        self._last = {}           # 资源 -> 上次预热时间
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def touch(self, session_id, text=""):
+        """输入框内容变化时调用 (立刻返回，每次按键都会调，不能做 I/O)"""
+        if not settings.TYPING_WARMUP or not (text or "").strip():
+            return
+        with self._cond:
+            self._pending[session_id] = (time.monotonic() + self.debounce, text)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [sid for sid, item in self._pending.items() if item[0] <= now]
+                if not due:
+                    self._cond.wait(min(item[0] for item in self._pending.values()) - now)
+                    continue
+                items = [(sid, self._pending.pop(sid)[1]) for sid in due]
+            for session_id, text in items:
+                self._warm(session_id, text)
+
+    def _due(self, key, interval):
+        now = time.monotonic()
+        if now - self._last.get(key, -interval) < interval:
+            return False
+        self._last[key] = now
+        return True
+
+    def _warm(self, session_id, text):
+        # 1. LLM 连接
+        if self._due("llm", self.llm_interval):
+            try:
+                from src.brain.llm_engine import get_brain
+                get_brain().warmup()
+            except Exception as e:
+                print(f"⚠️ [Warmup] LLM 预热失败: {e}")
+
+        # 2. TTS 模型常驻
+        from src.audio.runtime import get_tts, load_tts_from_config
+        if get_tts() is None and self._due("tts", 60):
+            try:
+                load_tts_from_config()
+            except Exception as e:
+                print(f"⚠️ [Warmup] TTS 预加载失败: {e}")
+
+        # 3. 形象预处理结果 (目前只有 MuseTalk 的输入视频可以提前准备)
+        try:
+            from src.session import get_session
+            self._warm_avatar(get_session(session_id).avatar)
+        except Exception as e:
+            print(f"⚠️ [Warmup] 形象预热失败: {e}")
+
+        # 4. 分词器 (首次加载 tiktoken 词表较慢)
+        from src.brain.memory import pretokenize
+        pretokenize(text)
+
+    def _warm_avatar(self, avatar_config):
+        from src.avatar.config import load_a2f_config
+        from src.avatar.engine import get_engine
+        from src.quality import QUALITY_TIERS, get_quality_controller
+        from src.store import replica_dir
+
+        config = avatar_config or load_a2f_config()
+        img = config.get("img")
+        if config.get("engine") != "MuseTalk" or not img or not os.path.isfile(img):
+            return
+        resolution = 512
+        if settings.QUALITY_ADAPTIVE:
+            resolution = QUALITY_TIERS[get_quality_controller().level]["mt_resolution"]
+        if self._due(("avatar", img, resolution), 3600):
+            out_dir = os.path.join(replica_dir("assets"), "warmup")
+            get_engine("MuseTalk")._ensure_video_input(img, out_dir, resolution)
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def get_warmer():
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = Warmer()
+        return _warmer
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+@pytest.fixture
+def state_store(tmp_path, monkeypatch):
+    """状态存储指向临时目录，不碰 assets/state"""
+    from src import store
+    instance = store.FileStateStore(str(tmp_path / "state"))
+    monkeypatch.setattr(store, "_store", instance)
+    return instance
@@ -0,0 +1,39 @@
+import os
+import struct
+import wave
+
+from src.audio.writer import WavStreamWriter, open_writer
+
+
+def test_header_is_patched_on_close(tmp_path):
+    path = str(tmp_path / "out" / "a.wav")
+    writer = WavStreamWriter(path, 24000)
+    with open(path, "rb") as f:
+        header = f.read(44)
+    # 写入中：长度字段先填 0
+    assert struct.unpack("<I", header[40:44])[0] == 0
+
+    writer.write(b"\x01\x00" * 100)
+    writer.write(b"")
+    writer.write(b"\x02\x00" * 50)
+    writer.close()
+
+    assert writer.frames == 150
+    assert abs(writer.duration - 150 / 24000) < 1e-9
+    with wave.open(path, "rb") as f:
+        assert f.getframerate() == 24000
+        assert f.getnchannels() == 1
+        assert f.getsampwidth() == 2
+        assert f.getnframes() == 150
+    with open(path, "rb") as f:
+        data = f.read()
+    assert struct.unpack("<I", data[4:8])[0] == 36 + 300
+
+
+def test_abort_removes_partial_file(tmp_path):
+    path = str(tmp_path / "a.wav")
+    writer = open_writer(path, 22050)
+    assert isinstance(writer, WavStreamWriter)
+    writer.write(b"\x00\x00" * 10)
+    writer.abort()
+    assert not os.path.exists(path)
@@ -0,0 +1,64 @@
+import os
+import time
+
+import pytest
+
+from src.filelock import FileLock, LockTimeout, atomic_write, cached_file
+
+
+def test_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "data.json")
+    with FileLock(path):
+        assert os.path.exists(path + ".lock")
+        with pytest.raises(LockTimeout):
+            FileLock(path, timeout=0.1).acquire()
+    assert not os.path.exists(path + ".lock")
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    path = str(tmp_path / "data.json")
+    with open(path + ".lock", "w") as f:
+        f.write("dead:token\n")
+    old = time.time() - 60
+    os.utime(path + ".lock", (old, old))
+    with FileLock(path, timeout=1, stale=10):
+        with open(path + ".lock") as f:
+            assert f.read().strip() != "dead:token"
+
+
+def test_release_keeps_a_lock_taken_over_by_someone_else(tmp_path):
+    path = str(tmp_path / "data.json")
+    lock = FileLock(path).acquire()
+    # 另一个进程把它当成遗留锁接管了
+    os.remove(path + ".lock")
+    with open(path + ".lock", "w") as f:
+        f.write("other:token\n")
+    lock.release()
+    with open(path + ".lock") as f:
+        assert f.read().strip() == "other:token"
+
+
+def test_heartbeat_keeps_a_held_lock_fresh(tmp_path):
+    path = str(tmp_path / "data.json")
+    lock = FileLock(path, stale=2).acquire()
+    old = time.time() - 60
+    os.utime(path + ".lock", (old, old))
+    time.sleep(0.8)
+    assert time.time() - os.path.getmtime(path + ".lock") < 2
+    lock.release()
+
+
+def test_cached_file_builds_once(tmp_path):
+    path = str(tmp_path / "cache" / "a.txt")
+    calls = []
+
+    def build(tmp):
+        calls.append(tmp)
+        atomic_write(tmp, "built")
+        return True
+
+    assert cached_file(path, build) == path
+    assert cached_file(path, build) == path
+    assert len(calls) == 1
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "built"
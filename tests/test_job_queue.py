@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from configs.settings import settings
+from src.jobs import client
+from src.jobs.autoscale import desired_workers
+from src.jobs.queue import InProcessJobQueue, SQLiteJobQueue
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_SPOOL_DIR", str(tmp_path / "spool"))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def queue(request, tmp_path):
+    if request.param == "memory":
+        return InProcessJobQueue()
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_claim_by_priority_then_submission_order(queue):
+    low = queue.submit("tts", {"n": 1}, priority=1)
+    first = queue.submit("tts", {"n": 2}, priority=0)
+    time.sleep(0.01)
+    second = queue.submit("tts", {"n": 3}, priority=0)
+    queue.submit("avatar", {"n": 4}, priority=0)
+
+    claimed = [queue.claim("tts", "w1", timeout=0)["id"] for _ in range(3)]
+    assert claimed == [first, second, low]
+    assert queue.claim("tts", "w1", timeout=0) is None
+
+
+def test_depth_and_busy(queue):
+    queue.submit("tts", {})
+    queue.submit("tts", {})
+    assert (queue.depth("tts"), queue.busy("tts")) == (2, 0)
+    job = queue.claim("tts", "w1", timeout=0)
+    assert (queue.depth("tts"), queue.busy("tts")) == (1, 1)
+    queue.complete(job["id"], {"ok": True})
+    assert (queue.depth("tts"), queue.busy("tts")) == (1, 0)
+
+
+def test_complete_and_release(queue, tmp_path):
+    src = tmp_path / "in.txt"
+    src.write_text("hello", encoding="utf-8")
+    job_id = queue.submit("tts", {"text": "hi"}, files={"input": str(src)})
+    job = queue.claim("tts", "w1", timeout=0)
+    assert job["payload"] == {"text": "hi"}
+    assert queue.progress(job_id, 0.5, "half")
+    assert queue.complete(job_id, {"duration": 1.0})
+
+    done = queue.wait(job_id, timeout=1)
+    assert done["status"] == "done"
+    assert done["result"] == {"duration": 1.0}
+    path = queue.get_file(job_id, "input", dest=str(tmp_path / "out" / "in.txt"))
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "hello"
+
+    queue.release(job_id)
+    assert queue.get(job_id) is None
+
+
+def test_cancelled_job_rejects_results(queue):
+    job_id = queue.submit("tts", {})
+    queue.claim("tts", "w1", timeout=0)
+    queue.cancel(job_id)
+    assert not queue.progress(job_id, 0.5)
+    assert not queue.complete(job_id, {})
+
+
+def test_cancel_queued_job_is_never_claimed(queue):
+    job_id = queue.submit("tts", {})
+    queue.cancel(job_id)
+    assert queue.claim("tts", "w1", timeout=0) is None
+
+
+def test_sqlite_requeues_jobs_without_heartbeat(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), stale_seconds=0.05)
+    job_id = queue.submit("avatar", {})
+    assert queue.claim("avatar", "crashed", timeout=0)["id"] == job_id
+    time.sleep(0.1)
+    assert queue.busy("avatar") == 0
+    job = queue.claim("avatar", "w2", timeout=0)
+    assert job["id"] == job_id
+    assert queue.get(job_id)["worker"] == "w2"
+
+
+def test_purge_drops_old_finished_jobs(queue):
+    job_id = queue.submit("tts", {})
+    queue.claim("tts", "w1", timeout=0)
+    queue.fail(job_id, "boom")
+    queue.purge(older_than=60)
+    assert queue.get(job_id)["status"] == "failed"
+    time.sleep(0.01)
+    queue.purge(older_than=0)
+    assert queue.get(job_id) is None
+
+
+def test_desired_workers_keeps_busy_workers():
+    # 队列刚被领空：正在处理任务的 worker 不缩
+    assert desired_workers(depth=0, busy=3, per_worker=2, min_workers=0, max_workers=4) == 3
+    assert desired_workers(depth=5, busy=1, per_worker=2, min_workers=0, max_workers=8) == 4
+    assert desired_workers(depth=50, busy=2, per_worker=2, min_workers=0, max_workers=4) == 4
+    assert desired_workers(depth=0, busy=0, per_worker=2, min_workers=1, max_workers=4) == 1
+
+
+def test_dispatch_treats_a_vanished_job_as_failed(monkeypatch):
+    class VanishingQueue(InProcessJobQueue):
+        def submit(self, stage, payload, priority=0, files=None):
+            job_id = super().submit(stage, payload, priority, files)
+            self.release(job_id)
+            return job_id
+
+    monkeypatch.setattr(client, "get_job_queue", VanishingQueue)
+    monkeypatch.setattr(client, "_ensure_local_workers", lambda queue, stage: None)
+    assert client.dispatch_job("tts", {}) is None
@@ -0,0 +1,15 @@
+from src.prefetch import _same_question
+
+
+def test_identical_questions():
+    assert _same_question("你叫什么名字", "你叫什么名字")
+
+
+def test_questions_differing_only_by_particles():
+    assert _same_question("你叫什么名字", "你叫什么名字呀")
+    assert _same_question("能介绍一下自己吗", "能介绍一下自己吧")
+
+
+def test_questions_with_different_content():
+    assert not _same_question("明天会下雨吗", "明天不会下雨吗")
+    assert not _same_question("你喜欢猫吗", "你喜欢狗吗")
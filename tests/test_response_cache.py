@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.brain.cache import ResponseCache
+
+
+@pytest.fixture
+def cache(state_store):
+    return ResponseCache(max_entries=8, ttl=60)
+
+
+def _serve(cache, key, produce, hits, succeeded=lambda: True):
+    return "".join(cache.serve(key, produce, hits.append, succeeded))
+
+
+def test_concurrent_requests_share_one_upstream_call(cache):
+    release = threading.Event()
+    calls = []
+
+    def produce():
+        calls.append(1)
+        release.wait(5)
+        yield "你好。"
+        yield "很高兴见到你！"
+
+    hits = []
+    results = {}
+
+    def leader():
+        results["leader"] = _serve(cache, "k", produce, hits)
+
+    def follower():
+        results["follower"] = _serve(cache, "k", produce, hits)
+
+    t1 = threading.Thread(target=leader)
+    t1.start()
+    deadline = time.monotonic() + 2
+    while not calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    t2 = threading.Thread(target=follower)
+    t2.start()
+    time.sleep(0.05)
+    release.set()
+    t1.join(5)
+    t2.join(5)
+
+    assert len(calls) == 1
+    assert results == {"leader": "你好。很高兴见到你！", "follower": "你好。很高兴见到你！"}
+    # 只有跟随者是 “命中” (需要自己写记忆)
+    assert hits == ["你好。很高兴见到你！"]
+
+
+def test_cached_reply_is_replayed_sentence_by_sentence(cache):
+    cache.put("k", "第一句。第二句！")
+    pieces = list(cache.serve("k", lambda: iter(()), lambda reply: None, lambda: True))
+    assert pieces == ["第一句。", "第二句！"]
+
+
+def test_failed_reply_is_not_cached(cache):
+    hits = []
+    assert _serve(cache, "k", lambda: iter(["大脑短路"]), hits, succeeded=lambda: False) == "大脑短路"
+    assert cache.get("k") is None
+    assert _serve(cache, "k", lambda: iter(["好的。"]), hits) == "好的。"
+    assert cache.get("k") == "好的。"
+    assert hits == []
+
+
+def test_follower_retries_when_leader_fails(cache):
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append("leader")
+        started.set()
+        release.wait(5)
+        yield "出错了"
+
+    def fresh():
+        calls.append("follower")
+        yield "重新回答。"
+
+    results = {}
+    t1 = threading.Thread(target=lambda: results.setdefault(
+        "leader", _serve(cache, "k", failing, [], succeeded=lambda: False)))
+    t1.start()
+    started.wait(2)
+    t2 = threading.Thread(target=lambda: results.setdefault("follower", _serve(cache, "k", fresh, [])))
+    t2.start()
+    time.sleep(0.05)
+    release.set()
+    t1.join(5)
+    t2.join(5)
+
+    assert calls == ["leader", "follower"]
+    assert results["follower"] == "重新回答。"
+
+
+def test_async_requests_join_the_same_flight(cache):
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        yield "异步回答。"
+
+    async def ask():
+        hits = []
+        text = "".join([delta async for delta in cache.aserve("k", produce, hits.append, lambda: True)])
+        return text, hits
+
+    async def main():
+        return await asyncio.gather(ask(), ask(), ask())
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [text for text, _ in results] == ["异步回答。"] * 3
+    assert sum(len(hits) for _, hits in results) == 2
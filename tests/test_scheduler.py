@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from src.cancel import CancelToken, TurnCancelled
+from src.scheduler import BATCH, INTERACTIVE, ServerBusyError, StageLimiter
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _waiter(limiter, priority, order, name):
+    def run():
+        with limiter.slot(priority, timeout=5):
+            order.append(name)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_interactive_jumps_ahead_of_batch():
+    limiter = StageLimiter("test", concurrency=1, max_queue=8)
+    order = []
+    limiter.acquire()
+    threads = [_waiter(limiter, BATCH, order, "batch")]
+    _wait_until(lambda: limiter.stats()["waiting"] == 1)
+    threads.append(_waiter(limiter, INTERACTIVE, order, "interactive"))
+    _wait_until(lambda: limiter.stats()["waiting"] == 2)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "batch"]
+
+
+def test_same_priority_is_first_come_first_served():
+    limiter = StageLimiter("test", concurrency=1, max_queue=8)
+    order = []
+    limiter.acquire()
+    threads = []
+    for i in range(3):
+        threads.append(_waiter(limiter, INTERACTIVE, order, i))
+        _wait_until(lambda: limiter.stats()["waiting"] == i + 1)
+
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1, 2]
+
+
+def test_batch_jobs_only_fill_half_the_queue():
+    limiter = StageLimiter("test", concurrency=1, max_queue=4)
+    order = []
+    limiter.acquire()
+    threads = [_waiter(limiter, BATCH, order, i) for i in range(2)]
+    _wait_until(lambda: limiter.stats()["waiting"] == 2)
+
+    with pytest.raises(ServerBusyError):
+        limiter.acquire(BATCH, timeout=5)
+    # 交互请求还有位置
+    threads.append(_waiter(limiter, INTERACTIVE, order, "interactive"))
+    _wait_until(lambda: limiter.stats()["waiting"] == 3)
+    assert limiter.stats()["rejected"] == 1
+
+    limiter.release()
+    for thread in threads:
+        thread.join(5)
+    assert order[0] == "interactive"
+    assert limiter.stats()["running"] == 0
+
+
+def test_full_queue_rejects_interactive():
+    limiter = StageLimiter("test", concurrency=1, max_queue=0)
+    limiter.acquire()
+    with pytest.raises(ServerBusyError):
+        limiter.acquire(INTERACTIVE)
+    limiter.release()
+
+
+def test_wait_timeout_leaves_the_queue():
+    limiter = StageLimiter("test", concurrency=1, max_queue=4)
+    limiter.acquire()
+    with pytest.raises(ServerBusyError):
+        limiter.acquire(timeout=0.05)
+    assert limiter.stats()["waiting"] == 0
+    limiter.release()
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = StageLimiter("test", concurrency=1, max_queue=4)
+    token = CancelToken()
+    limiter.acquire()
+    errors = []
+
+    def run():
+        try:
+            limiter.acquire(timeout=5, cancel_token=token)
+        except TurnCancelled as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    _wait_until(lambda: limiter.stats()["waiting"] == 1)
+    token.cancel("test")
+    thread.join(5)
+    assert len(errors) == 1
+    assert limiter.stats()["waiting"] == 0
+    limiter.release()
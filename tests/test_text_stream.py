@@ -0,0 +1,62 @@
+from src.text_stream import TextNormalizer, normalize_text
+
+
+def _run(deltas, **kwargs):
+    normalizer = TextNormalizer(**kwargs)
+    events = []
+    for delta in deltas:
+        events += normalizer.feed(delta)
+    return events + normalizer.flush()
+
+
+def _display(events):
+    return "".join(e["delta"] for e in events if e["type"] == "text")
+
+
+def _sentences(events):
+    return [e["text"] for e in events if e["type"] == "sentence"]
+
+
+def test_emotion_tag_split_across_deltas():
+    events = _run(["(开", "心)今天天气真不错。"], min_chars=0)
+    assert {"type": "emotion", "emotion": "happy"} in events
+    assert _display(events) == "今天天气真不错。"
+    assert _sentences(events) == ["今天天气真不错。"]
+    assert events[-1]["emotion"] == "happy"
+
+
+def test_emotion_event_precedes_following_text():
+    events = _run(["好的。", "【生气】", "不行！"], min_chars=0)
+    kinds = [e["type"] for e in events]
+    assert kinds.index("emotion") < max(i for i, e in enumerate(events) if e.get("delta") == "不行！")
+    assert [e["emotion"] for e in events if e["type"] == "sentence"] == ["default", "angry"]
+
+
+def test_other_brackets_are_displayed_but_not_spoken():
+    events = _run(["价格是(约100元)，", "C# 很好。"], min_chars=0)
+    assert _display(events) == "价格是(约100元)，C# 很好。"
+    assert _sentences(events) == ["价格是，C 很好。"]
+
+
+def test_long_bracket_is_plain_text():
+    text = "(" + "这是一段很长很长的括号里的正文内容" + ")。"
+    events = _run([text], min_chars=0)
+    assert _display(events) == text
+    assert _sentences(events) == [text]
+
+
+def test_unclosed_bracket_is_flushed_as_text():
+    events = _run(["你好(开"], min_chars=0)
+    assert _display(events) == "你好(开"
+
+
+def test_short_sentences_merge_and_long_ones_split():
+    events = _run(["嗯。", "我明白你的意思了。"], min_chars=8)
+    assert _sentences(events) == ["嗯。我明白你的意思了。"]
+
+    long_clause = "一" * 12 + "，" + "二" * 3 + "。"
+    assert _sentences(_run([long_clause], min_chars=0, max_chars=10)) == ["一" * 12 + "，", "二" * 3 + "。"]
+
+
+def test_normalize_text():
+    assert normalize_text("(难过)我有点 **累** 了。") == ("我有点 **累** 了。", "我有点 累 了。", "sad")
@@ -6,50 +6,17 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from configs.ui import build_config_ui
-from src.audio.ui import build_audio_ui, get_tts
-from src.brain.ui import build_brain_ui, user_input_handler, brain_think_handler
-from src.avatar.ui import build_avatar_ui, get_current_avatar, load_a2f_config
-from src.avatar.engine import get_engine
-
-# === 桥接函数 ===
-def tts_bridge(text, ref_audio, ref_text):
-    if not text or not ref_audio: return None
-    tts = get_tts() 
-    if not tts: return None
-    output_path = os.path.join("assets", "reply.wav")
-    return tts.speak(text, ref_audio, ref_text, output_file=output_path)
-
-def video_bridge(audio_path):
-    # 1. 直接从 JSON 文件读取最新的配置
-    config = load_a2f_config()
-    
-    engine_name = config.get("engine", "SadTalker")
-    img_path = config.get("img")
-
-    if not img_path:
-        raise ValueError("请先在'形象激活'面板上传图片并点击'激活配置'")
-
-    # 2. 传入引擎名称，修复 TypeError
-    engine = get_engine(engine_name)
-    
-    # 3. 根据不同引擎传入对应参数
-    if engine_name == "SadTalker":
-        video_path = engine.generate(
-            img=img_path, 
-            audio=audio_path, 
-            out_dir="results",
-            use_still=config.get("still", False),
-            use_enhancer=config.get("enhancer", True)
-        )
-    elif engine_name == "MuseTalk":
-        video_path = engine.generate(
-            img=img_path, 
-            audio=audio_path, 
-            out_dir="results",
-            bbox_shift=config.get("bbox", 0)
-        )
-    
-    return video_path
+from src.audio.ui import build_audio_ui
+from src.brain.ui import build_brain_ui, user_input_handler
+from src.avatar.ui import build_avatar_ui
+from src.pipeline import run_turn
+from src.cancel import TurnCancelled, begin_turn, cancel_turn, end_turn
+from src.session import get_session, get_session_manager, save_session
+from src.store import share_file
+from src.prefetch import get_prefetcher
+from src.warmup import get_warmer
+from src.brain.llm_engine import get_brain
+from configs.settings import settings
 
 def create_ui():
     with gr.Blocks(title="guanhelujue", theme=gr.themes.Soft()) as demo:
@@ -77,57 +44,125 @@ def create_ui():
                             autoplay=True,
                             height=500
                         )
+                        # 语音先行：音频一合成好就播放，视频赶得上再补上
+                        reply_audio = gr.Audio(
+                            label="语音回复",
+                            streaming=True,
+                            autoplay=True,
+                            interactive=False
+                        )
+                        stream_mode = gr.Checkbox(
+                            value=settings.STREAM_PIPELINE,
+                            label="分句流式 (边想边说边演)"
+                        )
                     
                     # 右侧：对话框
                     with gr.Column(scale=2):
                         chatbot, msg_input, submit_btn, clear_btn = build_brain_ui()
 
         # === 核心处理链 ===
-        def processing_chain(history, ref_audio, ref_text):
-            # 1. 思考 (流式出字)
-            generator = brain_think_handler(history)
-            final_text = ""
-            for update_history, current_text in generator:
-                final_text = current_text
-                # 此时视频框不动
-                yield update_history, None 
-            
-            # 2. 说话 (生成音频)
-            audio_path = None
-            if ref_audio and final_text:
-                audio_path = tts_bridge(final_text, ref_audio, ref_text)
-            
-            # 3. 演戏 (生成视频)
-            if audio_path:
-                video_path = video_bridge(audio_path)
-                if video_path:
-                    # 播放视频
-                    yield update_history, video_path
-                else:
-                    print("❌ 视频生成失败")
-                    yield update_history, None
+        def processing_chain(history, ref_audio, ref_text, stream_mode, request: gr.Request):
+            """
+            把 src/pipeline.run_turn 的事件映射到界面：
+            文本 -> 对话框，语音 -> 语音框 (先行)，视频 -> 视频框 (赶得上截止时间才有)
+            """
+            if not history or history[-1]["role"] != "user":
+                return
+            user_text = history[-1]["content"]
+            history.append({"role": "assistant", "content": ""})
+
+            # 每一轮持有一个取消令牌；同一会话开始新一轮会取消旧的
+            session_id = request.session_hash if request else "default"
+            session = get_session(session_id)
+            # 参考音频复制到共享缓存，其它副本 / TTS worker 也能读到
+            ref_audio = share_file(ref_audio, "voices")
+            session.voice = {"ref_audio": ref_audio, "ref_text": ref_text}
+            cancel_token = begin_turn(session_id)
+            try:
+                for event in run_turn(session, user_text, cancel_token, ref_audio, ref_text, stream=stream_mode):
+                    kind = event["type"]
+                    if kind == "text":
+                        history[-1]["content"] = event["text"]
+                        # 视频框保持正在播放的片段，不要清空
+                        yield history, gr.update(), None
+                    elif kind in ("busy", "error"):
+                        history[-1]["content"] = event["message"]
+                        yield history, gr.update(), None
+                    elif kind == "filler":
+                        # 垫场短片立刻播放，后面的回复片段接着排队播放
+                        yield history, event["video"] or gr.update(), event["audio"]
+                    elif kind == "audio":
+                        yield history, gr.update(), event["path"]
+                    elif kind == "video":
+                        yield history, event["path"], None
+            except TurnCancelled:
+                print(f"🛑 [Cancel] 本轮已取消: {cancel_token.reason}")
+            finally:
+                # 生成器被关闭 (客户端断开) 时也要停掉后台的 TTS/渲染
+                cancel_token.cancel("turn closed")
+                end_turn(session_id, cancel_token)
+
+        # === 取消入口 ===
+        def on_user_input(user_message, history, request: gr.Request):
+            # 新消息到来：立刻停掉该会话上一轮还在跑的 TTS/渲染
+            if user_message and request:
+                cancel_turn(request.session_hash, "new input")
+            return user_input_handler(user_message, history)
+
+        def on_clear(request: gr.Request):
+            # 清空记忆：停掉当前轮次，并丢弃该会话的对话历史
+            if request:
+                cancel_turn(request.session_hash, "clear")
+                session = get_session(request.session_hash)
+                session.reset_conversation()
+                save_session(session)
+                get_prefetcher().invalidate(request.session_hash)
+            return []
+
+        def on_typing(text, request: gr.Request):
+            # 用户还在输入：预热 LLM 连接、TTS 模型和形象 (后台防抖执行，立刻返回)
+            session_id = request.session_hash if request else "default"
+            get_warmer().touch(session_id, text)
+
+        def on_unload(request: gr.Request):
+            # 页面关闭：停掉正在跑的任务并释放会话
+            if request:
+                get_session_manager().drop(request.session_hash)
 
         # === 绑定 ===
-        inputs_list = [chatbot, ref_audio, ref_text]
-        outputs_list = [chatbot, video_display]
+        inputs_list = [chatbot, ref_audio, ref_text, stream_mode]
+        outputs_list = [chatbot, video_display, reply_audio]
 
-        submit_btn.click(
-            user_input_handler, [msg_input, chatbot], [msg_input, chatbot]
+        click_event = submit_btn.click(
+            on_user_input, [msg_input, chatbot], [msg_input, chatbot]
         ).then(
             processing_chain, inputs_list, outputs_list
         )
 
-        msg_input.submit(
-            user_input_handler, [msg_input, chatbot], [msg_input, chatbot]
+        submit_event = msg_input.submit(
+            on_user_input, [msg_input, chatbot], [msg_input, chatbot]
         ).then(
             processing_chain, inputs_list, outputs_list
         )
         
-        clear_btn.click(lambda: [], None, chatbot)
+        msg_input.change(
+            on_typing, [msg_input], None,
+            queue=False, show_progress="hidden", trigger_mode="always_last"
+        )
+        
+        clear_btn.click(on_clear, None, chatbot, cancels=[click_event, submit_event])
+        demo.unload(on_unload)
 
     return demo
 
 if __name__ == "__main__":
     ui = create_ui()
-    ui.queue()
+    # 提前创建大脑：后台预热 LLM 连接 (DNS / TLS)
+    try:
+        if settings.LLM_PREWARM:
+            get_brain().prewarm()
+    except Exception as e:
+        print(f"⚠️ 大脑初始化失败 (请在系统配置页填写 API Key): {e}")
+    # 默认并发为 1 会让所有用户串行；这里放开，由 src/scheduler.py 按阶段限流
+    ui.queue(default_concurrency_limit=settings.UI_CONCURRENCY, max_size=settings.UI_QUEUE_SIZE)
     ui.launch(inbrowser=True, server_name="127.0.0.1", server_port=7860)
\ No newline at end of file